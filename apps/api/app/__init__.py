@@ -1,5 +1,13 @@
 """Application package for the Gemelli IT FastAPI service."""
 
-from .main import app, handler
-
 __all__ = ["app", "handler"]
+
+
+def __getattr__(name):
+    # Import the FastAPI app lazily so lightweight modules (e.g. app.audit,
+    # used by verification workers and CLI tools) don't pull in the web stack.
+    if name in __all__:
+        from . import main
+
+        return getattr(main, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,463 @@
+"""Reglas de hashing y secuenciación de la cadena de auditoría."""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+GENESIS_HASH = "0" * 64
+
+ChainHead = Tuple[str, int]
+
+
+class AuditChainContentionError(Exception):
+    """Otro escritor avanzó la cadena repetidamente y no se pudo encadenar el lote."""
+
+
+class AuditPayloadError(ValueError):
+    """El evento no cabe en las columnas de la cadena; las rutas lo traducen a 422."""
+
+
+# Largo de `audit_chain.action` (VARCHAR(50))
+ACTION_MAX_LENGTH = 50
+
+
+def build_payload(
+    action: str,
+    entity_id: Optional[str],
+    user_id: Optional[str],
+    timestamp: str,
+    data: Optional[dict] = None,
+) -> Dict[str, Any]:
+    return {
+        "action": action,
+        "entity_id": entity_id,
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "data": data or {},
+    }
+
+
+def validate_payload(payload: Dict[str, Any]) -> None:
+    """
+    Rechaza antes del spool lo que `append_audit_blocks` no podría insertar
+    (`entity_id`/`user_id` UUID, `action` VARCHAR(50)): un evento así quedaría
+    al frente del spool y la base lo rechazaría en cada reintento.
+    """
+    action = payload.get("action")
+    if not action or len(action) > ACTION_MAX_LENGTH:
+        raise AuditPayloadError(f"action debe tener entre 1 y {ACTION_MAX_LENGTH} caracteres")
+    for field, required in (("entity_id", True), ("user_id", False)):
+        value = payload.get(field)
+        if value is None and not required:
+            continue
+        try:
+            uuid.UUID(str(value))
+        except ValueError as exc:
+            raise AuditPayloadError(f"{field} debe ser un UUID") from exc
+
+
+# Codificador reutilizable: `json.dumps(..., sort_keys=True)` crea uno nuevo en cada llamada
+_CANONICAL_ENCODER = json.JSONEncoder(sort_keys=True)
+_encode_string = json.encoder.encode_basestring_ascii
+_PAYLOAD_KEYS = frozenset(("action", "data", "entity_id", "timestamp", "user_id"))
+
+if json.encoder.c_make_encoder is not None:
+    # El codificador en C que `JSONEncoder.encode` reconstruye en cada llamada,
+    # creado una sola vez con las mismas opciones (sin control de ciclos)
+    _c_encode = json.encoder.c_make_encoder(
+        None, _CANONICAL_ENCODER.default, _encode_string, None, ": ", ", ", True, False, True
+    )
+
+    def _encode_json(value: Any) -> str:
+        return "".join(_c_encode(value, 0))
+else:  # pragma: no cover - intérpretes sin el acelerador de json
+    _encode_json = _CANONICAL_ENCODER.encode
+
+
+def _encode_field(value: Any) -> Optional[str]:
+    if value.__class__ is str:
+        return _encode_string(value)
+    if value is None:
+        return "null"
+    return None
+
+
+def encode_payload_fields(
+    action: Any,
+    entity_id: Any,
+    user_id: Any,
+    timestamp: Any,
+    data: Any,
+) -> bytes:
+    """
+    Payload canónico a partir de sus campos, sin construir el diccionario.
+    Produce los mismos bytes que `json.dumps(payload, sort_keys=True)`: las
+    claves van en orden alfabético y solo `data` pasa por el codificador JSON.
+    """
+    fields = (
+        _encode_field(action),
+        _encode_field(entity_id),
+        _encode_field(timestamp),
+        _encode_field(user_id),
+    )
+    if None in fields:
+        # Tipos inesperados (números, listas...): se delega al codificador general
+        return _CANONICAL_ENCODER.encode({
+            "action": action,
+            "entity_id": entity_id,
+            "user_id": user_id,
+            "timestamp": timestamp,
+            "data": data,
+        }).encode()
+    action_json, entity_json, timestamp_json, user_json = fields
+    data_json = "{}" if data == {} else _encode_json(data)
+    return (
+        f'{{"action": {action_json}, "data": {data_json}, "entity_id": {entity_json}, '
+        f'"timestamp": {timestamp_json}, "user_id": {user_json}}}'
+    ).encode()
+
+
+def canonical_payload(payload: Dict[str, Any]) -> bytes:
+    """Bytes exactos sobre los que se calcula el hash de contenido."""
+    if payload.keys() == _PAYLOAD_KEYS:
+        return encode_payload_fields(
+            payload["action"],
+            payload["entity_id"],
+            payload["user_id"],
+            payload["timestamp"],
+            payload["data"],
+        )
+    return _CANONICAL_ENCODER.encode(payload).encode()
+
+
+def compute_content_hash(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(canonical_payload(payload)).hexdigest()
+
+
+def compute_chain_hash(previous_hash: str, content_hash: str) -> str:
+    return hashlib.sha256(f"{previous_hash}:{content_hash}".encode()).hexdigest()
+
+
+def sign_chain_hash(secret: str, chain_hash: str) -> str:
+    return hmac.digest(secret.encode(), chain_hash.encode(), "sha256").hex()
+
+
+def seal_block(payload: Dict[str, Any], previous_hash: str, secret: str) -> Dict[str, Any]:
+    """Calcula hash de contenido, hash encadenado y firma HMAC de un payload."""
+    content_hash = compute_content_hash(payload)
+    chain_hash = compute_chain_hash(previous_hash, content_hash)
+    return {
+        "hash": chain_hash,
+        "content_hash": content_hash,
+        "previous_hash": previous_hash,
+        "signature": sign_chain_hash(secret, chain_hash),
+        "payload": payload,
+    }
+
+
+def sign_checkpoint(secret: str, block_number: int, chain_hash: str) -> str:
+    """Firma de un checkpoint de verificación (bloque ya comprobado como válido)."""
+    return sign_chain_hash(secret, f"checkpoint:{block_number}:{chain_hash}")
+
+
+def sign_merkle_root(secret: str, tree_size: int, root_hash: str) -> str:
+    """Firma de la raíz del árbol de Merkle que cubre los primeros `tree_size` bloques."""
+    return sign_chain_hash(secret, f"merkle:{tree_size}:{root_hash}")
+
+
+def record_payload(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Reconstruye el payload hasheado a partir de una fila de `audit_chain`."""
+    return build_payload(
+        record["action"],
+        record["entity_id"],
+        record["user_id"],
+        record["timestamp"],
+        record.get("metadata", {}),
+    )
+
+
+CompactBlock = Tuple[Any, ...]
+
+COMPACT_FIELDS = (
+    "block_number",
+    "hash",
+    "signature",
+    "action",
+    "entity_id",
+    "user_id",
+    "timestamp",
+    "metadata",
+)
+
+
+def compact_block(record: Dict[str, Any]) -> CompactBlock:
+    """Tupla con solo los campos necesarios para verificar (más barata de serializar)."""
+    return tuple(record.get(field) for field in COMPACT_FIELDS)
+
+
+def verify_block_batch(
+    secret: str,
+    previous_hash: str,
+    blocks: Sequence[CompactBlock],
+) -> List[Dict[str, Any]]:
+    """Verifica un tramo contiguo de bloques y retorna los corruptos.
+
+    El hash esperado de cada bloque depende solo del hash *almacenado* del
+    bloque anterior, así que los tramos se pueden verificar de forma
+    independiente (por ejemplo en otro proceso) conociendo el hash del bloque
+    que precede al tramo.
+    """
+    corrupted = []
+    key = secret.encode()
+    sha256 = hashlib.sha256
+    digest = hmac.digest
+    for block_number, stored_hash, signature, action, entity_id, user_id, timestamp, metadata in blocks:
+        canonical = encode_payload_fields(action, entity_id, user_id, timestamp, metadata or {})
+        content_hash = sha256(canonical).hexdigest()
+        expected_hash = sha256(f"{previous_hash}:{content_hash}".encode()).hexdigest()
+
+        if stored_hash != expected_hash or signature != digest(key, expected_hash.encode(), "sha256").hex():
+            corrupted.append({
+                "block_number": block_number,
+                "hash": stored_hash,
+                "expected_hash": expected_hash,
+            })
+
+        previous_hash = stored_hash
+    return corrupted
+
+
+class ChainVerifier:
+    """Recorre bloques en orden y acumula los que no cumplen las reglas de hash."""
+
+    def __init__(
+        self,
+        secret: str,
+        previous_hash: str = GENESIS_HASH,
+        max_reported: Optional[int] = None,
+    ) -> None:
+        self._secret = secret
+        self._max_reported = max_reported
+        self.previous_hash = previous_hash
+        self.corrupted: List[Dict[str, Any]] = []
+        self.corrupted_count = 0
+        self.verified = 0
+        self.last_block_number: Optional[int] = None
+
+    def _record_corrupted(self, corrupted: List[Dict[str, Any]]) -> None:
+        self.corrupted_count += len(corrupted)
+        if self._max_reported is None:
+            self.corrupted.extend(corrupted)
+        else:
+            room = max(self._max_reported - len(self.corrupted), 0)
+            self.corrupted.extend(corrupted[:room])
+
+    def _advance(self, records: Sequence[Dict[str, Any]]) -> None:
+        self.previous_hash = records[-1]["hash"]
+        self.last_block_number = records[-1]["block_number"]
+        self.verified += len(records)
+
+    def feed(self, records: Sequence[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        blocks = [compact_block(record) for record in records]
+        self._record_corrupted(verify_block_batch(self._secret, self.previous_hash, blocks))
+        self._advance(records)
+
+    @property
+    def valid(self) -> bool:
+        return self.corrupted_count == 0
+
+
+class ParallelChainVerifier(ChainVerifier):
+    """Reparte el hashing de cada página entre procesos.
+
+    Cada tramo viaja al worker junto con el hash almacenado del bloque previo;
+    al volver, los resultados se concatenan en orden, lo que equivale a la
+    pasada secuencial de enlace entre tramos.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        executor: Executor,
+        previous_hash: str = GENESIS_HASH,
+        max_reported: Optional[int] = None,
+        chunk_size: int = 5000,
+    ) -> None:
+        super().__init__(secret, previous_hash, max_reported)
+        self._executor = executor
+        self._chunk_size = chunk_size
+
+    def feed(self, records: Sequence[Dict[str, Any]]) -> None:
+        if not records:
+            return
+
+        blocks = [compact_block(record) for record in records]
+        chunks = []
+        previous_hash = self.previous_hash
+        for start in range(0, len(blocks), self._chunk_size):
+            chunk = blocks[start:start + self._chunk_size]
+            chunks.append((previous_hash, chunk))
+            previous_hash = chunk[-1][1]
+
+        results = self._executor.map(
+            verify_block_batch,
+            [self._secret] * len(chunks),
+            [chunk_previous for chunk_previous, _ in chunks],
+            [chunk for _, chunk in chunks],
+        )
+        for corrupted in results:
+            self._record_corrupted(corrupted)
+        self._advance(records)
+
+
+def block_row(sealed: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de `audit_chain` (sin block_number, que asigna la base de datos)."""
+    payload = sealed["payload"]
+    return {
+        "hash": sealed["hash"],
+        "content_hash": sealed["content_hash"],
+        "previous_hash": sealed["previous_hash"],
+        "signature": sealed["signature"],
+        "action": payload["action"],
+        "entity_id": payload["entity_id"],
+        "user_id": payload["user_id"],
+        "timestamp": payload["timestamp"],
+        "metadata": payload["data"],
+    }
+
+
+class AuditChainSequencer:
+    """Mantiene en caché la cabeza de la cadena (último hash y número de bloque).
+
+    Cada lote se encadena sobre la cabeza cacheada y se envía en una sola
+    llamada `append_blocks(expected_previous_hash, rows)`. Del lado de la base
+    de datos esa llamada bloquea la fila de cabeza, rechaza el lote si la cabeza
+    ya no coincide (otro proceso escribió antes) y asigna los números de bloque.
+    Ante un rechazo se adopta la cabeza devuelta y se vuelve a encadenar, de modo
+    que la cadena nunca se bifurca aunque haya varios workers escribiendo.
+    """
+
+    def __init__(
+        self,
+        load_head: Callable[[], Awaitable[ChainHead]],
+        append_blocks: Callable[[str, List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+        secret: str,
+        max_retries: int = 5,
+    ) -> None:
+        self._load_head = load_head
+        self._append_blocks = append_blocks
+        self._secret = secret
+        self._max_retries = max_retries
+        self._head: Optional[ChainHead] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def head(self) -> Optional[ChainHead]:
+        return self._head
+
+    def reset(self) -> None:
+        self._head = None
+
+    async def append(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Encadena y persiste los payloads en orden; retorna los bloques sellados."""
+        if not payloads:
+            return []
+
+        async with self._lock:
+            for _ in range(self._max_retries):
+                if self._head is None:
+                    self._head = await self._load_head()
+
+                previous_hash, _ = self._head
+                sealed_blocks = []
+                for payload in payloads:
+                    sealed = seal_block(payload, previous_hash, self._secret)
+                    sealed_blocks.append(sealed)
+                    previous_hash = sealed["hash"]
+
+                result = await self._append_blocks(
+                    self._head[0],
+                    [block_row(sealed) for sealed in sealed_blocks],
+                )
+                self._head = (result["hash"], int(result["block_number"]))
+
+                if result.get("appended"):
+                    first_block = self._head[1] - len(sealed_blocks) + 1
+                    for offset, sealed in enumerate(sealed_blocks):
+                        sealed["block_number"] = first_block + offset
+                    return sealed_blocks
+
+        raise AuditChainContentionError(
+            "La cabeza de la cadena de auditoría cambió durante todos los reintentos"
+        )
+
+
+class EntityChainSequencer:
+    """Una sub-cadena (y un `AuditChainSequencer`) por entidad.
+
+    Los eventos de entidades distintas no comparten cabeza ni candado, así que
+    se encadenan en paralelo; dentro de una entidad el orden se conserva. Solo
+    se mantienen en memoria las cabezas de las `max_entities` entidades más
+    recientes: desalojar una solo obliga a releer su cabeza.
+    """
+
+    def __init__(
+        self,
+        load_head: Callable[[str], Awaitable[ChainHead]],
+        append_blocks: Callable[[str, str, List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+        secret: str,
+        max_retries: int = 5,
+        max_entities: int = 4096,
+    ) -> None:
+        self._load_head = load_head
+        self._append_blocks = append_blocks
+        self._secret = secret
+        self._max_retries = max_retries
+        self._max_entities = max_entities
+        self._sequencers: "OrderedDict[str, AuditChainSequencer]" = OrderedDict()
+
+    def sequencer(self, entity_id: str) -> AuditChainSequencer:
+        sequencer = self._sequencers.get(entity_id)
+        if sequencer is None:
+            sequencer = AuditChainSequencer(
+                load_head=functools.partial(self._load_head, entity_id),
+                append_blocks=functools.partial(self._append_blocks, entity_id),
+                secret=self._secret,
+                max_retries=self._max_retries,
+            )
+            self._sequencers[entity_id] = sequencer
+            while len(self._sequencers) > self._max_entities:
+                self._sequencers.popitem(last=False)
+        else:
+            self._sequencers.move_to_end(entity_id)
+        return sequencer
+
+    def reset(self) -> None:
+        self._sequencers.clear()
+
+    async def append(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Agrupa los payloads por entidad y encadena cada grupo en su sub-cadena."""
+        groups: Dict[str, List[int]] = {}
+        for index, payload in enumerate(payloads):
+            groups.setdefault(payload["entity_id"], []).append(index)
+
+        results = await asyncio.gather(*(
+            self.sequencer(entity_id).append([payloads[index] for index in indexes])
+            for entity_id, indexes in groups.items()
+        ))
+
+        sealed: List[Dict[str, Any]] = [{} for _ in payloads]
+        for indexes, blocks in zip(groups.values(), results):
+            for index, block in zip(indexes, blocks):
+                sealed[index] = block
+        return sealed
@@ -0,0 +1,280 @@
+"""Exportación binaria compacta de `audit_chain` y verificador fuera de línea.
+
+Una exportación son dos archivos con el mismo prefijo:
+
+- `<prefijo>.idx`: cabecera de 16 bytes y luego un registro de ancho fijo
+  por bloque: block_number (u64), hash y firma (32 bytes crudos cada uno),
+  offset (u64) y longitud (u32) del payload dentro de `.dat`.
+- `<prefijo>.dat`: los payloads canónicos concatenados, es decir los bytes
+  exactos sobre los que se calculó el hash de contenido.
+
+Verificar no requiere parsear JSON: el hash de contenido es el SHA-256 del
+tramo de `.dat` y las reglas de encadenamiento y firma son las de `app.audit`.
+
+Uso (desde apps/api):
+
+    python -m app.audit_export export --output exports/audit
+    python -m app.audit_export verify exports/audit [--secret ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Any, AsyncIterable, Dict, List, Optional, Sequence, Tuple
+
+from .audit import (
+    GENESIS_HASH,
+    canonical_payload,
+    compute_chain_hash,
+    record_payload,
+    sign_chain_hash,
+)
+
+MAGIC = b"GMAUDIT1"
+HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<Q32s32sQI")
+
+
+class AuditExportError(Exception):
+    """El archivo de exportación no es válido o no corresponde a la cadena."""
+
+
+class AuditExportWriter:
+    """Agrega bloques a una exportación existente o crea una nueva.
+
+    Primero se escribe y sincroniza `.dat` y después `.idx`; al abrir se
+    descartan registros y payloads incompletos de una escritura interrumpida,
+    así que reanudar siempre parte del último bloque completo.
+    """
+
+    def __init__(self, prefix: str) -> None:
+        self.idx_path = Path(f"{prefix}.idx")
+        self.dat_path = Path(f"{prefix}.dat")
+        self.idx_path.parent.mkdir(parents=True, exist_ok=True)
+
+        if not self.idx_path.exists() or self.idx_path.stat().st_size < HEADER.size:
+            with self.idx_path.open("wb") as handle:
+                handle.write(HEADER.pack(MAGIC, RECORD.size, 0))
+            self.dat_path.write_bytes(b"")
+
+        self._idx = self.idx_path.open("r+b")
+        self._dat = self.dat_path.open("r+b") if self.dat_path.exists() else self.dat_path.open("w+b")
+        magic, record_size, _ = HEADER.unpack(self._idx.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.size:
+            self.close()
+            raise AuditExportError(f"{self.idx_path} no es una exportación de auditoría compatible")
+
+        idx_size = self.idx_path.stat().st_size
+        self.count = (idx_size - HEADER.size) // RECORD.size
+        self.last_block_number = 0
+        self.last_hash = GENESIS_HASH
+        data_end = 0
+        if self.count:
+            self._idx.seek(HEADER.size + (self.count - 1) * RECORD.size)
+            block_number, chain_hash, _, offset, length = RECORD.unpack(self._idx.read(RECORD.size))
+            self.last_block_number = block_number
+            self.last_hash = chain_hash.hex()
+            data_end = offset + length
+
+        self._idx.truncate(HEADER.size + self.count * RECORD.size)
+        self._dat.truncate(data_end)
+        self._data_end = data_end
+
+    def append(self, records: Sequence[Dict[str, Any]]) -> int:
+        """Agrega filas de `audit_chain` consecutivas; retorna cuántas escribió."""
+        if not records:
+            return 0
+
+        entries = []
+        payloads = []
+        offset = self._data_end
+        expected_block = self.last_block_number + 1
+        for record in records:
+            block_number = int(record["block_number"])
+            if block_number != expected_block:
+                raise AuditExportError(
+                    f"Se esperaba el bloque {expected_block} y llegó el {block_number}"
+                )
+            data = canonical_payload(record_payload(record))
+            payloads.append(data)
+            entries.append(RECORD.pack(
+                block_number,
+                bytes.fromhex(record["hash"]),
+                bytes.fromhex(record["signature"]),
+                offset,
+                len(data),
+            ))
+            offset += len(data)
+            expected_block += 1
+
+        self._dat.seek(self._data_end)
+        self._dat.write(b"".join(payloads))
+        self._dat.flush()
+        os.fsync(self._dat.fileno())
+
+        self._idx.seek(HEADER.size + self.count * RECORD.size)
+        self._idx.write(b"".join(entries))
+        self._idx.flush()
+        os.fsync(self._idx.fileno())
+
+        self._data_end = offset
+        self.count += len(records)
+        self.last_block_number = expected_block - 1
+        self.last_hash = records[-1]["hash"]
+        return len(records)
+
+    def close(self) -> None:
+        self._idx.close()
+        self._dat.close()
+
+    def __enter__(self) -> "AuditExportWriter":
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        self.close()
+
+
+async def export_pages(writer: AuditExportWriter, pages: AsyncIterable[List[Dict[str, Any]]]) -> int:
+    """Escribe en la exportación las páginas de bloques recibidas; retorna cuántos agregó."""
+    exported = 0
+    async for rows in pages:
+        exported += writer.append(rows)
+    return exported
+
+
+def _verify_records(
+    records: memoryview,
+    data: Any,
+    secret: Optional[str],
+    corrupted: List[Dict[str, Any]],
+    max_reported: int,
+) -> Tuple[int, str]:
+    """Recorre los registros del índice; retorna (corruptos, último hash)."""
+    corrupted_count = 0
+    previous_hash = GENESIS_HASH
+    expected_block = 1
+    sha256 = hashlib.sha256
+
+    for block_number, raw_hash, raw_signature, offset, length in RECORD.iter_unpack(records):
+        stored_hash = raw_hash.hex()
+        content_hash = sha256(data[offset:offset + length]).hexdigest()
+        expected_hash = compute_chain_hash(previous_hash, content_hash)
+
+        problem = None
+        if block_number != expected_block:
+            problem = "numeración"
+        elif stored_hash != expected_hash:
+            problem = "hash"
+        elif secret is not None and raw_signature.hex() != sign_chain_hash(secret, expected_hash):
+            problem = "firma"
+
+        if problem is not None:
+            corrupted_count += 1
+            if len(corrupted) < max_reported:
+                corrupted.append({
+                    "block_number": block_number,
+                    "hash": stored_hash,
+                    "expected_hash": expected_hash,
+                    "problem": problem,
+                })
+
+        previous_hash = stored_hash
+        expected_block = block_number + 1
+
+    return corrupted_count, previous_hash
+
+
+def verify_export(prefix: str, secret: Optional[str] = None, max_reported: int = 1000) -> Dict[str, Any]:
+    """
+    Verifica una exportación con memoria constante (ambos archivos se mapean).
+    Sin `secret` solo se comprueba el encadenamiento; con él también las firmas.
+    """
+    idx_path = Path(f"{prefix}.idx")
+    dat_path = Path(f"{prefix}.dat")
+    idx_size = idx_path.stat().st_size
+    if idx_size < HEADER.size:
+        raise AuditExportError(f"{idx_path} está vacío o truncado")
+    count = (idx_size - HEADER.size) // RECORD.size
+    if count == 0:
+        return {"valid": True, "message": "Cadena vacía"}
+
+    corrupted: List[Dict[str, Any]] = []
+    with idx_path.open("rb") as idx_file, dat_path.open("rb") as dat_file:
+        idx_map = mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        dat_map = mmap.mmap(dat_file.fileno(), 0, access=mmap.ACCESS_READ) if dat_path.stat().st_size else None
+        try:
+            magic, record_size, _ = HEADER.unpack_from(idx_map, 0)
+            if magic != MAGIC or record_size != RECORD.size:
+                raise AuditExportError(f"{idx_path} no es una exportación de auditoría compatible")
+
+            with memoryview(idx_map) as view, view[HEADER.size:HEADER.size + count * RECORD.size] as records:
+                corrupted_count, last_hash = _verify_records(
+                    records, dat_map if dat_map is not None else b"", secret, corrupted, max_reported
+                )
+        finally:
+            idx_map.close()
+            if dat_map is not None:
+                dat_map.close()
+
+    return {
+        "valid": corrupted_count == 0,
+        "total_blocks": count,
+        "verified_blocks": count,
+        "signatures_checked": secret is not None,
+        "last_hash": last_hash,
+        "corrupted_count": corrupted_count,
+        "corrupted_blocks": corrupted,
+    }
+
+
+async def _export_from_supabase(prefix: str, page_size: Optional[int]) -> Dict[str, Any]:
+    # Solo la exportación necesita la API (y Supabase); la verificación es independiente
+    from . import main
+
+    with AuditExportWriter(prefix) as writer:
+        exported = await export_pages(
+            writer,
+            main.iter_audit_chain_pages(writer.last_block_number, page_size),
+        )
+        return {
+            "exported_blocks": exported,
+            "total_blocks": writer.count,
+            "last_block": writer.last_block_number,
+            "last_hash": writer.last_hash,
+        }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Exportación y verificación fuera de línea de audit_chain")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Exporta (o continúa exportando) la cadena desde Supabase")
+    export_parser.add_argument("--output", required=True, help="Prefijo de los archivos .idx/.dat")
+    export_parser.add_argument("--page-size", type=int, default=None)
+
+    verify_parser = commands.add_parser("verify", help="Verifica una exportación sin acceso a Supabase")
+    verify_parser.add_argument("prefix", help="Prefijo de los archivos .idx/.dat")
+    verify_parser.add_argument("--secret", default=os.getenv("AUDIT_SECRET"), help="AUDIT_SECRET para comprobar firmas")
+    verify_parser.add_argument("--max-reported", type=int, default=1000)
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        result = asyncio.run(_export_from_supabase(args.output, args.page_size))
+        print(json.dumps(result, indent=2))
+        return 0
+
+    result = verify_export(args.prefix, secret=args.secret, max_reported=args.max_reported)
+    print(json.dumps(result, indent=2))
+    return 0 if result["valid"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
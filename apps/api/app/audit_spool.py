@@ -0,0 +1,365 @@
+"""Spool local durable y envío en lotes de los eventos de auditoría."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+SpoolRecord = Tuple[int, Dict[str, Any]]
+
+
+class SpoolLockedError(RuntimeError):
+    """El directorio del spool ya está abierto por otro proceso."""
+
+
+class AuditSpool:
+    """Log append-only en disco con un registro JSON por línea.
+
+    Cada `append` hace fsync antes de retornar, por lo que un evento confirmado
+    sobrevive a una caída del proceso. El archivo `.offset` guarda el último
+    número de secuencia ya persistido en Supabase; al quedar todo confirmado el
+    log se trunca para que no crezca sin límite.
+
+    Los eventos que la base rechaza por su contenido se apartan en
+    `audit-spool.dead` (`dead_letter`) para que no bloqueen a los siguientes.
+
+    Un directorio pertenece a un solo proceso: la secuencia y el offset viven
+    en memoria, así que dos procesos sobre el mismo log repetirían números y
+    reenviarían eventos ajenos. El constructor toma un `flock` exclusivo sobre
+    el directorio y lanza `SpoolLockedError` si otro proceso lo tiene. Lo
+    pendiente se mantiene también en memoria para no releer el log en cada
+    envío.
+    """
+
+    LOG_NAME = "audit-spool.log"
+    OFFSET_NAME = "audit-spool.offset"
+    LOCK_NAME = "audit-spool.lock"
+    DEAD_LETTER_NAME = "audit-spool.dead"
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.directory / self.LOG_NAME
+        self.offset_path = self.directory / self.OFFSET_NAME
+        self.dead_letter_path = self.directory / self.DEAD_LETTER_NAME
+        self._lock_handle = self._acquire_directory()
+        self._lock = threading.Lock()
+        self._committed = self._read_offset()
+        self._pending = [record for record in self._read_records() if record[0] > self._committed]
+        self._last_seq = max([self._committed] + [seq for seq, _ in self._pending])
+
+    def _acquire_directory(self):
+        if fcntl is None:
+            raise SpoolLockedError("El spool de auditoría requiere fcntl (POSIX)")
+        handle = (self.directory / self.LOCK_NAME).open("a")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as exc:
+            handle.close()
+            raise SpoolLockedError(f"El spool {self.directory} está en uso por otro proceso") from exc
+        return handle
+
+    def close(self) -> None:
+        """Libera el directorio (el sistema lo libera también si el proceso termina)."""
+        if self._lock_handle is not None and not self._lock_handle.closed:
+            fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_UN)
+            self._lock_handle.close()
+
+    def _read_offset(self) -> int:
+        try:
+            return int(self.offset_path.read_text().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _read_records(self) -> List[SpoolRecord]:
+        if not self.log_path.exists():
+            return []
+        records: List[SpoolRecord] = []
+        with self.log_path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea truncada por una caída antes del fsync: nunca se confirmó
+                    continue
+                records.append((int(entry["seq"]), entry["payload"]))
+        return records
+
+    @property
+    def committed(self) -> int:
+        return self._committed
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def append(self, payload: Dict[str, Any]) -> int:
+        return self.append_many([payload])[0]
+
+    def append_many(self, payloads: List[Dict[str, Any]]) -> List[int]:
+        """
+        Agrega varios eventos con una sola escritura y un solo fsync. Reciben
+        números de secuencia consecutivos: ningún otro `append` se intercala.
+        """
+        with self._lock:
+            records = [(self._last_seq + offset, payload) for offset, payload in enumerate(payloads, start=1)]
+            lines = "".join(
+                json.dumps({"seq": seq, "payload": payload}, sort_keys=True) + "\n"
+                for seq, payload in records
+            )
+            with self.log_path.open("a", encoding="utf-8") as handle:
+                handle.write(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+            if records:
+                self._last_seq = records[-1][0]
+            self._pending.extend(records)
+            return [seq for seq, _ in records]
+
+    def dead_letter(self, records: List[Tuple[int, Dict[str, Any], str]]) -> None:
+        """
+        Guarda (con fsync) eventos rechazados para revisarlos a mano. Debe
+        llamarse antes del `commit` que los deja atrás; si el proceso cae entre
+        ambos, el reenvío puede repetir la línea.
+        """
+        with self._lock:
+            lines = "".join(
+                json.dumps({"seq": seq, "payload": payload, "error": error}, sort_keys=True) + "\n"
+                for seq, payload, error in records
+            )
+            with self.dead_letter_path.open("a", encoding="utf-8") as handle:
+                handle.write(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def pending(self, limit: Optional[int] = None) -> List[SpoolRecord]:
+        with self._lock:
+            return list(self._pending[:limit] if limit else self._pending)
+
+    def commit(self, seq: int) -> None:
+        with self._lock:
+            if seq <= self._committed:
+                return
+            tmp_path = self.offset_path.with_suffix(".tmp")
+            with tmp_path.open("w", encoding="utf-8") as handle:
+                handle.write(str(seq))
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self.offset_path)
+            self._committed = seq
+            self._pending = [record for record in self._pending if record[0] > seq]
+
+            if self._committed >= self._last_seq and self.log_path.exists():
+                with self.log_path.open("w", encoding="utf-8") as handle:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+
+
+def open_worker_spool(directory: str, max_workers: int) -> AuditSpool:
+    """
+    Abre el primer subdirectorio `worker-N` libre de `directory`: cada proceso
+    (p. ej. cada worker de gunicorn) obtiene su propio spool, y un worker
+    reiniciado retoma el de uno caído con sus eventos pendientes.
+    """
+    for slot in range(max_workers):
+        try:
+            return AuditSpool(str(Path(directory) / f"worker-{slot}"))
+        except SpoolLockedError:
+            continue
+    raise SpoolLockedError(
+        f"Los {max_workers} spools de {directory} están en uso; aumente AUDIT_SPOOL_MAX_WORKERS"
+    )
+
+
+class AuditPipeline:
+    """Confirma eventos al escribirlos en el spool y los encadena en segundo plano.
+
+    `append_batch` recibe los payloads en orden de llegada y debe encadenarlos,
+    firmarlos e insertarlos en una sola operación. `find_persisted` permite,
+    tras un reinicio o un error de resultado incierto, descartar los eventos que
+    ya llegaron a la base de datos para no duplicarlos al reenviar el spool.
+    `is_rejection` reconoce los errores con los que la base rechaza el
+    contenido de un evento: el lote se reintenta evento por evento y los
+    rechazados van al dead-letter del spool en lugar de reintentarse siempre.
+    """
+
+    def __init__(
+        self,
+        spool: AuditSpool,
+        append_batch: Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]],
+        find_persisted: Callable[[List[Dict[str, Any]]], Awaitable[Dict[int, Dict[str, Any]]]],
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        retry_delay: float = 2.0,
+        is_rejection: Callable[[BaseException], bool] = lambda exc: False,
+    ) -> None:
+        self.spool = spool
+        self._append_batch = append_batch
+        self._find_persisted = find_persisted
+        self._is_rejection = is_rejection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # Al arrancar no sabemos si lo pendiente alcanzó a insertarse antes de la caída
+        self._uncertain = True
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:  # pragma: no cover - el spool conserva lo pendiente
+            logger.exception("No se pudo vaciar el spool de auditoría al detener la API")
+
+    async def submit(self, payload: Dict[str, Any], wait: bool = False) -> Dict[str, Any]:
+        """Escribe el evento en el spool; con `wait` espera hasta tener su bloque sellado."""
+        loop = asyncio.get_running_loop()
+        seq = await loop.run_in_executor(None, self.spool.append, payload)
+
+        waiter: Optional[asyncio.Future] = None
+        if wait:
+            waiter = loop.create_future()
+            self._waiters[seq] = waiter
+
+        if self._wakeup is not None and (wait or self.spool.last_seq - self.spool.committed >= self.batch_size):
+            self._wakeup.set()
+
+        if waiter is not None:
+            if not self.running:
+                await self.flush()
+            return await waiter
+
+        return {"queued": True, "spool_seq": seq, "payload": payload}
+
+    async def submit_many(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Escribe los eventos de una operación masiva en el spool con un solo fsync."""
+        seqs = await asyncio.get_running_loop().run_in_executor(None, self.spool.append_many, payloads)
+        if self._wakeup is not None and self.spool.last_seq - self.spool.committed >= self.batch_size:
+            self._wakeup.set()
+        return [{"queued": True, "spool_seq": seq, "payload": payload} for seq, payload in zip(seqs, payloads)]
+
+    async def flush(self) -> int:
+        """Envía todo lo pendiente del spool; retorna cuántos eventos se persistieron."""
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            flushed = 0
+            while True:
+                batch = self.spool.pending(limit=self.batch_size)
+                if not batch:
+                    return flushed
+
+                sealed_by_seq: Dict[int, Dict[str, Any]] = {}
+                if self._uncertain:
+                    sealed_by_seq = await self._find_persisted([payload for _, payload in batch])
+                    sealed_by_seq = {batch[index][0]: block for index, block in sealed_by_seq.items()}
+
+                missing = [(seq, payload) for seq, payload in batch if seq not in sealed_by_seq]
+                rejected: Dict[int, Exception] = {}
+                try:
+                    blocks = await self._append_batch([payload for _, payload in missing])
+                    sealed_by_seq.update((seq, block) for (seq, _), block in zip(missing, blocks))
+                except Exception as exc:
+                    if not self._is_rejection(exc):
+                        self._uncertain = True
+                        self._fail_waiters(batch, exc)
+                        raise
+                    # El lote se rechazó completo: aislar los eventos culpables
+                    rejected = await self._append_one_by_one(batch, missing, sealed_by_seq)
+                except BaseException as exc:
+                    self._uncertain = True
+                    self._fail_waiters(batch, exc)
+                    raise
+                self._uncertain = False
+
+                loop = asyncio.get_running_loop()
+                if rejected:
+                    dead = [(seq, payload, str(rejected[seq])) for seq, payload in missing if seq in rejected]
+                    logger.error("Eventos de auditoría rechazados por la base, enviados al dead-letter: %s", list(rejected))
+                    await loop.run_in_executor(None, self.spool.dead_letter, dead)
+
+                last_seq = batch[-1][0]
+                await loop.run_in_executor(None, self.spool.commit, last_seq)
+                flushed += len(missing) - len(rejected)
+
+                for seq, _ in batch:
+                    waiter = self._waiters.pop(seq, None)
+                    if waiter is not None and not waiter.done():
+                        if seq in rejected:
+                            waiter.set_exception(rejected[seq])
+                        else:
+                            waiter.set_result(sealed_by_seq[seq])
+
+    async def _append_one_by_one(
+        self,
+        batch: List[SpoolRecord],
+        missing: List[SpoolRecord],
+        sealed_by_seq: Dict[int, Dict[str, Any]],
+    ) -> Dict[int, Exception]:
+        """Reenvía `missing` de a un evento; retorna los rechazados con su error."""
+        rejected: Dict[int, Exception] = {}
+        for seq, payload in missing:
+            try:
+                sealed_by_seq[seq] = (await self._append_batch([payload]))[0]
+            except Exception as exc:
+                if not self._is_rejection(exc):
+                    # Los ya sellados se detectan con find_persisted en el reintento
+                    self._uncertain = True
+                    self._fail_waiters(batch, exc)
+                    raise
+                rejected[seq] = exc
+        return rejected
+
+    def _fail_waiters(self, batch: List[SpoolRecord], exc: BaseException) -> None:
+        for seq, _ in batch:
+            waiter = self._waiters.pop(seq, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(exc if isinstance(exc, Exception) else RuntimeError(str(exc)))
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Fallo al enviar eventos de auditoría; se reintentará desde el spool")
+                await asyncio.sleep(self.retry_delay)
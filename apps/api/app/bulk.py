@@ -0,0 +1,104 @@
+"""Lectura y validación de lotes para las operaciones masivas.
+
+Un lote se valida completo antes de escribir: las filas inválidas se reportan
+con su posición en el lote y no impiden procesar las demás.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from typing import Any, Dict, List, Sequence, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+
+class BulkInputError(ValueError):
+    """Cuerpo del lote ilegible o vacío; las rutas lo traducen a 400."""
+
+
+def parse_rows(content_type: str, body: bytes, key: str) -> List[Dict[str, Any]]:
+    """
+    Filas de un lote en CSV (`text/csv`) o JSON (lista u objeto con la lista en
+    `key`). En CSV las columnas `a.b` se anidan (`specs.procesador`,
+    `specs.teclado.serial`) y las celdas vacías se omiten.
+    """
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError as exc:
+        raise BulkInputError("El archivo debe estar codificado en UTF-8") from exc
+
+    if "csv" in (content_type or "").lower():
+        rows = [nest_columns(row) for row in csv.DictReader(io.StringIO(text))]
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as exc:
+            raise BulkInputError("JSON inválido") from exc
+        rows = data.get(key) if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise BulkInputError(f"Se esperaba una lista de filas o un objeto con '{key}'")
+
+    if not rows:
+        raise BulkInputError("El lote no tiene filas")
+    return rows
+
+
+def nest_columns(row: Dict[str, Any]) -> Dict[str, Any]:
+    nested: Dict[str, Any] = {}
+    for column, value in row.items():
+        if column is None or value is None or str(value).strip() == "":
+            continue
+        target = nested
+        *parents, leaf = column.strip().split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value.strip() if isinstance(value, str) else value
+    return nested
+
+
+def validate_rows(
+    rows: Sequence[Any], model: Type[BaseModel]
+) -> Tuple[List[Tuple[int, BaseModel]], List[Dict[str, Any]]]:
+    """Separa las filas válidas (con su índice) de los errores por fila."""
+    valid: List[Tuple[int, BaseModel]] = []
+    errors: List[Dict[str, Any]] = []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, model.model_validate(row)))
+        except ValidationError as exc:
+            errors.append({"index": index, "errors": describe_errors(exc)})
+    return valid, errors
+
+
+def describe_errors(exc: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in error['loc']) or 'fila'}: {error['msg']}"
+        for error in exc.errors()
+    ]
+
+
+# Clases SQLSTATE que PostgREST responde con 4xx porque la fila misma es
+# inválida: datos (22), restricciones (23) y columnas o tipos (42); PGRST1xx y
+# PGRST2xx son errores de la petición. Ninguna deja el insert aplicado.
+ROW_REJECTION_CODES = ("22", "23", "42", "PGRST1", "PGRST2")
+
+
+def is_row_rejection(exc: BaseException) -> bool:
+    """
+    Error de PostgREST (`APIError`, con el SQLSTATE en `code`) que rechaza las
+    filas enviadas. Un timeout o un 5xx no lo es: el insert pudo aplicarse.
+    """
+    code = str(getattr(exc, "code", "") or "")
+    return code.startswith(ROW_REJECTION_CODES)
+
+
+def uniform_rows(payloads: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Mismas llaves en todas las filas: PostgREST toma las columnas de un insert
+    múltiple de la primera fila.
+    """
+    columns = list(dict.fromkeys(key for payload in payloads for key in payload))
+    return [{column: payload.get(column) for column in columns} for payload in payloads]
+
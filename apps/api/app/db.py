@@ -0,0 +1,56 @@
+"""Ejecución no bloqueante de llamadas síncronas (cliente de Supabase)."""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class QueryTimeoutError(Exception):
+    """La llamada no terminó dentro del tiempo límite configurado."""
+
+
+class QueryRunner:
+    """Ejecuta llamadas bloqueantes en un pool de hilos acotado.
+
+    El tamaño del pool limita cuántas consultas pueden estar en vuelo a la vez;
+    las demás esperan en cola sin ocupar el event loop. Cada llamada tiene un
+    tiempo límite que incluye la espera en cola.
+    """
+
+    def __init__(self, max_concurrency: int = 16, timeout: Optional[float] = 15.0) -> None:
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency debe ser mayor que cero")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="supabase",
+        )
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        future = loop.run_in_executor(self._executor, call)
+
+        limit = self.timeout if timeout is None else timeout
+        if not limit or limit <= 0:
+            return await future
+
+        try:
+            return await asyncio.wait_for(future, timeout=limit)
+        except asyncio.TimeoutError as exc:
+            raise QueryTimeoutError(f"La llamada excedió {limit:g} segundos") from exc
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
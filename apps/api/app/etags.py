@@ -0,0 +1,34 @@
+"""Validadores (ETag) para GET condicionales a partir de versiones de cambio.
+
+Cada recurso listado tiene una versión por unidad organizacional (y una
+global) que los triggers de `change_versions` avanzan una vez por sentencia de escritura. El
+ETag de una respuesta combina esas versiones con todo lo que cambia su
+contenido para el mismo recurso (parámetros y alcance del usuario), así que
+puede calcularse sin ejecutar la consulta del listado.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Optional, Sequence
+
+
+def make_etag(versions: Sequence[int], variant: Sequence[Any]) -> str:
+    raw = json.dumps([list(versions), list(variant)], separators=(",", ":"), default=str)
+    return f'W/"{hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de `If-None-Match` (RFC 9110, 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    expected = _opaque(etag)
+    return any(_opaque(candidate) == expected for candidate in if_none_match.split(","))
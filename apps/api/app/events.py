@@ -0,0 +1,121 @@
+"""Difusión en memoria de eventos para los clientes conectados por SSE.
+
+La difusión es por proceso: un cliente solo recibe los cambios que atendió
+el mismo worker. Los clientes web complementan los eventos con una recarga
+periódica (`resync`), que recoge las escrituras de otros procesos.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Set
+
+# Evento que recibe un suscriptor cuya cola se llenó: debe recargar los datos
+RESYNC_EVENT = "resync"
+
+
+@dataclass(frozen=True)
+class Event:
+    """Cambio publicado por una ruta de escritura.
+
+    `org_unit_id` limita el evento a esa unidad (más los suscriptores
+    globales); `owner_id`, si está presente, lo restringe además al dueño
+    del recurso para quienes solo ven lo propio (p. ej. un docente y sus
+    tickets).
+    """
+
+    type: str
+    data: Dict[str, Any]
+    org_unit_id: Optional[str] = None
+    owner_id: Optional[str] = None
+    id: int = 0
+
+
+@dataclass(eq=False)
+class Subscription:
+    """Cola de un cliente conectado y el alcance de lo que puede recibir."""
+
+    queue: "asyncio.Queue[Event]"
+    org_unit_id: Optional[str] = None
+    see_all: bool = False
+    user_id: Optional[str] = None
+    overflowed: bool = field(default=False, init=False)
+
+    def accepts(self, event: Event) -> bool:
+        if self.see_all:
+            return True
+        if event.org_unit_id is None or event.org_unit_id != self.org_unit_id:
+            return False
+        return self.user_id is None or event.owner_id is None or event.owner_id == self.user_id
+
+
+class EventBroker:
+    """Reparte eventos a las suscripciones activas del proceso.
+
+    Publicar no bloquea: si la cola de un suscriptor está llena se vacía y
+    se le deja un único evento `resync`, de modo que un cliente lento nunca
+    frena las escrituras y sabe que debe volver a consultar la API. Cada
+    proceso solo ve sus propias escrituras.
+    """
+
+    def __init__(self, queue_size: int = 256) -> None:
+        self.queue_size = queue_size
+        self._subscriptions: Set[Subscription] = set()
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(
+        self,
+        org_unit_id: Optional[str],
+        see_all: bool = False,
+        user_id: Optional[str] = None,
+    ) -> Subscription:
+        subscription = Subscription(
+            queue=asyncio.Queue(maxsize=self.queue_size),
+            org_unit_id=org_unit_id,
+            see_all=see_all,
+            user_id=user_id,
+        )
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def publish(
+        self,
+        type: str,
+        data: Dict[str, Any],
+        org_unit_id: Optional[str] = None,
+        owner_id: Optional[str] = None,
+    ) -> Event:
+        event = Event(type=type, data=data, org_unit_id=org_unit_id, owner_id=owner_id, id=next(self._ids))
+        self.published += 1
+        for subscription in self._subscriptions:
+            if subscription.overflowed or not subscription.accepts(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                subscription.overflowed = True
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(Event(type=RESYNC_EVENT, data={}, id=event.id))
+        return event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+def format_sse(event: Event) -> str:
+    payload = json.dumps(event.data, separators=(",", ":"), default=str)
+    return f"id: {event.id}\nevent: {event.type}\ndata: {payload}\n\n"
@@ -0,0 +1,135 @@
+"""Verificación local de los JWT emitidos por Supabase Auth."""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+try:
+    from jose import jwt  # type: ignore
+    from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError  # type: ignore
+except ImportError:  # pragma: no cover - python-jose es opcional
+    jwt = None  # type: ignore[assignment]
+    ExpiredSignatureError = JWTClaimsError = JWTError = Exception  # type: ignore[assignment,misc]
+
+
+class TokenRejectedError(Exception):
+    """La firma del token es válida pero sus claims no lo son (expirado, audiencia)."""
+
+
+def parse_secret_list(*values: Optional[str]) -> list[str]:
+    """Une secretos sueltos y listas separadas por comas, sin duplicados."""
+    secrets: list[str] = []
+    for value in values:
+        for item in (value or "").split(","):
+            item = item.strip()
+            if item and item not in secrets:
+                secrets.append(item)
+    return secrets
+
+
+def unverified_expiry(token: str) -> Optional[float]:
+    """
+    `exp` del token sin verificar la firma: solo para tokens que Supabase ya
+    validó en remoto. None si no es un JWT legible o no trae `exp`.
+    """
+    if jwt is None:
+        return None
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        return None
+    try:
+        return float(exp) if exp is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LocalJWTVerifier:
+    """Verifica firma, expiración y audiencia sin llamar a Supabase.
+
+    Acepta varios secretos para soportar rotación de llaves: el primero es el
+    vigente y los siguientes se aceptan mientras los tokens antiguos expiran.
+    `verify` retorna None cuando no puede decidir localmente (algoritmo no
+    soportado o ninguna llave coincide) para que el llamador consulte a
+    Supabase.
+    """
+
+    def __init__(
+        self,
+        secrets: Sequence[str],
+        audience: Optional[str] = "authenticated",
+        algorithms: Iterable[str] = ("HS256",),
+        leeway: int = 0,
+    ) -> None:
+        self.secrets = list(secrets)
+        self.audience = audience or None
+        self.algorithms = [alg.strip().upper() for alg in algorithms if alg and alg.strip()]
+        self.leeway = leeway
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.fallbacks = 0
+        self.rejections = 0
+
+    @property
+    def enabled(self) -> bool:
+        return jwt is not None and bool(self.secrets) and bool(self.algorithms)
+
+    def _count(self, attribute: str) -> None:
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            self._count("fallbacks")
+            return None
+
+        if str(header.get("alg", "")).upper() not in self.algorithms:
+            self._count("fallbacks")
+            return None
+
+        options = {"verify_aud": self.audience is not None, "leeway": self.leeway}
+
+        for secret in self.secrets:
+            try:
+                claims = jwt.decode(
+                    token,
+                    secret,
+                    algorithms=self.algorithms,
+                    audience=self.audience,
+                    options=options,
+                )
+            except ExpiredSignatureError:
+                self._count("rejections")
+                raise TokenRejectedError("Token expirado")
+            except JWTClaimsError as exc:
+                self._count("rejections")
+                raise TokenRejectedError(f"Token inválido: {exc}")
+            except JWTError:
+                # Firma no coincide con esta llave: probar la siguiente
+                continue
+
+            if not claims.get("sub"):
+                self._count("rejections")
+                raise TokenRejectedError("Token sin sujeto")
+
+            self._count("local_hits")
+            return claims
+
+        self._count("fallbacks")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "keys": len(self.secrets),
+                "local_hits": self.local_hits,
+                "fallbacks": self.fallbacks,
+                "rejections": self.rejections,
+            }
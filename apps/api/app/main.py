@@ -1,17 +1,59 @@
 # apps/api/app/main.py
-from fastapi import FastAPI, Depends, HTTPException, Response, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List, Literal, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Literal, Dict, Any, Annotated, AsyncIterator, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
 import os
 import hashlib
 import json
-import hmac
 import unicodedata
 import re
+import time
+
+from .audit import (
+    GENESIS_HASH,
+    AuditChainContentionError,
+    AuditChainSequencer,
+    AuditPayloadError,
+    ChainVerifier,
+    EntityChainSequencer,
+    ParallelChainVerifier,
+    block_row,
+    build_payload,
+    compute_content_hash,
+    sign_chain_hash,
+    sign_checkpoint,
+    sign_merkle_root,
+    validate_payload,
+)
+from .audit_spool import AuditPipeline, open_worker_spool
+from .cache import TTLCache
+from .db import QueryRunner, QueryTimeoutError
+from .bulk import BulkInputError, is_row_rejection, parse_rows, uniform_rows, validate_rows
+from .etags import etag_matches, make_etag
+from .events import RESYNC_EVENT, EventBroker, format_sse
+from .exports import FORMATS, encode_pages, gzip_chunks, utf8_chunks
+from .jwt_verifier import LocalJWTVerifier, TokenRejectedError, parse_secret_list, unverified_expiry
+from .merkle import (
+    MerkleFrontier,
+    NodeKey,
+    inclusion_proof,
+    leaf_hash,
+    proof_node_keys,
+    verify_inclusion,
+)
+from .metrics import MetricCounters
+from .pagination import PaginationError, decode_cursor, keyset_condition, select_columns, split_page
+from .rollups import as_utc, bucket_count, bucket_start, build_ticket_series
+
 try:
     from mangum import Mangum  # type: ignore
 except ImportError:  # pragma: no cover - optional dependency for serverless
@@ -32,11 +74,72 @@ SUPABASE_KEY_ENV_KEYS = (
     "PUBLIC_SUPABASE_ANON_KEY",
 )
 JWT_SECRET = os.getenv("JWT_SECRET")
+# Secretos anteriores (separados por coma) aceptados durante una rotación de llaves
+JWT_PREVIOUS_SECRETS = os.getenv("JWT_PREVIOUS_SECRETS")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "authenticated")
+JWT_LEEWAY_SECONDS = int(os.getenv("JWT_LEEWAY_SECONDS", "0"))
+# "local" verifica firma/expiración/audiencia en proceso; "remote" siempre consulta Supabase
+JWT_VERIFICATION_MODE = os.getenv("JWT_VERIFICATION_MODE", "local").strip().lower()
 AUDIT_SECRET = os.getenv("AUDIT_SECRET", "change-this-secret-key-in-production")
+# Directorio del spool local de auditoría; si no se define, los eventos se escriben en línea
+AUDIT_SPOOL_DIR = os.getenv("AUDIT_SPOOL_DIR")
+# Procesos que pueden compartir AUDIT_SPOOL_DIR (cada uno usa su subdirectorio worker-N)
+AUDIT_SPOOL_MAX_WORKERS = int(os.getenv("AUDIT_SPOOL_MAX_WORKERS", "16"))
+AUDIT_SPOOL_BATCH_SIZE = int(os.getenv("AUDIT_SPOOL_BATCH_SIZE", "100"))
+AUDIT_SPOOL_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_SPOOL_FLUSH_INTERVAL_MS", "500"))
+# Bloques por página al verificar la cadena y máximo de bloques corruptos detallados
+AUDIT_VERIFY_PAGE_SIZE = int(os.getenv("AUDIT_VERIFY_PAGE_SIZE", "1000"))
+AUDIT_VERIFY_PAGE_TIMEOUT_SECONDS = float(os.getenv("AUDIT_VERIFY_PAGE_TIMEOUT_SECONDS", "60"))
+AUDIT_VERIFY_MAX_REPORTED = int(os.getenv("AUDIT_VERIFY_MAX_REPORTED", "1000"))
+# Procesos para verificar la cadena en paralelo (0 o 1 = un solo núcleo) y bloques por tramo
+AUDIT_VERIFY_WORKERS = int(os.getenv("AUDIT_VERIFY_WORKERS", "0"))
+AUDIT_VERIFY_CHUNK_SIZE = int(os.getenv("AUDIT_VERIFY_CHUNK_SIZE", "2500"))
+# Actualización del árbol de Merkle tras un registro: 0 = en línea, al insertar
+# el bloque; > 0 = agrupada en segundo plano tras esa espera (solo procesos de
+# larga vida); negativo = solo con POST /audit/merkle/sync
+AUDIT_MERKLE_SYNC_DELAY_SECONDS = float(os.getenv("AUDIT_MERKLE_SYNC_DELAY_SECONDS", "0"))
+# Sub-cadenas de auditoría por entidad, ancladas periódicamente en la cadena global
+AUDIT_ENTITY_CHAINS = os.getenv("AUDIT_ENTITY_CHAINS", "false").strip().lower() in {"1", "true", "yes"}
+AUDIT_ANCHOR_INTERVAL_SECONDS = float(os.getenv("AUDIT_ANCHOR_INTERVAL_SECONDS", "60"))
+
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "2048"))
+# Historial de auditoría por entidad: tamaño de página y caché por página
+AUDIT_HISTORY_PAGE_SIZE = int(os.getenv("AUDIT_HISTORY_PAGE_SIZE", "50"))
+AUDIT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("AUDIT_HISTORY_MAX_PAGE_SIZE", "500"))
+AUDIT_HISTORY_CACHE_TTL_SECONDS = float(os.getenv("AUDIT_HISTORY_CACHE_TTL_SECONDS", "30"))
+AUDIT_HISTORY_CACHE_MAX_ENTRIES = int(os.getenv("AUDIT_HISTORY_CACHE_MAX_ENTRIES", "1024"))
+# Listados paginados por cursor (tickets, dispositivos)
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "200"))
+# Filas por consulta en las exportaciones en streaming
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+# Importación masiva: filas por insert múltiple y máximo de filas por solicitud
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "200"))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "2000"))
+# Segundos que se reutiliza una versión de cambio leída de la base (ETags)
+CHANGE_VERSION_TTL_SECONDS = float(os.getenv("CHANGE_VERSION_TTL_SECONDS", "5"))
+# Segundos que se reutiliza el total de un listado de dispositivos filtrado
+DEVICE_COUNT_CACHE_TTL_SECONDS = float(os.getenv("DEVICE_COUNT_CACHE_TTL_SECONDS", "60"))
+# Contadores del dashboard en memoria: segundos entre reconciliaciones con la base
+METRICS_RECONCILE_SECONDS = float(os.getenv("METRICS_RECONCILE_SECONDS", "60"))
+# Eventos SSE: comentario de keep-alive y eventos pendientes por cliente
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+# Máximo de buckets por consulta de series de tiempo de tickets (no debe
+# superar el max-rows de PostgREST: la serie se lee como una fila por bucket)
+TICKET_SERIES_MAX_BUCKETS = int(os.getenv("TICKET_SERIES_MAX_BUCKETS", "1000"))
+
+# Llamadas concurrentes a Supabase por proceso y tiempo límite por llamada
+SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "16"))
+SUPABASE_QUERY_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_QUERY_TIMEOUT_SECONDS", "15"))
 
 EMAIL_REGEX = re.compile(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", re.IGNORECASE)
 ALLOWED_ROLES = {"DOCENTE", "ADMINISTRATIVO", "TI", "DIRECTOR", "LIDER_TI"}
 
+logger = logging.getLogger(__name__)
+
 class LazySupabaseClient:
     """Inicializa el cliente de Supabase únicamente cuando se necesita."""
 
@@ -83,6 +186,28 @@ class LazySupabaseClient:
 
 supabase = LazySupabaseClient()
 
+db_runner = QueryRunner(
+    max_concurrency=SUPABASE_MAX_CONCURRENCY,
+    timeout=SUPABASE_QUERY_TIMEOUT_SECONDS,
+)
+
+
+async def run_db(func, *args, **kwargs):
+    """Ejecuta una llamada bloqueante del cliente de Supabase fuera del event loop."""
+    try:
+        return await db_runner.run(func, *args, **kwargs)
+    except QueryTimeoutError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Supabase no respondió a tiempo: {exc}",
+        )
+
+
+async def db_execute(query, timeout: Optional[float] = None):
+    """Ejecuta un query builder de Supabase (`.execute()`) sin bloquear el event loop."""
+    return await run_db(query.execute, timeout=timeout)
+
+
 app = FastAPI(
     title="Gemelli IT API",
     description="API para gestión de inventario y HelpDesk",
@@ -100,6 +225,50 @@ app.add_middleware(
 
 security = HTTPBearer()
 
+
+@app.on_event("shutdown")
+async def shutdown_db_runner() -> None:
+    db_runner.shutdown()
+
+# Cachés de autenticación: token verificado -> id de usuario, id de usuario -> perfil
+token_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+profile_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+jwt_verifier = LocalJWTVerifier(
+    secrets=parse_secret_list(JWT_SECRET, JWT_PREVIOUS_SECRETS) if JWT_VERIFICATION_MODE == "local" else [],
+    audience=JWT_AUDIENCE,
+    algorithms=JWT_ALGORITHM.split(","),
+    leeway=JWT_LEEWAY_SECONDS,
+)
+
+# (tabla, entidad, cursor, límite, con metadata) -> página de historial de auditoría
+audit_history_cache = TTLCache(maxsize=AUDIT_HISTORY_CACHE_MAX_ENTRIES, ttl=AUDIT_HISTORY_CACHE_TTL_SECONDS)
+
+# (recurso, unidad organizacional o None) -> versión de cambio para ETags
+change_version_cache = TTLCache(maxsize=1024, ttl=CHANGE_VERSION_TTL_SECONDS)
+
+# (unidad organizacional, filtros) -> total del listado de dispositivos
+device_count_cache = TTLCache(maxsize=1024, ttl=DEVICE_COUNT_CACHE_TTL_SECONDS)
+
+# Suscriptores SSE de este proceso
+event_broker = EventBroker(queue_size=EVENTS_QUEUE_SIZE)
+
+
+def publish_metric_delta(org_unit_id: Optional[str], delta: Dict[str, Any]) -> None:
+    event_broker.publish("metrics", {"delta": delta}, org_unit_id=org_unit_id)
+
+
+# unidad organizacional (None = global) -> conteos del dashboard
+metric_counters = MetricCounters(reconcile_interval=METRICS_RECONCILE_SECONDS, listener=publish_metric_delta)
+
+CACHES: Dict[str, TTLCache] = {
+    "auth_tokens": token_cache,
+    "user_profiles": profile_cache,
+    "audit_history": audit_history_cache,
+    "device_counts": device_count_cache,
+    "change_versions": change_version_cache,
+}
+
 # ==================== MODELS ====================
 
 class UserProfile(BaseModel):
@@ -189,6 +358,10 @@ class TicketUpdate(BaseModel):
     prioridad: Optional[Literal["BAJA", "MEDIA", "ALTA", "CRITICA"]] = None
     asignado_a: Optional[str] = None
 
+class TicketBulkUpdate(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+    changes: TicketUpdate
+
 class TicketComment(BaseModel):
     ticket_id: str
     comentario: str
@@ -207,8 +380,8 @@ class InventoryPermissionResponse(BaseModel):
     granted_at: Optional[datetime]
     granted_by: Optional[str]
 
-    
-    class AdminUserBase(BaseModel):
+
+class AdminUserBase(BaseModel):
     nombre: str = Field(..., min_length=2, max_length=150)
     email: str = Field(..., max_length=255)
     rol: Literal["DOCENTE", "ADMINISTRATIVO", "TI", "DIRECTOR", "LIDER_TI"]
@@ -254,127 +427,731 @@ class AdminUserUpdate(BaseModel):
         return cleaned
 # ==================== AUDIT HASH SYSTEM ====================
 
-def generate_audit_hash(action: str, entity_id: str, user_id: str, data: dict = None) -> dict:
+async def load_audit_chain_head() -> tuple[str, int]:
+    """Lee la cabeza persistida de la cadena (último hash y número de bloque)."""
+    response = await db_execute(
+        supabase.table("audit_chain_head")
+        .select("hash, block_number")
+        .limit(1)
+    )
+    if not response.data:
+        return GENESIS_HASH, 0
+    head = response.data[0]
+    return head["hash"], int(head["block_number"])
+
+
+async def append_audit_blocks(expected_previous_hash: str, blocks: List[dict]) -> dict:
+    """Inserta bloques encadenados de forma atómica (ver `append_audit_blocks` en supabase.sql)."""
+    response = await db_execute(
+        supabase.rpc(
+            "append_audit_blocks",
+            {"p_expected_previous_hash": expected_previous_hash, "p_blocks": blocks},
+        )
+    )
+    return response.data
+
+
+audit_sequencer = AuditChainSequencer(
+    load_head=load_audit_chain_head,
+    append_blocks=append_audit_blocks,
+    secret=AUDIT_SECRET,
+)
+
+
+async def load_entity_chain_head(entity_id: str) -> tuple[str, int]:
+    response = await db_execute(
+        supabase.table("audit_entity_heads")
+        .select("hash, block_number")
+        .eq("entity_id", entity_id)
+        .limit(1)
+    )
+    if not response.data:
+        return GENESIS_HASH, 0
+    head = response.data[0]
+    return head["hash"], int(head["block_number"])
+
+
+async def append_entity_audit_blocks(entity_id: str, expected_previous_hash: str, blocks: List[dict]) -> dict:
+    """Inserta bloques en la sub-cadena de una entidad (ver `append_entity_audit_blocks` en supabase.sql)."""
+    response = await db_execute(
+        supabase.rpc(
+            "append_entity_audit_blocks",
+            {
+                "p_entity_id": entity_id,
+                "p_expected_previous_hash": expected_previous_hash,
+                "p_blocks": blocks,
+            },
+        )
+    )
+    return response.data
+
+
+entity_sequencer = EntityChainSequencer(
+    load_head=load_entity_chain_head,
+    append_blocks=append_entity_audit_blocks,
+    secret=AUDIT_SECRET,
+)
+
+
+def audit_events_table() -> str:
+    """Tabla donde `register_audit_event` escribe los eventos."""
+    return "audit_entity_chain" if AUDIT_ENTITY_CHAINS else "audit_chain"
+
+
+def invalidate_entity_audit_history(payloads: List[dict]) -> None:
+    entity_ids = {payload["entity_id"] for payload in payloads}
+    audit_history_cache.invalidate_where(lambda key, _value: key[1] in entity_ids)
+
+
+async def append_global_audit_blocks(payloads: List[dict]) -> List[dict]:
+    """Encadena un lote en la cadena global y avanza el árbol de Merkle."""
+    blocks = await audit_sequencer.append(payloads)
+    invalidate_entity_audit_history(payloads)
+    await advance_audit_merkle_tree(blocks)
+    return blocks
+
+
+async def append_audit_batch(payloads: List[dict]) -> List[dict]:
+    if AUDIT_ENTITY_CHAINS:
+        blocks = await entity_sequencer.append(payloads)
+        invalidate_entity_audit_history(payloads)
+        schedule_entity_chain_anchor()
+        return blocks
+    return await append_global_audit_blocks(payloads)
+
+
+AUDIT_HISTORY_COLUMNS = "block_number, hash, previous_hash, signature, action, entity_id, user_id, timestamp"
+
+
+async def fetch_entity_audit_page(
+    entity_id: str,
+    limit: Optional[int] = None,
+    before: Optional[int] = None,
+    include_metadata: bool = False,
+) -> dict:
     """
-    Genera un hash de auditoría criptográfico para transacciones importantes.
-    Este sistema reemplaza blockchain con una cadena de hash verificable.
+    Página del historial de auditoría de una entidad, del bloque más reciente al
+    más antiguo. `before` es el cursor (block_number) devuelto como `next_cursor`
+    por la página anterior. Las páginas se cachean hasta que se registra un
+    nuevo evento de la entidad.
     """
-    timestamp = datetime.utcnow().isoformat()
-    
-    # Construir payload de la transacción
-    payload = {
-        "action": action,
-        "entity_id": entity_id,
-        "user_id": user_id,
-        "timestamp": timestamp,
-        "data": data or {}
+    limit = min(max(limit or AUDIT_HISTORY_PAGE_SIZE, 1), AUDIT_HISTORY_MAX_PAGE_SIZE)
+    table = audit_events_table()
+    cache_key = (table, entity_id, before, limit, include_metadata)
+    cached = audit_history_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    columns = AUDIT_HISTORY_COLUMNS + (", metadata" if include_metadata else "")
+    query = supabase.table(table).select(columns).eq("entity_id", entity_id)
+    if before is not None:
+        query = query.lt("block_number", before)
+    # Se pide una fila extra solo para saber si hay otra página
+    response = await db_execute(query.order("block_number", desc=True).limit(limit + 1))
+    rows = response.data or []
+
+    page = {
+        "data": rows[:limit],
+        "count": len(rows[:limit]),
+        "next_cursor": rows[limit - 1]["block_number"] if len(rows) > limit else None,
     }
-    
-    # Generar hash SHA256 del payload
-    payload_str = json.dumps(payload, sort_keys=True)
-    content_hash = hashlib.sha256(payload_str.encode()).hexdigest()
-    
-    # Obtener hash del registro anterior (crear cadena)
-    previous_record = supabase.table("audit_chain").select("hash").order(
-        "created_at", desc=True
-    ).limit(1).execute()
-    
-    previous_hash = previous_record.data[0]["hash"] if previous_record.data else "0" * 64
-    
-    # Generar hash de la cadena (previous_hash + content_hash)
-    chain_data = f"{previous_hash}:{content_hash}"
-    chain_hash = hashlib.sha256(chain_data.encode()).hexdigest()
-    
-    # Generar firma HMAC para verificación de integridad
-    signature = hmac.new(
-        AUDIT_SECRET.encode(),
-        chain_hash.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    
-    # Calcular número de bloque secuencial
-    count_result = supabase.table("audit_chain").select("id", count="exact").execute()
-    block_number = (count_result.count or 0) + 1
-    
-    return {
-        "hash": chain_hash,
-        "content_hash": content_hash,
-        "previous_hash": previous_hash,
-        "signature": signature,
+    audit_history_cache.set(cache_key, page)
+    return page
+
+
+async def find_persisted_audit_blocks(payloads: List[dict]) -> Dict[int, dict]:
+    """Busca por content_hash qué payloads del spool ya están en la cadena."""
+    indexes = {compute_content_hash(payload): index for index, payload in enumerate(payloads)}
+    response = await db_execute(
+        supabase.table(audit_events_table())
+        .select("hash, content_hash, previous_hash, signature, block_number")
+        .in_("content_hash", list(indexes))
+    )
+
+    found: Dict[int, dict] = {}
+    for row in response.data or []:
+        index = indexes.get(row["content_hash"])
+        if index is not None:
+            found[index] = dict(row, payload=payloads[index])
+    return found
+
+
+audit_pipeline: Optional[AuditPipeline] = None
+if AUDIT_SPOOL_DIR:
+    audit_pipeline = AuditPipeline(
+        open_worker_spool(AUDIT_SPOOL_DIR, AUDIT_SPOOL_MAX_WORKERS),
+        append_batch=append_audit_batch,
+        find_persisted=find_persisted_audit_blocks,
+        batch_size=AUDIT_SPOOL_BATCH_SIZE,
+        flush_interval=AUDIT_SPOOL_FLUSH_INTERVAL_MS / 1000,
+        is_rejection=is_row_rejection,
+    )
+
+
+@app.on_event("startup")
+async def start_audit_pipeline() -> None:
+    # Reenvía lo que haya quedado en el spool antes de la última caída
+    if audit_pipeline is not None:
+        audit_pipeline.start()
+
+
+@app.on_event("shutdown")
+async def stop_audit_pipeline() -> None:
+    if audit_pipeline is not None:
+        await audit_pipeline.stop()
+
+
+async def load_verification_checkpoint() -> Optional[dict]:
+    """Último checkpoint de verificación cuya firma sigue siendo válida."""
+    response = await db_execute(
+        supabase.table("audit_chain_checkpoints")
+        .select("block_number, hash, signature, verified_at")
+        .order("block_number", desc=True)
+        .limit(1)
+    )
+    if not response.data:
+        return None
+
+    checkpoint = response.data[0]
+    expected = sign_checkpoint(AUDIT_SECRET, int(checkpoint["block_number"]), checkpoint["hash"])
+    if checkpoint["signature"] != expected:
+        return None
+
+    # El bloque ancla debe conservar el hash con el que se verificó
+    anchor = await db_execute(
+        supabase.table("audit_chain")
+        .select("hash")
+        .eq("block_number", checkpoint["block_number"])
+        .limit(1)
+    )
+    if not anchor.data or anchor.data[0]["hash"] != checkpoint["hash"]:
+        return None
+
+    return checkpoint
+
+
+async def save_verification_checkpoint(block_number: int, chain_hash: str, user_id: Optional[str]) -> dict:
+    checkpoint = {
         "block_number": block_number,
-        "payload": payload
+        "hash": chain_hash,
+        "signature": sign_checkpoint(AUDIT_SECRET, block_number, chain_hash),
+        "verified_at": datetime.utcnow().isoformat(),
+        "verified_by": user_id,
     }
+    await db_execute(supabase.table("audit_chain_checkpoints").insert(checkpoint))
+    return checkpoint
+
+
+AUDIT_BLOCK_COLUMNS = "block_number, hash, signature, action, entity_id, user_id, timestamp, metadata"
+
+
+async def iter_audit_chain_pages(
+    after_block: int = 0,
+    page_size: Optional[int] = None,
+    columns: str = AUDIT_BLOCK_COLUMNS,
+    entity_id: Optional[str] = None,
+):
+    """
+    Recorre `audit_chain` por páginas ordenadas por block_number (keyset, sin
+    OFFSET). Termina solo con una página vacía: PostgREST recorta en silencio
+    las páginas mayores que su `max-rows`, así que una página corta no
+    significa que se llegó al final. Con `entity_id` recorre la sub-cadena de
+    esa entidad en `audit_entity_chain`.
+    """
+    page_size = page_size or AUDIT_VERIFY_PAGE_SIZE
+    last_block = after_block
+    while True:
+        if entity_id is None:
+            query = supabase.table("audit_chain").select(columns)
+        else:
+            query = supabase.table("audit_entity_chain").select(columns).eq("entity_id", entity_id)
+        response = await db_execute(
+            query
+            .gt("block_number", last_block)
+            .order("block_number")
+            .limit(page_size),
+            timeout=AUDIT_VERIFY_PAGE_TIMEOUT_SECONDS,
+        )
+        rows = response.data or []
+        if not rows:
+            return
+        yield rows
+        last_block = int(rows[-1]["block_number"])
+
+
+_audit_verify_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_audit_verify_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Pool de procesos para verificar la cadena; None si está deshabilitado.
+
+    Los workers no se crean con fork: copiarían el event loop, los sockets del
+    cliente de Supabase y los locks de este proceso, que ya tiene hilos
+    corriendo. forkserver (o spawn donde no existe) arranca procesos limpios
+    que solo importan `app.audit`.
+    """
+    global _audit_verify_pool
+    if AUDIT_VERIFY_WORKERS <= 1:
+        return None
+    if _audit_verify_pool is None:
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _audit_verify_pool = ProcessPoolExecutor(
+            max_workers=AUDIT_VERIFY_WORKERS,
+            mp_context=multiprocessing.get_context(start_method),
+        )
+    return _audit_verify_pool
+
 
-def verify_audit_chain() -> dict:
+@app.on_event("shutdown")
+async def shutdown_audit_verify_pool() -> None:
+    if _audit_verify_pool is not None:
+        _audit_verify_pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def iter_audit_chain_verification(
+    full: bool = False,
+    user_id: Optional[str] = None,
+    page_size: Optional[int] = None,
+):
+    """
+    Verifica la cadena página por página con memoria constante.
+    Emite un evento `progress` por página (por lote de páginas en modo
+    paralelo) y un evento final `result`.
     """
-    Verifica la integridad de toda la cadena de auditoría.
+    checkpoint = None if full else await load_verification_checkpoint()
+    start_block = int(checkpoint["block_number"]) if checkpoint else 0
+    previous_hash = checkpoint["hash"] if checkpoint else GENESIS_HASH
+    pool = get_audit_verify_pool()
+    if pool is not None:
+        verifier: ChainVerifier = ParallelChainVerifier(
+            AUDIT_SECRET,
+            pool,
+            previous_hash,
+            max_reported=AUDIT_VERIFY_MAX_REPORTED,
+            chunk_size=AUDIT_VERIFY_CHUNK_SIZE,
+        )
+        # Acumular páginas hasta tener trabajo para todos los procesos
+        feed_threshold = AUDIT_VERIFY_WORKERS * AUDIT_VERIFY_CHUNK_SIZE
+    else:
+        verifier = ChainVerifier(AUDIT_SECRET, previous_hash, max_reported=AUDIT_VERIFY_MAX_REPORTED)
+        feed_threshold = 1
+
+    loop = asyncio.get_running_loop()
+    buffered: List[dict] = []
+
+    async def feed_buffered():
+        # El hashing es CPU: se ejecuta fuera del event loop
+        await loop.run_in_executor(None, verifier.feed, buffered)
+        buffered.clear()
+        return {
+            "type": "progress",
+            "verified_blocks": verifier.verified,
+            "last_block": verifier.last_block_number,
+            "corrupted_count": verifier.corrupted_count,
+        }
+
+    async for rows in iter_audit_chain_pages(start_block, page_size):
+        buffered.extend(rows)
+        if len(buffered) >= feed_threshold:
+            yield await feed_buffered()
+
+    if buffered:
+        yield await feed_buffered()
+
+    if verifier.verified == 0 and start_block == 0:
+        yield {"type": "result", "valid": True, "message": "Cadena vacía"}
+        return
+
+    new_checkpoint = None
+    if verifier.valid and verifier.last_block_number is not None:
+        new_checkpoint = await save_verification_checkpoint(
+            int(verifier.last_block_number), verifier.previous_hash, user_id
+        )
+
+    yield {
+        "type": "result",
+        "valid": verifier.valid,
+        "total_blocks": start_block + verifier.verified,
+        "verified_blocks": verifier.verified,
+        "from_block": start_block + 1,
+        "checkpoint": (new_checkpoint or checkpoint or {}).get("block_number"),
+        "corrupted_count": verifier.corrupted_count,
+        "corrupted_blocks": verifier.corrupted
+    }
+
+
+async def verify_audit_chain(full: bool = False, user_id: Optional[str] = None) -> dict:
+    """
+    Verifica la integridad de la cadena de auditoría.
+    Por defecto continúa desde el último checkpoint firmado y solo revisa los
+    bloques nuevos; con `full=True` vuelve a verificar desde el bloque 1.
     Retorna si la cadena es válida y cualquier hash corrupto.
     """
-    records = supabase.table("audit_chain").select("*").order("block_number").execute()
-    
-    if not records.data:
-        return {"valid": True, "message": "Cadena vacía"}
-    
-    corrupted = []
-    previous_hash = "0" * 64
-    
-    for record in records.data:
-        # Reconstruir hash esperado
-        payload = {
-            "action": record["action"],
-            "entity_id": record["entity_id"],
-            "user_id": record["user_id"],
-            "timestamp": record["timestamp"],
-            "data": record.get("metadata", {})
+    result: Dict[str, Any] = {}
+    async for event in iter_audit_chain_verification(full=full, user_id=user_id):
+        result = event
+    result.pop("type", None)
+    return result
+
+
+# ---- Árbol de Merkle para pruebas de inclusión ----
+
+_merkle_frontier: Optional[MerkleFrontier] = None
+_merkle_lock = asyncio.Lock()
+_background_tasks: Dict[str, asyncio.Task] = {}
+
+
+def schedule_background_job(name: str, delay: float, job) -> None:
+    """
+    Ejecuta `job()` tras `delay` segundos salvo que ya haya una ejecución
+    pendiente con el mismo nombre; así varios registros seguidos se agrupan.
+    Un `delay` negativo deshabilita la tarea.
+    """
+    if delay < 0:
+        return
+    task = _background_tasks.get(name)
+    if task is not None and not task.done():
+        return
+
+    async def run() -> None:
+        await asyncio.sleep(delay)
+        try:
+            await job()
+        except Exception:
+            logger.exception("Falló la tarea en segundo plano %s", name)
+
+    _background_tasks[name] = asyncio.get_running_loop().create_task(run())
+
+
+def merkle_node_key(key: NodeKey) -> str:
+    level, index = key
+    return f"{level}:{index}"
+
+
+async def fetch_merkle_nodes(keys: List[NodeKey]) -> Dict[NodeKey, bytes]:
+    """Lee en una sola consulta los nodos persistidos indicados."""
+    if not keys:
+        return {}
+    response = await db_execute(
+        supabase.table("audit_merkle_nodes")
+        .select("level, idx, hash")
+        .in_("node_key", [merkle_node_key(key) for key in set(keys)])
+    )
+    return {
+        (int(row["level"]), int(row["idx"])): bytes.fromhex(row["hash"])
+        for row in response.data or []
+    }
+
+
+async def load_merkle_root() -> Optional[dict]:
+    """Última raíz publicada cuya firma sigue siendo válida."""
+    response = await db_execute(
+        supabase.table("audit_merkle_roots")
+        .select("tree_size, root_hash, signature, created_at")
+        .order("tree_size", desc=True)
+        .limit(1)
+    )
+    if not response.data:
+        return None
+    root = response.data[0]
+    if root["signature"] != sign_merkle_root(AUDIT_SECRET, int(root["tree_size"]), root["root_hash"]):
+        return None
+    return root
+
+
+async def load_merkle_frontier() -> MerkleFrontier:
+    root = await load_merkle_root()
+    size = int(root["tree_size"]) if root else 0
+    nodes = await fetch_merkle_nodes(MerkleFrontier.node_keys(size))
+    try:
+        return MerkleFrontier(size, nodes)
+    except KeyError:
+        # Faltan nodos de la raíz publicada: se reconstruye desde el bloque 1
+        return MerkleFrontier()
+
+
+def follows_frontier(frontier: MerkleFrontier, blocks: List[dict]) -> bool:
+    return bool(blocks) and all(
+        int(block["block_number"]) == frontier.size + offset
+        for offset, block in enumerate(blocks, start=1)
+    )
+
+
+async def sync_audit_merkle_tree(blocks: Optional[List[dict]] = None) -> Optional[dict]:
+    """
+    Agrega al árbol los bloques posteriores a la última raíz publicada.
+    `blocks` son los recién insertados: si continúan el árbol se agregan sin
+    leer la cadena (O(log n) nodos por bloque); si otro worker insertó antes,
+    se leen los bloques que faltan. Los nodos son deterministas y se insertan
+    de forma idempotente, por lo que varios workers pueden sincronizar a la
+    vez. Retorna la raíz publicada, o None si no había bloques nuevos.
+    """
+    global _merkle_frontier
+    async with _merkle_lock:
+        if _merkle_frontier is None:
+            _merkle_frontier = await load_merkle_frontier()
+        frontier = _merkle_frontier
+
+        published = None
+        try:
+            if blocks and follows_frontier(frontier, blocks):
+                pages = iter_pages_of(blocks)
+            else:
+                pages = iter_audit_chain_pages(frontier.size, columns="block_number, hash")
+            async for rows in pages:
+                created = []
+                for row in rows:
+                    if int(row["block_number"]) != frontier.size + 1:
+                        raise HTTPException(
+                            status_code=500,
+                            detail=f"La cadena de auditoría tiene un hueco antes del bloque {row['block_number']}",
+                        )
+                    created.extend(frontier.append(leaf_hash(row["hash"])))
+
+                await db_execute(
+                    supabase.table("audit_merkle_nodes").upsert(
+                        [
+                            {
+                                "node_key": merkle_node_key((level, index)),
+                                "level": level,
+                                "idx": index,
+                                "hash": node.hex(),
+                            }
+                            for level, index, node in created
+                        ],
+                        on_conflict="node_key",
+                        ignore_duplicates=True,
+                    )
+                )
+                root_hash = frontier.root().hex()
+                published = {
+                    "tree_size": frontier.size,
+                    "root_hash": root_hash,
+                    "signature": sign_merkle_root(AUDIT_SECRET, frontier.size, root_hash),
+                    "created_at": datetime.utcnow().isoformat(),
+                }
+                await db_execute(
+                    supabase.table("audit_merkle_roots").upsert(
+                        published,
+                        on_conflict="tree_size",
+                        ignore_duplicates=True,
+                    )
+                )
+        except BaseException:
+            # El estado en memoria pudo adelantarse a lo persistido
+            _merkle_frontier = None
+            raise
+
+        return published
+
+
+async def iter_pages_of(rows: List[dict]):
+    yield rows
+
+
+def schedule_audit_merkle_sync() -> None:
+    schedule_background_job("merkle", AUDIT_MERKLE_SYNC_DELAY_SECONDS, sync_audit_merkle_tree)
+
+
+async def advance_audit_merkle_tree(blocks: List[dict]) -> None:
+    """
+    Avanza el árbol tras insertar `blocks` en la cadena global. En línea por
+    defecto: una tarea diferida no sobrevive al fin de la invocación en
+    despliegues serverless (Mangum). Los bloques ya están insertados, así que
+    un fallo aquí no se propaga: la próxima sincronización los recupera.
+    """
+    if AUDIT_MERKLE_SYNC_DELAY_SECONDS != 0:
+        schedule_audit_merkle_sync()
+        return
+    try:
+        await sync_audit_merkle_tree(blocks)
+    except Exception:
+        logger.exception("No se pudo actualizar el árbol de Merkle de auditoría")
+
+
+async def build_audit_inclusion_proof(block_number: int, block_hash: str) -> Optional[dict]:
+    """
+    Prueba de inclusión O(log n) del bloque contra la última raíz firmada.
+    Si el bloque todavía no está cubierto por una raíz retorna `None` y agenda
+    la sincronización del árbol: construirlo recorre la cadena, y la ruta que
+    llama a esta función es pública.
+    """
+    root = await load_merkle_root()
+    if root is None or int(root["tree_size"]) < block_number:
+        schedule_audit_merkle_sync()
+        return None
+
+    tree_size = int(root["tree_size"])
+    index = block_number - 1
+    nodes = await fetch_merkle_nodes(proof_node_keys(index, tree_size))
+    try:
+        path = inclusion_proof(index, tree_size, nodes)
+    except KeyError:
+        raise HTTPException(status_code=500, detail="Faltan nodos del árbol de Merkle de auditoría")
+
+    leaf = leaf_hash(block_hash)
+    return {
+        "leaf_index": index,
+        "tree_size": tree_size,
+        "leaf_hash": leaf.hex(),
+        "audit_path": [node.hex() for node in path],
+        "root_hash": root["root_hash"],
+        "root_signature": root["signature"],
+        "root_created_at": root.get("created_at"),
+        "included": verify_inclusion(leaf, index, tree_size, path, bytes.fromhex(root["root_hash"])),
+    }
+
+# ---- Sub-cadenas por entidad ----
+
+ANCHOR_ACTION = "ANCHOR_ENTITY_CHAINS"
+# Entidad (UUID nulo) de los bloques globales de anclaje
+ANCHOR_ENTITY_ID = "00000000-0000-0000-0000-000000000000"
+AUDIT_ANCHOR_BATCH_SIZE = 1000
+
+
+async def anchor_entity_chains() -> Optional[dict]:
+    """
+    Ancla en la cadena global las cabezas de sub-cadena que avanzaron desde el
+    último anclaje: un solo bloque `ANCHOR_ENTITY_CHAINS` por cada lote de
+    hasta AUDIT_ANCHOR_BATCH_SIZE entidades. Retorna el último bloque de anclaje.
+    """
+    anchor = None
+    while True:
+        response = await db_execute(
+            supabase.table("audit_entity_heads")
+            .select("entity_id, hash, block_number")
+            .eq("needs_anchor", True)
+            .order("entity_id")
+            .limit(AUDIT_ANCHOR_BATCH_SIZE)
+        )
+        heads = response.data or []
+        if not heads:
+            return anchor
+
+        payload = build_payload(
+            ANCHOR_ACTION,
+            ANCHOR_ENTITY_ID,
+            None,
+            datetime.utcnow().isoformat(),
+            {"heads": {head["entity_id"]: {"hash": head["hash"], "block_number": head["block_number"]} for head in heads}},
+        )
+        anchor = (await append_global_audit_blocks([payload]))[0]
+        await db_execute(
+            supabase.rpc(
+                "mark_entity_chains_anchored",
+                {
+                    "p_heads": [{"entity_id": head["entity_id"], "block_number": head["block_number"]} for head in heads],
+                    "p_anchor_block": anchor["block_number"],
+                },
+            )
+        )
+        if len(heads) < AUDIT_ANCHOR_BATCH_SIZE:
+            return anchor
+
+
+def schedule_entity_chain_anchor() -> None:
+    schedule_background_job("entity-anchor", AUDIT_ANCHOR_INTERVAL_SECONDS, anchor_entity_chains)
+
+
+async def verify_entity_chain(entity_id: str) -> dict:
+    """
+    Verifica la sub-cadena completa de una entidad, por páginas, y que su
+    último anclaje coincida con el bloque global que lo registró.
+    """
+    head = await db_execute(
+        supabase.table("audit_entity_heads")
+        .select("anchored_block_number, anchor_block")
+        .eq("entity_id", entity_id)
+        .limit(1)
+    )
+    anchored_number = (
+        int(head.data[0]["anchored_block_number"]) if head.data and head.data[0].get("anchor_block") else None
+    )
+
+    verifier = ChainVerifier(AUDIT_SECRET, max_reported=AUDIT_VERIFY_MAX_REPORTED)
+    loop = asyncio.get_running_loop()
+    local: Optional[dict] = None
+    async for rows in iter_audit_chain_pages(entity_id=entity_id):
+        await loop.run_in_executor(None, verifier.feed, rows)
+        if anchored_number is not None and local is None:
+            local = next((row for row in rows if int(row["block_number"]) == anchored_number), None)
+
+    anchor: Optional[dict] = None
+    if anchored_number is not None:
+        anchor_block = await db_execute(
+            supabase.table("audit_chain")
+            .select("block_number, action, metadata")
+            .eq("block_number", head.data[0]["anchor_block"])
+            .limit(1)
+        )
+        anchored = (
+            (anchor_block.data[0].get("metadata") or {}).get("heads", {}).get(entity_id)
+            if anchor_block.data and anchor_block.data[0]["action"] == ANCHOR_ACTION
+            else None
+        )
+        anchor = {
+            "global_block": head.data[0]["anchor_block"],
+            "block_number": anchored_number,
+            "matches": bool(anchored and local and anchored["hash"] == local["hash"]),
         }
-        
-        payload_str = json.dumps(payload, sort_keys=True)
-        content_hash = hashlib.sha256(payload_str.encode()).hexdigest()
-        
-        chain_data = f"{previous_hash}:{content_hash}"
-        expected_hash = hashlib.sha256(chain_data.encode()).hexdigest()
-        
-        # Verificar firma HMAC
-        expected_signature = hmac.new(
-            AUDIT_SECRET.encode(),
-            expected_hash.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if record["hash"] != expected_hash or record["signature"] != expected_signature:
-            corrupted.append({
-                "block_number": record["block_number"],
-                "hash": record["hash"],
-                "expected_hash": expected_hash
-            })
-        
-        previous_hash = record["hash"]
-    
+
     return {
-        "valid": len(corrupted) == 0,
-        "total_blocks": len(records.data),
-        "corrupted_blocks": corrupted
+        "valid": verifier.valid and (anchor is None or anchor["matches"]),
+        "verified_blocks": verifier.verified,
+        "corrupted_count": verifier.corrupted_count,
+        "corrupted_blocks": verifier.corrupted,
+        "anchor": anchor,
     }
 
-async def register_audit_event(action: str, entity_id: str, user_id: str, metadata: dict = None):
-    """Registra un evento en la cadena de auditoría"""
-    audit_data = generate_audit_hash(action, entity_id, user_id, metadata)
-    
-    # Guardar en base de datos
-    supabase.table("audit_chain").insert({
-        "hash": audit_data["hash"],
-        "content_hash": audit_data["content_hash"],
-        "previous_hash": audit_data["previous_hash"],
-        "signature": audit_data["signature"],
-        "action": action,
-        "entity_id": entity_id,
-        "user_id": user_id,
-        "timestamp": audit_data["payload"]["timestamp"],
-        "block_number": audit_data["block_number"],
-        "metadata": metadata or {}
-    }).execute()
-    
-    return audit_data
+
+def check_audit_payloads(payloads: List[dict]) -> None:
+    """422 si algún evento no cabe en la cadena (se valida antes de confirmarlo en el spool)."""
+    try:
+        for payload in payloads:
+            validate_payload(payload)
+    except AuditPayloadError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc))
+
+
+async def register_audit_event(
+    action: str,
+    entity_id: str,
+    user_id: str,
+    metadata: dict = None,
+    wait: bool = False,
+):
+    """
+    Registra un evento en la cadena de auditoría.
+    Con el spool activo el evento queda confirmado al escribirse en disco y se
+    encadena en segundo plano; `wait=True` espera hasta tener el bloque sellado.
+    """
+    payload = build_payload(action, entity_id, user_id, datetime.utcnow().isoformat(), metadata)
+
+    try:
+        if audit_pipeline is not None:
+            check_audit_payloads([payload])
+            return await audit_pipeline.submit(payload, wait=wait)
+        blocks = await append_audit_batch([payload])
+    except AuditChainContentionError as exc:
+        raise HTTPException(status_code=503, detail=f"No se pudo registrar la auditoría: {exc}")
+
+    return blocks[0]
+
+
+async def register_audit_events(payloads: List[dict]) -> List[dict]:
+    """
+    Registra varios eventos de una operación masiva. Con spool se escriben en
+    un solo bloque contiguo (un fsync); sin spool se encadenan y firman en un
+    solo lote (una lectura de la cabeza y un insert).
+    """
+    try:
+        if audit_pipeline is not None:
+            check_audit_payloads(payloads)
+            return await audit_pipeline.submit_many(payloads)
+        return await append_audit_batch(payloads)
+    except AuditChainContentionError as exc:
+        raise HTTPException(status_code=503, detail=f"No se pudo registrar la auditoría: {exc}")
 
 # ==================== AUTH ====================
 
@@ -407,39 +1184,90 @@ def ensure_allowed_role(raw_role: Optional[str]) -> str:
     return normalized_role
 
 
+def token_cache_key(token: str) -> str:
+    """Evita guardar el token en claro como llave de la caché."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def invalidate_user_auth_cache(user_id: str) -> None:
+    """Descarta el perfil y los tokens cacheados de un usuario."""
+    profile_cache.invalidate(user_id)
+    token_cache.invalidate_where(lambda _key, cached_user_id: cached_user_id == user_id)
+
+
+def clear_auth_caches() -> None:
+    token_cache.clear()
+    profile_cache.clear()
+
+
+async def load_user_profile(user_id: str) -> UserProfile:
+    """Construye el perfil autenticado a partir de la tabla users."""
+    user_data = await db_execute(supabase.table("users").select(
+        "id, nombre, email, rol, org_unit_id, org_units(nombre)"
+    ).eq("id", user_id).single())
+
+    data = user_data.data or {}
+
+    raw_role = data.get("rol")
+    normalized_role = ensure_allowed_role(raw_role)
+
+    org_unit_info = data.get("org_units") or {}
+    org_unit_nombre: Optional[str] = None
+
+    if isinstance(org_unit_info, dict):
+        org_unit_nombre = org_unit_info.get("nombre")
+
+    return UserProfile(
+        id=data["id"],
+        nombre=data["nombre"],
+        email=data["email"],
+        rol=normalized_role,
+        org_unit_id=data.get("org_unit_id"),
+        org_unit_nombre=org_unit_nombre,
+    )
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserProfile:
     """Obtener usuario autenticado desde JWT"""
     try:
         token = credentials.credentials
-        user_response = supabase.auth.get_user(token)
-        
-        if not user_response.user:
-            raise HTTPException(status_code=401, detail="Usuario no autenticado")
-        
+        token_key = token_cache_key(token)
+        user_id = token_cache.get(token_key)
+
+        if user_id is None:
+            token_ttl: Optional[float] = None
+
+            try:
+                claims = jwt_verifier.verify(token)
+            except TokenRejectedError as exc:
+                raise HTTPException(status_code=401, detail=str(exc))
+
+            if claims is not None:
+                user_id = claims["sub"]
+                if claims.get("exp"):
+                    token_ttl = float(claims["exp"]) - time.time()
+            else:
+                # Token que no se puede verificar localmente: consultar a Supabase
+                user_response = await run_db(supabase.auth.get_user, token)
+
+                if not user_response.user:
+                    raise HTTPException(status_code=401, detail="Usuario no autenticado")
+
+                user_id = user_response.user.id
+                # La firma ya la validó Supabase; el cache no debe sobrevivir al token
+                expiry = unverified_expiry(token)
+                if expiry is not None:
+                    token_ttl = expiry - time.time()
+
+            token_cache.set(token_key, user_id, ttl=token_ttl)
+
         # Obtener datos completos del usuario
-        user_data = supabase.table("users").select(
-            "id, nombre, email, rol, org_unit_id, org_units(nombre)"
-        ).eq("id", user_response.user.id).single().execute()
-        
-        data = user_data.data or {}
-
-        raw_role = data.get("rol")
-        normalized_role = ensure_allowed_role(raw_role)
-
-        org_unit_info = data.get("org_units") or {}
-        org_unit_nombre: Optional[str] = None
-
-        if isinstance(org_unit_info, dict):
-            org_unit_nombre = org_unit_info.get("nombre")
-            
-        return UserProfile(
-            id=data["id"],
-            nombre=data["nombre"],
-            email=data["email"],
-            rol=normalized_role,
-            org_unit_id=data.get("org_unit_id"),
-            org_unit_nombre=org_unit_nombre,
-        )
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            profile = await load_user_profile(user_id)
+            profile_cache.set(user_id, profile)
+
+        return profile
     except HTTPException:
         raise
     except Exception as e:
@@ -488,14 +1316,13 @@ def serialize_user_record(record: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def fetch_user_profile_by_id(user_id: str) -> Dict[str, Any]:
+async def fetch_user_profile_by_id(user_id: str) -> Dict[str, Any]:
     try:
-        response = (
+        response = await db_execute(
             supabase.table("users")
             .select("id, nombre, email, rol, activo, org_unit_id, org_units(nombre)")
             .eq("id", user_id)
             .limit(1)
-            .execute()
         )
     except HTTPException:
         raise
@@ -508,18 +1335,17 @@ def fetch_user_profile_by_id(user_id: str) -> Dict[str, Any]:
     return serialize_user_record(response.data[0])
 
 
-def get_inventory_permission_by_email(email: Optional[str]) -> Optional[dict]:
+async def get_inventory_permission_by_email(email: Optional[str]) -> Optional[dict]:
     normalized = normalize_email_value(email)
     if not normalized:
         return None
 
     try:
-        response = (
+        response = await db_execute(
             supabase.table("inventory_access_grants")
             .select("id, email, notes, granted_at, granted_by")
             .eq("email", normalized)
             .limit(1)
-            .execute()
         )
     except HTTPException:
         raise
@@ -531,8 +1357,8 @@ def get_inventory_permission_by_email(email: Optional[str]) -> Optional[dict]:
     return None
 
 
-def inventory_override_exists(email: Optional[str]) -> bool:
-    return get_inventory_permission_by_email(email) is not None
+async def inventory_override_exists(email: Optional[str]) -> bool:
+    return await get_inventory_permission_by_email(email) is not None
 
 
 def require_global_admin():
@@ -549,7 +1375,7 @@ def require_inventory_manager():
         if user.rol in ("TI", "LIDER_TI"):
             return user
 
-        if inventory_override_exists(user.email):
+        if await inventory_override_exists(user.email):
             return user
 
         raise HTTPException(status_code=403, detail="Permisos insuficientes")
@@ -558,6 +1384,58 @@ def require_inventory_manager():
 
 # ==================== ROUTES ====================
 
+# --- GET CONDICIONAL (ETags) ---
+
+VersionKey = Tuple[str, Optional[str]]
+
+
+async def fetch_change_version(resource: str, org_unit_id: Optional[str]) -> int:
+    """Versión de cambio de un recurso (None = todas las unidades), cacheada unos segundos."""
+    key = (resource, org_unit_id)
+    cached = change_version_cache.get(key)
+    if cached is not None:
+        return cached
+    query = supabase.table("change_versions").select("version").eq("resource", resource)
+    if org_unit_id is None:
+        query = query.is_("org_unit_id", "null")
+    else:
+        query = query.eq("org_unit_id", org_unit_id)
+    response = await db_execute(query.limit(1))
+    version = int(response.data[0]["version"]) if response.data else 0
+    change_version_cache.set(key, version)
+    return version
+
+
+def bump_change_version(resource: str, org_unit_id: Optional[str] = None) -> None:
+    """
+    Una escritura de este proceso descarta las versiones cacheadas del recurso
+    (la base ya las avanzó por trigger); las de otros procesos se notan al
+    vencer CHANGE_VERSION_TTL_SECONDS.
+    """
+    change_version_cache.invalidate((resource, None))
+    if org_unit_id is not None:
+        change_version_cache.invalidate((resource, org_unit_id))
+
+
+async def check_not_modified(
+    if_none_match: Optional[str],
+    keys: List[VersionKey],
+    variant: List[Any],
+    response: Response,
+) -> Optional[Response]:
+    """
+    Calcula el ETag sin consultar el listado. Retorna un 304 si coincide con
+    `If-None-Match`; si no, lo deja en los headers de `response`.
+    """
+    versions = await asyncio.gather(*(fetch_change_version(resource, org) for resource, org in keys))
+    etag = make_etag(versions, variant)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 @app.get("/")
 async def root():
     return {
@@ -581,20 +1459,29 @@ async def get_profile(user: UserProfile = Depends(get_current_user)):
 # --- ADMIN ---
 
 @app.get("/admin/users")
-async def admin_list_users(user: UserProfile = Depends(require_global_admin())):
+async def admin_list_users(
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    user: UserProfile = Depends(require_global_admin()),
+):
+    not_modified = await check_not_modified(
+        if_none_match, [("users", None), ("org_units", None)], ["admin_users"], response
+    )
+    if not_modified:
+        return not_modified
+
     try:
-        response = (
+        result = await db_execute(
             supabase.table("users")
             .select("id, nombre, email, rol, activo, org_unit_id, org_units(nombre)")
             .order("nombre")
-            .execute()
         )
     except HTTPException:
         raise
     except Exception as exc:
         raise HTTPException(status_code=503, detail=f"No se pudieron obtener los usuarios: {exc}")
 
-    records = [serialize_user_record(item) for item in (response.data or [])]
+    records = [serialize_user_record(item) for item in (result.data or [])]
     return {"data": records, "count": len(records)}
 
 
@@ -607,12 +1494,11 @@ async def admin_create_user(payload: AdminUserCreate, user: UserProfile = Depend
     normalized_role = ensure_allowed_role(payload.rol)
 
     try:
-        existing = (
+        existing = await db_execute(
             supabase.table("users")
             .select("id")
             .eq("email", normalized_email)
             .limit(1)
-            .execute()
         )
     except HTTPException:
         raise
@@ -623,7 +1509,7 @@ async def admin_create_user(payload: AdminUserCreate, user: UserProfile = Depend
         raise HTTPException(status_code=409, detail="El correo electrónico ya está registrado")
 
     try:
-        auth_response = supabase.auth.admin.create_user({
+        auth_response = await run_db(supabase.auth.admin.create_user, {
             "email": normalized_email,
             "password": payload.password,
             "email_confirm": True,
@@ -651,15 +1537,16 @@ async def admin_create_user(payload: AdminUserCreate, user: UserProfile = Depend
     }
 
     try:
-        supabase.table("users").insert(profile_payload).execute()
+        await db_execute(supabase.table("users").insert(profile_payload))
     except HTTPException:
         raise
     except Exception as exc:
         try:
-            supabase.auth.admin.delete_user(new_user.id)
+            await run_db(supabase.auth.admin.delete_user, new_user.id)
         except Exception:
             pass
         raise HTTPException(status_code=400, detail=f"No se pudo guardar el perfil del usuario: {exc}")
+    bump_change_version("users")
 
     await register_audit_event(
         "CREATE_USER",
@@ -673,7 +1560,7 @@ async def admin_create_user(payload: AdminUserCreate, user: UserProfile = Depend
         },
     )
 
-    return {"data": fetch_user_profile_by_id(new_user.id)}
+    return {"data": await fetch_user_profile_by_id(new_user.id)}
 
 
 @app.patch("/admin/users/{user_id}")
@@ -715,11 +1602,10 @@ async def admin_update_user(
 
     try:
         if updates:
-            response = (
+            response = await db_execute(
                 supabase.table("users")
                 .update(updates)
                 .eq("id", user_id)
-                .execute()
             )
 
             if not response.data:
@@ -731,26 +1617,37 @@ async def admin_update_user(
                 update_payload["user_metadata"] = metadata_updates
             if payload.password:
                 update_payload["password"] = payload.password
-            supabase.auth.admin.update_user_by_id(user_id, update_payload)
+            await run_db(supabase.auth.admin.update_user_by_id, user_id, update_payload)
     except HTTPException:
         raise
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"No se pudo actualizar el usuario: {exc}")
 
+    # Rol, unidad o estado pudieron cambiar: forzar la recarga del perfil
+    invalidate_user_auth_cache(user_id)
+    bump_change_version("users")
+
     if audit_metadata:
         await register_audit_event("UPDATE_USER", user_id, user.id, audit_metadata)
 
-    return {"data": fetch_user_profile_by_id(user_id)}
+    return {"data": await fetch_user_profile_by_id(user_id)}
 
 
 @app.get("/admin/org-units")
-async def admin_list_org_units(user: UserProfile = Depends(require_global_admin())):
+async def admin_list_org_units(
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    user: UserProfile = Depends(require_global_admin()),
+):
+    not_modified = await check_not_modified(if_none_match, [("org_units", None)], ["org_units"], response)
+    if not_modified:
+        return not_modified
+
     try:
-        response = (
+        result = await db_execute(
             supabase.table("org_units")
             .select("id, nombre")
             .order("nombre")
-            .execute()
         )
     except HTTPException:
         raise
@@ -760,98 +1657,354 @@ async def admin_list_org_units(user: UserProfile = Depends(require_global_admin(
             detail=f"No se pudieron obtener las unidades organizacionales: {exc}",
         )
 
-    data = response.data or []
+    data = result.data or []
     return {"data": data, "count": len(data)}
 
+@app.get("/admin/cache/stats")
+async def admin_cache_stats(user: UserProfile = Depends(require_global_admin())):
+    """Aciertos y fallos de las cachés en memoria del proceso"""
+    stats: Dict[str, Any] = {name: cache.stats() for name, cache in CACHES.items()}
+    stats["jwt_verifier"] = jwt_verifier.stats()
+    stats["dashboard_counters"] = metric_counters.stats()
+    stats["events"] = event_broker.stats()
+    return stats
+
 # --- INVENTORY ---
 
+DEVICE_USER_JOIN = "usuario_actual:users!usuario_actual_id(nombre, email)"
+
+# Campo público de `fields=` -> expresión de select
+DEVICE_LIST_FIELDS = {
+    **{column: column for column in (
+        "id", "nombre", "tipo", "estado", "org_unit_id", "usuario_actual_id", "ubicacion", "imagen",
+        "serial", "marca", "modelo", "fecha_ingreso", "fecha_garantia", "notas", "creado_en",
+        "actualizado_en",
+    )},
+    "usuario_actual": DEVICE_USER_JOIN,
+}
+
+# Órdenes admitidos: columnas NOT NULL/con default e indexadas junto con `id`
+DEVICE_SORT_COLUMNS = {"nombre", "creado_en", "actualizado_en"}
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def invalidate_device_counts(org_unit_id: Optional[str]) -> None:
+    """Un alta o cambio de dispositivo invalida los totales de su unidad y los globales."""
+    device_count_cache.invalidate_where(lambda key, _value: key[0] in (org_unit_id, None))
+
+
+async def count_devices(scope: Optional[str], filters: Dict[str, str], build_query) -> int:
+    """Total exacto del listado, cacheado por alcance y filtros para no contarlo en cada página."""
+    key = (scope, tuple(sorted(filters.items())))
+    cached = device_count_cache.get(key)
+    if cached is not None:
+        return cached
+    response = await db_execute(build_query(supabase.table("devices").select("id", count="exact")).limit(1))
+    total = response.count or 0
+    device_count_cache.set(key, total)
+    return total
+
+
 @app.get("/inventory/devices")
 async def list_devices(
+    response: Response,
     estado: Optional[str] = None,
     tipo: Optional[str] = None,
+    ubicacion: Optional[str] = None,
+    marca: Optional[str] = None,
+    modelo: Optional[str] = None,
+    sort: str = "nombre",
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
     user: UserProfile = Depends(get_current_user)
 ):
-    """Listar dispositivos (filtrados por org_unit del usuario)"""
-    query = supabase.table("devices").select(
-        "*, usuario_actual:users!usuario_actual_id(nombre, email)"
+    """
+    Listar dispositivos (filtrados por org_unit del usuario), paginados por
+    cursor sobre (`sort`, id). `sort` admite nombre, creado_en o
+    actualizado_en, con prefijo `-` para orden descendente. `ubicacion`,
+    `marca` y `modelo` buscan coincidencias parciales sin distinguir
+    mayúsculas. `count` es el total del listado filtrado, cacheado unos segundos.
+    """
+    limit = page_limit(limit)
+    descending = sort.startswith("-")
+    sort_column = sort.lstrip("-")
+    try:
+        if sort_column not in DEVICE_SORT_COLUMNS:
+            raise PaginationError(f"Orden no permitido: {sort}")
+        columns = select_columns(
+            fields,
+            DEVICE_LIST_FIELDS,
+            required=("id", sort_column),
+            default=f"*, {DEVICE_USER_JOIN}",
+        )
+        after = decode_cursor(cursor) if cursor else None
+    except PaginationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    scope = None if user.rol == "LIDER_TI" else user.org_unit_id
+    filters = {
+        key: value for key, value in (
+            ("estado", estado), ("tipo", tipo), ("ubicacion", ubicacion), ("marca", marca), ("modelo", modelo),
+        ) if value
+    }
+    not_modified = await check_not_modified(
+        if_none_match,
+        [("devices", scope), ("users", None)],
+        ["devices", scope, sorted(filters.items()), sort, fields, limit, cursor],
+        response,
     )
+    if not_modified:
+        return not_modified
 
-    if user.rol != "LIDER_TI":
-        query = query.eq("org_unit_id", user.org_unit_id)
-    
-    if estado:
-        query = query.eq("estado", estado)
-    if tipo:
-        query = query.eq("tipo", tipo)
-    
-    response = query.execute()
-    return {"data": response.data, "count": len(response.data)}
+    def apply_filters(query):
+        if user.rol != "LIDER_TI":
+            query = query.eq("org_unit_id", user.org_unit_id)
+        for column in ("estado", "tipo"):
+            if column in filters:
+                query = query.eq(column, filters[column])
+        for column in ("ubicacion", "marca", "modelo"):
+            if column in filters:
+                query = query.ilike(column, f"%{escape_like(filters[column])}%")
+        return query
+
+    query = apply_filters(supabase.table("devices").select(columns))
+    if after:
+        query = query.or_(keyset_condition(sort_column, after[0], after[1], descending=descending))
+    query = query.order(sort_column, desc=descending).order("id", desc=descending).limit(limit + 1)
+
+    result, total = await asyncio.gather(
+        db_execute(query),
+        count_devices(scope, filters, apply_filters),
+    )
+    data, next_cursor = split_page(result.data or [], limit, sort_column)
+    return {"data": data, "count": total, "next_cursor": next_cursor}
 
-@app.post("/inventory/devices", status_code=201)
-async def create_device(
-    device: DeviceCreate,
-    user: UserProfile = Depends(require_inventory_manager()),
-):
-    """Crear nuevo dispositivo (personal TI o Líder TI autorizado)"""
+def build_specs_payload(device_id: str, specs_data: Optional[dict]) -> Optional[dict]:
+    """Fila de `device_specs` a partir de `DeviceSpecsInput`, o `None` si no trae datos."""
+    if not specs_data:
+        return None
+
+    specs_payload = {
+        "device_id": device_id,
+        "cpu": specs_data.get("procesador"),
+        "cpu_velocidad": specs_data.get("procesador_velocidad"),
+        "ram": specs_data.get("memoria_tipo"),
+        "ram_capacidad": specs_data.get("memoria_capacidad"),
+        "disco": specs_data.get("disco_tipo"),
+        "disco_capacidad": specs_data.get("disco_capacidad"),
+    }
+
+    perifericos: dict[str, dict[str, Optional[str]]] = {}
+
+    for perif_name in ("teclado", "mouse"):
+        perif_data = specs_data.get(perif_name) or {}
+        if isinstance(perif_data, dict):
+            perif_clean = {k: v for k, v in perif_data.items() if v not in (None, "")}
+            if perif_clean:
+                perifericos[perif_name] = perif_clean
+
+    if perifericos:
+        specs_payload["perifericos"] = perifericos
+
+    specs_payload = {
+        key: value for key, value in specs_payload.items() if value not in (None, "", {})
+    }
+
+    return specs_payload if len(specs_payload.keys()) > 1 else None
+
+
+def new_device_payload(device: DeviceCreate, user: UserProfile) -> Tuple[dict, Optional[dict]]:
+    """Fila de `devices` (sin nulos, para que apliquen los defaults) y los datos de specs."""
     device_data = device.model_dump()
     specs_data = device_data.pop("specs", None)
     device_data = {k: v for k, v in device_data.items() if v is not None}
     device_data["org_unit_id"] = user.org_unit_id
     device_data["creado_por"] = user.id
     device_data["fecha_ingreso"] = datetime.utcnow().isoformat()
-    
-    response = supabase.table("devices").insert(device_data).execute()
-    device_id = response.data[0]["id"]
+    return device_data, specs_data
 
-    if specs_data:
-        specs_payload = {
-            "device_id": device_id,
-            "cpu": specs_data.get("procesador"),
-            "cpu_velocidad": specs_data.get("procesador_velocidad"),
-            "ram": specs_data.get("memoria_tipo"),
-            "ram_capacidad": specs_data.get("memoria_capacidad"),
-            "disco": specs_data.get("disco_tipo"),
-            "disco_capacidad": specs_data.get("disco_capacidad"),
-        }
 
-        perifericos: dict[str, dict[str, Optional[str]]] = {}
+def device_created(device: dict) -> None:
+    """Contadores, versiones y eventos tras el alta de un dispositivo."""
+    metric_counters.device_changed(device.get("org_unit_id"), None, device.get("estado"))
+    event_broker.publish(
+        "device.created",
+        {key: device.get(key) for key in ("id", "nombre", "tipo", "estado", "ubicacion")},
+        org_unit_id=device.get("org_unit_id"),
+    )
+
 
-        for perif_name in ("teclado", "mouse"):
-            perif_data = specs_data.get(perif_name) or {}
-            if isinstance(perif_data, dict):
-                perif_clean = {k: v for k, v in perif_data.items() if v not in (None, "")}
-                if perif_clean:
-                    perifericos[perif_name] = perif_clean
+@app.post("/inventory/devices", status_code=201)
+async def create_device(
+    device: DeviceCreate,
+    user: UserProfile = Depends(require_inventory_manager()),
+):
+    """Crear nuevo dispositivo (personal TI o Líder TI autorizado)"""
+    device_data, specs_data = new_device_payload(device, user)
 
-        if perifericos:
-            specs_payload["perifericos"] = perifericos
+    response = await db_execute(supabase.table("devices").insert(device_data))
+    device_id = response.data[0]["id"]
+    invalidate_device_counts(response.data[0].get("org_unit_id"))
+    bump_change_version("devices", response.data[0].get("org_unit_id"))
+    device_created(response.data[0])
 
-        specs_payload = {
-            key: value for key, value in specs_payload.items() if value not in (None, "", {})
-        }
+    specs_payload = build_specs_payload(device_id, specs_data)
+    if specs_payload:
+        await db_execute(supabase.table("device_specs").insert(specs_payload))
 
-        if len(specs_payload.keys()) > 1:
-            supabase.table("device_specs").insert(specs_payload).execute()
-            
     # Log de creación
-    "device_id": device_id,
-        "device_id": response.data[0]["id"],
+    await db_execute(supabase.table("device_logs").insert({
+        "device_id": device_id,
         "tipo": "OTRO",
         "descripcion": f"Dispositivo creado por {user.nombre}",
         "realizado_por": user.id
-    }).execute()
+    }))
 
     # Registrar en auditoría
     await register_audit_event(
         "CREATE_DEVICE",
         device_id,
-        response.data[0]["id"],
         user.id,
         {"device_name": device.nombre, "type": device.tipo}
     )
 
     return {"data": response.data[0], "message": "Dispositivo creado exitosamente"}
 
+async def insert_in_batches(table: str, payloads: List[dict]) -> Tuple[List[Optional[dict]], Dict[int, str]]:
+    """
+    Inserta en lotes de IMPORT_BATCH_SIZE filas. Si PostgREST rechaza un lote
+    por sus datos se reintenta fila por fila para aislar las filas inválidas.
+    Cualquier otro error (p. ej. un 504 por tiempo límite, tras el cual el lote
+    pudo quedar insertado) se propaga: reintentar duplicaría filas. Retorna las
+    filas insertadas alineadas con `payloads` (`None` si falló) y el error de
+    cada falla.
+    """
+    inserted: List[Optional[dict]] = [None] * len(payloads)
+    errors: Dict[int, str] = {}
+    for start in range(0, len(payloads), IMPORT_BATCH_SIZE):
+        batch = payloads[start:start + IMPORT_BATCH_SIZE]
+        try:
+            response = await db_execute(supabase.table(table).insert(uniform_rows(batch)))
+        except Exception as exc:
+            if not is_row_rejection(exc):
+                raise
+            logger.warning("Insert múltiple en %s rechazado, se reintenta por fila: %s", table, exc)
+        else:
+            if len(response.data or []) != len(batch):
+                # Sin una fila por payload no se puede saber cuál falta: los índices se correrían
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"Supabase retornó {len(response.data or [])} de {len(batch)} filas insertadas en {table}",
+                )
+            inserted[start:start + len(batch)] = response.data
+            continue
+        for offset, payload in enumerate(batch):
+            try:
+                response = await db_execute(supabase.table(table).insert(payload))
+                inserted[start + offset] = response.data[0]
+            except Exception as exc:
+                if not is_row_rejection(exc):
+                    raise
+                errors[start + offset] = str(exc)
+    return inserted, errors
+
+
+@app.post("/inventory/devices/import")
+async def import_devices(
+    request: Request,
+    user: UserProfile = Depends(require_inventory_manager()),
+):
+    """
+    Alta masiva de dispositivos desde JSON (lista de `DeviceCreate` o
+    `{"devices": [...]}`) o CSV (`Content-Type: text/csv`, columnas anidadas
+    como `specs.procesador` o `specs.teclado.serial`). Todas las filas se
+    validan antes de escribir; las inválidas o rechazadas por la base se
+    reportan por índice sin abortar el resto del lote.
+    """
+    try:
+        rows = parse_rows(request.headers.get("content-type", ""), await request.body(), "devices")
+    except BulkInputError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el máximo de {IMPORT_MAX_ROWS} filas",
+        )
+
+    valid, errors = validate_rows(rows, DeviceCreate)
+    payloads = [new_device_payload(device, user) for _, device in valid]
+
+    devices, device_errors = await insert_in_batches("devices", [device_data for device_data, _ in payloads])
+    errors += [{"index": valid[position][0], "errors": [message]} for position, message in device_errors.items()]
+
+    created = [
+        (valid[position][0], valid[position][1], device, payloads[position][1])
+        for position, device in enumerate(devices)
+        if device is not None
+    ]
+    if created:
+        specs_rows = [
+            specs for specs in (build_specs_payload(device["id"], specs_data) for _, _, device, specs_data in created)
+            if specs
+        ]
+        _, specs_errors = await insert_in_batches("device_specs", specs_rows)
+        index_by_device = {device["id"]: index for index, _, device, _ in created}
+        errors += [
+            {
+                "index": index_by_device[specs_rows[position]["device_id"]],
+                "errors": [f"Dispositivo creado sin especificaciones: {message}"],
+            }
+            for position, message in specs_errors.items()
+        ]
+
+        _, log_errors = await insert_in_batches("device_logs", [
+            {
+                "device_id": device["id"],
+                "tipo": "OTRO",
+                "descripcion": f"Dispositivo creado por {user.nombre} (importación)",
+                "realizado_por": user.id,
+            }
+            for _, _, device, _ in created
+        ])
+        errors += [
+            {"index": created[position][0], "errors": [f"Dispositivo creado sin registro de creación: {message}"]}
+            for position, message in log_errors.items()
+        ]
+
+        now = datetime.utcnow().isoformat()
+        await register_audit_events([
+            build_payload(
+                "CREATE_DEVICE",
+                device["id"],
+                user.id,
+                now,
+                {"device_name": row.nombre, "type": row.tipo, "import": True},
+            )
+            for _, row, device, _ in created
+        ])
+
+        for org_unit_id in {device.get("org_unit_id") for _, _, device, _ in created}:
+            invalidate_device_counts(org_unit_id)
+            bump_change_version("devices", org_unit_id)
+        for _, _, device, _ in created:
+            device_created(device)
+
+    errors.sort(key=lambda error: error["index"])
+    return {
+        "data": [{"index": index, "id": device["id"], "nombre": device.get("nombre")} for index, _, device, _ in created],
+        "errors": errors,
+        "total": len(rows),
+        "created": len(created),
+        "failed": len(rows) - len(created),
+        "message": f"{len(created)} de {len(rows)} dispositivos importados",
+    }
+
+
 @app.get("/inventory/devices/{device_id}/cv")
 async def get_device_cv(
     device_id: str,
@@ -864,33 +2017,37 @@ async def get_device_cv(
     if user.rol != "LIDER_TI":
         device_query = device_query.eq("org_unit_id", user.org_unit_id)
 
-    device = device_query.single().execute()
+    device = await db_execute(device_query.single())
     
     if not device.data:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     
-    # Obtener especificaciones
-    specs = supabase.table("device_specs").select("*").eq("device_id", device_id).execute()
-    
-    # Obtener historial
-    logs = supabase.table("device_logs").select(
-        "*, usuario:users!realizado_por(nombre)"
-    ).eq("device_id", device_id).order("fecha", desc=True).execute()
-    
-    # Obtener backups
-    backups = supabase.table("backups").select("*").eq("device_id", device_id).order(
-        "fecha_backup", desc=True
-    ).execute()
-    
-    # Obtener auditoría
-    audit = supabase.table("audit_chain").select("*").eq("entity_id", device_id).execute()
-    
+    # Especificaciones, historial, backups y auditoría no dependen entre sí:
+    # se consultan en paralelo una vez verificado el acceso al dispositivo.
+    specs, logs, backups, audit_page = await asyncio.gather(
+        db_execute(supabase.table("device_specs").select("*").eq("device_id", device_id)),
+        db_execute(
+            supabase.table("device_logs")
+            .select("*, usuario:users!realizado_por(nombre)")
+            .eq("device_id", device_id)
+            .order("fecha", desc=True)
+        ),
+        db_execute(
+            supabase.table("backups")
+            .select("*")
+            .eq("device_id", device_id)
+            .order("fecha_backup", desc=True)
+        ),
+        fetch_entity_audit_page(device_id),
+    )
+
     return {
         "device": device.data,
         "specs": specs.data[0] if specs.data else None,
         "logs": logs.data,
         "backups": backups.data,
-        "audit": audit.data
+        "audit": audit_page["data"],
+        "audit_next_cursor": audit_page["next_cursor"],
     }
 
 @app.put("/inventory/devices/{device_id}")
@@ -902,24 +2059,41 @@ async def update_device(
     """Actualizar dispositivo"""
     update_data = {k: v for k, v in updates.model_dump().items() if v is not None}
     update_data["actualizado_en"] = datetime.utcnow().isoformat()
+
+    # Estado anterior para mover los contadores del dashboard
+    previous = None
+    if updates.estado is not None:
+        previous = await db_execute(supabase.table("devices").select("estado").eq("id", device_id).limit(1))
     
     update_query = supabase.table("devices").update(update_data).eq("id", device_id)
 
     if user.rol != "LIDER_TI":
         update_query = update_query.eq("org_unit_id", user.org_unit_id)
 
-    response = update_query.execute()
+    response = await db_execute(update_query)
     
     if not response.data:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
+
+    invalidate_device_counts(response.data[0].get("org_unit_id"))
+    bump_change_version("devices", response.data[0].get("org_unit_id"))
+    if previous is not None and previous.data:
+        metric_counters.device_changed(
+            response.data[0].get("org_unit_id"), previous.data[0].get("estado"), updates.estado
+        )
+    event_broker.publish(
+        "device.updated",
+        {"id": device_id, "changes": update_data},
+        org_unit_id=response.data[0].get("org_unit_id"),
+    )
     
     # Log de actualización
-    supabase.table("device_logs").insert({
+    await db_execute(supabase.table("device_logs").insert({
         "device_id": device_id,
         "tipo": "OTRO",
         "descripcion": f"Dispositivo actualizado por {user.nombre}",
         "realizado_por": user.id
-    }).execute()
+    }))
     
     # Registrar en auditoría
     await register_audit_event(
@@ -938,7 +2112,7 @@ async def check_inventory_permission(user: UserProfile = Depends(get_current_use
     if user.rol in ("TI", "LIDER_TI"):
         return {"can_manage": True, "source": "role"}
 
-    override = get_inventory_permission_by_email(user.email)
+    override = await get_inventory_permission_by_email(user.email)
     if override:
         return {"can_manage": True, "source": "override", "permission": override}
 
@@ -949,11 +2123,10 @@ async def check_inventory_permission(user: UserProfile = Depends(get_current_use
 async def list_inventory_permissions(
     user: UserProfile = Depends(require_role(["LIDER_TI"]))
 ):
-    response = (
+    response = await db_execute(
         supabase.table("inventory_access_grants")
         .select("id, email, notes, granted_at, granted_by, granted_by_user:users!granted_by(nombre, email)")
         .order("email", desc=False)
-        .execute()
     )
     return {"data": response.data, "count": len(response.data)}
 
@@ -968,7 +2141,7 @@ async def create_inventory_permission(
     if not normalized_email or not EMAIL_REGEX.match(normalized_email):
         raise HTTPException(status_code=422, detail="Correo electrónico inválido")
 
-    if inventory_override_exists(normalized_email):
+    if await inventory_override_exists(normalized_email):
         raise HTTPException(status_code=409, detail="El correo ya tiene permisos especiales")
 
     payload = {
@@ -978,7 +2151,7 @@ async def create_inventory_permission(
         "granted_at": datetime.utcnow().isoformat(),
     }
 
-    response = supabase.table("inventory_access_grants").insert(payload).execute()
+    response = await db_execute(supabase.table("inventory_access_grants").insert(payload))
 
     created = response.data[0]
 
@@ -997,18 +2170,17 @@ async def delete_inventory_permission(
     permission_id: str,
     user: UserProfile = Depends(require_role(["LIDER_TI"]))
 ):
-    existing = (
+    existing = await db_execute(
         supabase.table("inventory_access_grants")
         .select("id, email")
         .eq("id", permission_id)
         .limit(1)
-        .execute()
     )
 
     if not existing.data:
         raise HTTPException(status_code=404, detail="Permiso no encontrado")
 
-    supabase.table("inventory_access_grants").delete().eq("id", permission_id).execute()
+    await db_execute(supabase.table("inventory_access_grants").delete().eq("id", permission_id))
 
     await register_audit_event(
         "REVOKE_INVENTORY_ACCESS",
@@ -1023,10 +2195,18 @@ async def delete_inventory_permission(
 
 @app.get("/backups")
 async def list_backups(
+    response: Response,
     device_id: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
     user: UserProfile = Depends(get_current_user)
 ):
     """Listar backups"""
+    not_modified = await check_not_modified(
+        if_none_match, [("backups", None), ("devices", None)], ["backups", device_id], response
+    )
+    if not_modified:
+        return not_modified
+
     query = supabase.table("backups").select(
         "*, device:devices!device_id(nombre, tipo)"
     )
@@ -1034,8 +2214,8 @@ async def list_backups(
     if device_id:
         query = query.eq("device_id", device_id)
     
-    response = query.order("fecha_backup", desc=True).execute()
-    return {"data": response.data}
+    result = await db_execute(query.order("fecha_backup", desc=True))
+    return {"data": result.data}
 
 @app.post("/backups", status_code=201)
 async def create_backup(
@@ -1047,15 +2227,27 @@ async def create_backup(
     backup_data["realizado_por"] = user.id
     backup_data["fecha_backup"] = datetime.utcnow().isoformat()
     
-    response = supabase.table("backups").insert(backup_data).execute()
+    response, device = await asyncio.gather(
+        db_execute(supabase.table("backups").insert(backup_data)),
+        db_execute(supabase.table("devices").select("org_unit_id").eq("id", backup.device_id).limit(1)),
+    )
+    # Los backups cuentan en la unidad del dispositivo (igual que get_backup_stats)
+    bump_change_version("backups", device.data[0].get("org_unit_id") if device.data else None)
+    if device.data:
+        metric_counters.backup_added(device.data[0].get("org_unit_id"), response.data[0].get("exitoso") is not False)
+        event_broker.publish(
+            "backup.created",
+            {"id": response.data[0].get("id"), "device_id": backup.device_id, "tipo": backup.tipo},
+            org_unit_id=device.data[0].get("org_unit_id"),
+        )
     
     # Log en device
-    supabase.table("device_logs").insert({
+    await db_execute(supabase.table("device_logs").insert({
         "device_id": backup.device_id,
         "tipo": "BACKUP",
         "descripcion": f"Backup {backup.tipo} realizado",
         "realizado_por": user.id
-    }).execute()
+    }))
     
     # Auditoría
     await register_audit_event(
@@ -1069,28 +2261,157 @@ async def create_backup(
 
 # --- TICKETS ---
 
+TICKET_USER_JOINS = "solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre)"
+
+# Campo público de `fields=` -> expresión de select
+TICKET_LIST_FIELDS = {
+    **{column: column for column in (
+        "id", "titulo", "descripcion", "prioridad", "estado", "org_unit_id", "solicitante_id",
+        "asignado_a", "device_id", "fecha_creacion", "fecha_asignacion", "fecha_resolucion",
+        "fecha_cierre", "tiempo_respuesta_minutos", "tiempo_resolucion_minutos",
+    )},
+    "solicitante": "solicitante:users!solicitante_id(nombre, email)",
+    "asignado": "asignado:users!asignado_a(nombre)",
+}
+
+
+# Ids por filtro `in` (~37 bytes por UUID en la URL del GET): 100 ids quedan
+# bajo los 8 KB que aceptan la mayoría de los gateways
+IN_FILTER_CHUNK_SIZE = 100
+
+
+async def fetch_rows_by_ids(table: str, columns: str, key: str, ids: List[str]) -> Dict[str, dict]:
+    """Filas de `table` cuyo `key` está en `ids`, en tandas de IN_FILTER_CHUNK_SIZE."""
+    rows: Dict[str, dict] = {}
+    for start in range(0, len(ids), IN_FILTER_CHUNK_SIZE):
+        response = await db_execute(
+            supabase.table(table).select(columns).in_(key, ids[start:start + IN_FILTER_CHUNK_SIZE])
+        )
+        rows.update((row[key], row) for row in response.data or [])
+    return rows
+
+
+def page_limit(limit: Optional[int]) -> int:
+    return min(max(limit or LIST_PAGE_SIZE, 1), LIST_MAX_PAGE_SIZE)
+
+
 @app.get("/tickets")
 async def list_tickets(
+    response: Response,
     estado: Optional[str] = None,
+    prioridad: Optional[str] = None,
+    asignado_a: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
     user: UserProfile = Depends(get_current_user)
 ):
-    """Listar tickets"""
-    if user.rol == "LIDER_TI":
-        query = supabase.table("tickets").select(
-            "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre)"
+    """
+    Listar tickets, del más reciente al más antiguo, paginados por cursor
+    sobre (fecha_creacion, id). `fields` limita las columnas retornadas.
+    """
+    limit = page_limit(limit)
+    staff = user.rol in ["LIDER_TI", "TI", "DIRECTOR"]
+    try:
+        columns = select_columns(
+            fields,
+            TICKET_LIST_FIELDS,
+            required=("id", "fecha_creacion"),
+            default=f"*, {TICKET_USER_JOINS}" if staff else "*",
         )
-    elif user.rol in ["TI", "DIRECTOR"]:
-        query = supabase.table("tickets").select(
-            "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre)"
-        ).eq("org_unit_id", user.org_unit_id)
-    else:
-        query = supabase.table("tickets").select("*").eq("solicitante_id", user.id)
+        after = decode_cursor(cursor) if cursor else None
+    except PaginationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    scope = None if user.rol == "LIDER_TI" else user.org_unit_id
+    not_modified = await check_not_modified(
+        if_none_match,
+        [("tickets", scope), ("users", None)],
+        # Quien no es personal TI solo ve sus tickets: su ETag no se comparte
+        ["tickets", scope, None if staff else user.id, estado, prioridad, asignado_a,
+         desde, hasta, fields, limit, cursor],
+        response,
+    )
+    if not_modified:
+        return not_modified
+
+    query = supabase.table("tickets").select(columns)
+    if user.rol in ["TI", "DIRECTOR"]:
+        query = query.eq("org_unit_id", user.org_unit_id)
+    elif not staff:
+        query = query.eq("solicitante_id", user.id)
     
     if estado:
         query = query.eq("estado", estado)
+    if prioridad:
+        query = query.eq("prioridad", prioridad)
+    if asignado_a:
+        query = query.eq("asignado_a", asignado_a)
+    if desde:
+        query = query.gte("fecha_creacion", desde.isoformat())
+    if hasta:
+        query = query.lt("fecha_creacion", hasta.isoformat())
+    if after:
+        query = query.or_(keyset_condition("fecha_creacion", after[0], after[1]))
     
-    response = query.order("fecha_creacion", desc=True).execute()
-    return {"data": response.data}
+    result = await db_execute(
+        query.order("fecha_creacion", desc=True).order("id", desc=True).limit(limit + 1)
+    )
+    data, next_cursor = split_page(result.data or [], limit, "fecha_creacion")
+    return {"data": data, "next_cursor": next_cursor}
+
+@app.get("/tickets/search")
+async def search_tickets(
+    q: str,
+    estado: Optional[Literal["ABIERTO", "EN_PROCESO", "RESUELTO", "CERRADO"]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user: UserProfile = Depends(get_current_user)
+):
+    """
+    Buscar tickets por título, descripción y comentarios (español, sin
+    distinguir tildes ni plurales), del más relevante al menos relevante.
+    Mismo alcance por rol que `list_tickets`; `cursor` pagina sobre
+    (relevancia, id).
+    """
+    query_text = q.strip()
+    if len(query_text) < 2:
+        raise HTTPException(status_code=400, detail="La búsqueda debe tener al menos 2 caracteres")
+    limit = page_limit(limit)
+    try:
+        after = decode_cursor(cursor) if cursor else [None, None]
+    except PaginationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    params = {
+        "p_query": query_text,
+        "p_org_unit_id": None,
+        "p_solicitante_id": None,
+        "p_estado": estado,
+        "p_limit": limit + 1,
+        "p_after_rank": after[0],
+        "p_after_id": after[1],
+    }
+    if user.rol in ["TI", "DIRECTOR"]:
+        if not user.org_unit_id:
+            # Sin unidad asignada no hay tickets visibles (NULL significaría "todas")
+            return {"data": [], "next_cursor": None}
+        params["p_org_unit_id"] = user.org_unit_id
+    elif user.rol != "LIDER_TI":
+        params["p_solicitante_id"] = user.id
+
+    response = await db_execute(supabase.rpc("search_tickets", params))
+    data, next_cursor = split_page(response.data or [], limit, "rank")
+    return {"data": data, "next_cursor": next_cursor}
+
+# Campos de un ticket que viajan en los eventos SSE
+TICKET_EVENT_FIELDS = (
+    "id", "titulo", "descripcion", "prioridad", "estado", "asignado_a", "solicitante_id", "fecha_creacion",
+)
+
 
 @app.post("/tickets", status_code=201)
 async def create_ticket(
@@ -1104,7 +2425,15 @@ async def create_ticket(
     ticket_data["estado"] = "ABIERTO"
     ticket_data["fecha_creacion"] = datetime.utcnow().isoformat()
     
-    response = supabase.table("tickets").insert(ticket_data).execute()
+    response = await db_execute(supabase.table("tickets").insert(ticket_data))
+    bump_change_version("tickets", user.org_unit_id)
+    metric_counters.ticket_changed(user.org_unit_id, None, ("ABIERTO", ticket.prioridad))
+    event_broker.publish(
+        "ticket.created",
+        {key: response.data[0].get(key) for key in TICKET_EVENT_FIELDS},
+        org_unit_id=user.org_unit_id,
+        owner_id=user.id,
+    )
     
     return {"data": response.data[0], "message": "Ticket creado exitosamente"}
 
@@ -1114,9 +2443,9 @@ async def get_ticket(
     user: UserProfile = Depends(get_current_user)
 ):
     """Obtener detalle de ticket con comentarios"""
-    ticket = supabase.table("tickets").select(
+    ticket = await db_execute(supabase.table("tickets").select(
         "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre), device:devices(nombre, tipo)"
-    ).eq("id", ticket_id).single().execute()
+    ).eq("id", ticket_id).single())
     
     if not ticket.data:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
@@ -1127,9 +2456,9 @@ async def get_ticket(
             raise HTTPException(status_code=403, detail="Acceso denegado")
     
     # Comentarios
-    comments = supabase.table("ticket_comments").select(
+    comments = await db_execute(supabase.table("ticket_comments").select(
         "*, usuario:users!usuario_id(nombre)"
-    ).eq("ticket_id", ticket_id).order("fecha", desc=False).execute()
+    ).eq("ticket_id", ticket_id).order("fecha", desc=False))
     
     return {
         "ticket": ticket.data,
@@ -1144,11 +2473,33 @@ async def update_ticket(
 ):
     """Actualizar ticket (solo TI)"""
     update_data = {k: v for k, v in updates.model_dump().items() if v is not None}
+
+    # Estado y prioridad anteriores para mover los contadores del dashboard
+    previous = None
+    if updates.estado is not None or updates.prioridad is not None:
+        previous = await db_execute(
+            supabase.table("tickets").select("estado, prioridad").eq("id", ticket_id).limit(1)
+        )
     
-    response = supabase.table("tickets").update(update_data).eq("id", ticket_id).execute()
+    response = await db_execute(supabase.table("tickets").update(update_data).eq("id", ticket_id))
     
     if not response.data:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
+
+    ticket = response.data[0]
+    bump_change_version("tickets", ticket.get("org_unit_id"))
+    if previous is not None and previous.data:
+        metric_counters.ticket_changed(
+            ticket.get("org_unit_id"),
+            (previous.data[0].get("estado"), previous.data[0].get("prioridad")),
+            (ticket.get("estado"), ticket.get("prioridad")),
+        )
+    event_broker.publish(
+        "ticket.updated",
+        {key: ticket.get(key) for key in TICKET_EVENT_FIELDS},
+        org_unit_id=ticket.get("org_unit_id"),
+        owner_id=ticket.get("solicitante_id"),
+    )
     
     # Si se cierra, registrar en auditoría
     if updates.estado in ["RESUELTO", "CERRADO"]:
@@ -1161,6 +2512,75 @@ async def update_ticket(
     
     return {"data": response.data[0], "message": "Ticket actualizado"}
 
+@app.post("/tickets/bulk-update")
+async def bulk_update_tickets(
+    bulk: TicketBulkUpdate,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))
+):
+    """
+    Aplicar los mismos cambios a varios tickets con un update filtrado por id
+    por cada tanda de IN_FILTER_CHUNK_SIZE ids. Los cierres se auditan en un solo lote encadenado y la respuesta
+    trae el resultado de cada ticket pedido.
+    """
+    update_data = {k: v for k, v in bulk.changes.model_dump().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No hay cambios para aplicar")
+    ticket_ids = list(dict.fromkeys(bulk.ids))
+
+    # Estado y prioridad anteriores (para los contadores) y alcance del usuario.
+    # Los ids van en tandas de IN_FILTER_CHUNK_SIZE para no exceder el largo de URL.
+    previous: Dict[str, dict] = {}
+    updated: Dict[str, dict] = {}
+    for start in range(0, len(ticket_ids), IN_FILTER_CHUNK_SIZE):
+        chunk = ticket_ids[start:start + IN_FILTER_CHUNK_SIZE]
+        previous_query = supabase.table("tickets").select("id, estado, prioridad").in_("id", chunk)
+        if user.rol != "LIDER_TI":
+            previous_query = previous_query.eq("org_unit_id", user.org_unit_id)
+        previous_response = await db_execute(previous_query)
+        found = [row["id"] for row in previous_response.data or []]
+        if not found:
+            continue
+        previous.update((row["id"], row) for row in previous_response.data)
+        response = await db_execute(supabase.table("tickets").update(update_data).in_("id", found))
+        updated.update((ticket["id"], ticket) for ticket in response.data or [])
+
+    for ticket in updated.values():
+        old = previous[ticket["id"]]
+        metric_counters.ticket_changed(
+            ticket.get("org_unit_id"),
+            (old.get("estado"), old.get("prioridad")),
+            (ticket.get("estado"), ticket.get("prioridad")),
+        )
+        event_broker.publish(
+            "ticket.updated",
+            {key: ticket.get(key) for key in TICKET_EVENT_FIELDS},
+            org_unit_id=ticket.get("org_unit_id"),
+            owner_id=ticket.get("solicitante_id"),
+        )
+    for org_unit_id in {ticket.get("org_unit_id") for ticket in updated.values()}:
+        bump_change_version("tickets", org_unit_id)
+
+    if updated and bulk.changes.estado in ["RESUELTO", "CERRADO"]:
+        now = datetime.utcnow().isoformat()
+        await register_audit_events([
+            build_payload("CLOSE_TICKET", ticket_id, user.id, now, {"final_status": bulk.changes.estado})
+            for ticket_id in ticket_ids
+            if ticket_id in updated
+        ])
+
+    results = [
+        {"id": ticket_id, "status": "updated", "data": updated[ticket_id]}
+        if ticket_id in updated
+        else {"id": ticket_id, "status": "not_found", "error": "Ticket no encontrado"}
+        for ticket_id in ticket_ids
+    ]
+    return {
+        "data": results,
+        "updated": len(updated),
+        "failed": len(ticket_ids) - len(updated),
+        "message": f"{len(updated)} de {len(ticket_ids)} tickets actualizados",
+    }
+
 @app.post("/tickets/{ticket_id}/comments")
 async def add_comment(
     ticket_id: str,
@@ -1176,46 +2596,327 @@ async def add_comment(
         "fecha": datetime.utcnow().isoformat()
     }
     
-    response = supabase.table("ticket_comments").insert(comment_data).execute()
+    response = await db_execute(supabase.table("ticket_comments").insert(comment_data))
     
     return {"data": response.data[0], "message": "Comentario agregado"}
 
+# --- EXPORTACIONES ---
+
+DEVICE_EXPORT_COLUMNS = (
+    "id", "nombre", "tipo", "estado", "org_unit_id", "usuario_actual_id", "ubicacion", "serial",
+    "marca", "modelo", "fecha_ingreso", "fecha_garantia", "notas", "creado_en", "actualizado_en",
+)
+DEVICE_SPECS_EXPORT_COLUMNS = (
+    "cpu", "cpu_velocidad", "ram", "ram_capacidad", "disco", "disco_capacidad", "os",
+    "licencias", "red", "perifericos", "otros",
+)
+TICKET_EXPORT_COLUMNS = tuple(
+    column for column, expression in TICKET_LIST_FIELDS.items() if column == expression
+)
+
+
+async def iter_keyset_pages(build_query, sort_column: str, page_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Recorre una consulta completa por páginas, en orden (sort_column, id), sin
+    offset. Termina solo con una página vacía: una página corta puede ser el
+    recorte de `max-rows` de PostgREST.
+    """
+    after: Optional[List[Any]] = None
+    while True:
+        query = build_query()
+        if after:
+            query = query.or_(keyset_condition(sort_column, after[0], after[1], descending=False))
+        response = await db_execute(query.order(sort_column).order("id").limit(page_size))
+        rows = response.data or []
+        if not rows:
+            return
+        yield rows
+        after = [rows[-1][sort_column], rows[-1]["id"]]
+
+
+async def iter_device_export_pages(
+    build_query, flat: bool
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Dispositivos con sus especificaciones, leídas por tandas de ids de cada página."""
+    async for devices in iter_keyset_pages(build_query, "nombre", EXPORT_PAGE_SIZE):
+        specs_by_device = await fetch_rows_by_ids(
+            "device_specs",
+            ", ".join(("device_id",) + DEVICE_SPECS_EXPORT_COLUMNS),
+            "device_id",
+            [device["id"] for device in devices],
+        )
+        for device in devices:
+            specs = specs_by_device.get(device["id"]) or {}
+            specs = {column: specs.get(column) for column in DEVICE_SPECS_EXPORT_COLUMNS} if specs else None
+            if flat:
+                device.update({f"specs_{column}": (specs or {}).get(column) for column in DEVICE_SPECS_EXPORT_COLUMNS})
+            else:
+                device["specs"] = specs
+        yield devices
+
+
+def export_response(
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    format: str,
+    columns: List[str],
+    gzip: bool,
+    basename: str,
+) -> StreamingResponse:
+    media_type, extension = FORMATS[format]
+    chunks = encode_pages(pages, format, columns)
+    filename = f"{basename}-{datetime.utcnow():%Y%m%d}.{extension}"
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        gzip_chunks(chunks) if gzip else utf8_chunks(chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/export/devices")
+async def export_devices(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = True,
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI", "DIRECTOR"])),
+):
+    """
+    Exportar el inventario con sus especificaciones en NDJSON o CSV (gzip por
+    defecto). Se lee y se envía por páginas de EXPORT_PAGE_SIZE filas.
+    """
+    def build_query():
+        query = supabase.table("devices").select(", ".join(DEVICE_EXPORT_COLUMNS))
+        if user.rol != "LIDER_TI":
+            query = query.eq("org_unit_id", user.org_unit_id)
+        if estado:
+            query = query.eq("estado", estado)
+        if tipo:
+            query = query.eq("tipo", tipo)
+        return query
+
+    columns = list(DEVICE_EXPORT_COLUMNS) + [f"specs_{column}" for column in DEVICE_SPECS_EXPORT_COLUMNS]
+    return export_response(
+        iter_device_export_pages(build_query, flat=format == "csv"), format, columns, gzip, "dispositivos"
+    )
+
+
+@app.get("/export/tickets")
+async def export_tickets(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = True,
+    estado: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI", "DIRECTOR"])),
+):
+    """Exportar tickets (por fecha de creación) en NDJSON o CSV, gzip por defecto."""
+    def build_query():
+        query = supabase.table("tickets").select(", ".join(TICKET_EXPORT_COLUMNS))
+        if user.rol != "LIDER_TI":
+            query = query.eq("org_unit_id", user.org_unit_id)
+        if estado:
+            query = query.eq("estado", estado)
+        if desde:
+            query = query.gte("fecha_creacion", desde.isoformat())
+        if hasta:
+            query = query.lt("fecha_creacion", hasta.isoformat())
+        return query
+
+    return export_response(
+        iter_keyset_pages(build_query, "fecha_creacion", EXPORT_PAGE_SIZE),
+        format,
+        list(TICKET_EXPORT_COLUMNS),
+        gzip,
+        "tickets",
+    )
+
+# --- EVENTOS (SSE) ---
+
+async def stream_events(user: UserProfile) -> AsyncIterator[str]:
+    """Eventos SSE para el usuario, con keep-alive mientras no haya cambios."""
+    # Se suscribe al empezar a transmitir para que una conexión que nunca
+    # llega a abrirse no deje una suscripción huérfana
+    subscription = event_broker.subscribe(
+        user.org_unit_id,
+        see_all=user.rol == "LIDER_TI",
+        # Quien no es personal TI solo recibe sus propios tickets
+        user_id=None if user.rol in ["TI", "LIDER_TI", "DIRECTOR"] else user.id,
+    )
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event.type == RESYNC_EVENT:
+                subscription.overflowed = False
+            yield format_sse(event)
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+@app.get("/events")
+async def subscribe_events(user: UserProfile = Depends(get_current_user)):
+    """
+    Cambios de tickets, dispositivos, backups y contadores del dashboard como
+    Server-Sent Events, limitados a la unidad del usuario (todas para Líder
+    TI). Un evento `resync` indica que se perdieron eventos y hay que recargar.
+    """
+    return StreamingResponse(
+        stream_events(user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- DASHBOARD ---
 
-@app.get("/dashboard/metrics")
-async def get_metrics(user: UserProfile = Depends(get_current_user)):
-    """Obtener métricas del dashboard"""
-    # Dispositivos
-    devices_query = supabase.table("devices").select("estado", count="exact")
-    if user.rol != "LIDER_TI":
-        devices_query = devices_query.eq("org_unit_id", user.org_unit_id)
-    devices = devices_query.execute()
-    
-    # Tickets
-    tickets_query = supabase.table("tickets").select("estado, prioridad", count="exact")
-    if user.rol != "LIDER_TI":
-        tickets_query = tickets_query.eq("org_unit_id", user.org_unit_id)
-    tickets = tickets_query.execute()
-    
-    # Backups
-    backups = supabase.table("backups").select("id", count="exact").execute()
-    
+def first_stats_row(data: Any) -> Dict[str, Any]:
+    """Las funciones `RETURNS TABLE` llegan como lista de una fila."""
+    if isinstance(data, list):
+        return data[0] if data else {}
+    return data or {}
+
+
+def as_count(value: Any) -> int:
+    return int(value or 0)
+
+
+def as_minutes(value: Any) -> Optional[float]:
+    return round(float(value), 1) if value is not None else None
+
+
+async def load_dashboard_stats(org_unit_id: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """
+    Conteos agrupados calculados en SQL (`get_device_stats`, `get_ticket_stats`,
+    `get_backup_stats`); `org_unit_id=None` agrega todas las unidades.
+    """
+    params = {"p_org_unit_id": org_unit_id}
+    devices, tickets, backups = await asyncio.gather(
+        db_execute(supabase.rpc("get_device_stats", params)),
+        db_execute(supabase.rpc("get_ticket_stats", params)),
+        db_execute(supabase.rpc("get_backup_stats", params)),
+    )
+    return first_stats_row(devices.data), first_stats_row(tickets.data), first_stats_row(backups.data)
+
+
+async def reconcile_metric_counters(org_unit_id: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Vuelve a sembrar los contadores de una unidad desde la base de datos."""
+    version = metric_counters.version(org_unit_id)
+    rows = await load_dashboard_stats(org_unit_id)
+    metric_counters.seed(org_unit_id, rows, version)
+    return rows
+
+
+async def fetch_dashboard_metrics(org_unit_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Métricas desde los contadores en memoria. Solo la primera lectura de una
+    unidad consulta la base; las reconciliaciones posteriores corren en
+    segundo plano mientras se sirven los conteos vigentes.
+    """
+    rows = metric_counters.snapshot(org_unit_id, allow_stale=True)
+    if rows is None:
+        rows = await reconcile_metric_counters(org_unit_id)
+    elif metric_counters.is_stale(org_unit_id):
+        schedule_background_job(
+            f"metrics:{org_unit_id}",
+            0,
+            lambda: reconcile_metric_counters(org_unit_id),
+        )
+    return build_dashboard_metrics(*rows)
+
+
+def build_dashboard_metrics(devices: Dict[str, Any], tickets: Dict[str, Any], backups: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "dispositivos": {
-            "total": devices.count,
-            "activos": len([d for d in devices.data if d["estado"] == "ACTIVO"]),
-            "reparacion": len([d for d in devices.data if d["estado"] == "REPARACIÓN"])
+            "total": as_count(devices.get("total")),
+            "activos": as_count(devices.get("activos")),
+            "reparacion": as_count(devices.get("reparacion")),
+            "retirados": as_count(devices.get("retirados")),
         },
         "tickets": {
-            "total": tickets.count,
-            "abiertos": len([t for t in tickets.data if t["estado"] == "ABIERTO"]),
-            "en_proceso": len([t for t in tickets.data if t["estado"] == "EN_PROCESO"])
+            "total": as_count(tickets.get("total")),
+            "abiertos": as_count(tickets.get("abiertos")),
+            "en_proceso": as_count(tickets.get("en_proceso")),
+            "resueltos": as_count(tickets.get("resueltos")),
+            "cerrados": as_count(tickets.get("cerrados")),
+            "por_prioridad": {
+                "BAJA": as_count(tickets.get("prioridad_baja")),
+                "MEDIA": as_count(tickets.get("prioridad_media")),
+                "ALTA": as_count(tickets.get("prioridad_alta")),
+                "CRITICA": as_count(tickets.get("prioridad_critica")),
+            },
+            "tiempo_promedio_respuesta_min": as_minutes(tickets.get("tiempo_promedio_respuesta")),
+            "tiempo_promedio_resolucion_min": as_minutes(tickets.get("tiempo_promedio_resolucion")),
         },
         "backups": {
-            "total": backups.count
-        }
+            "total": as_count(backups.get("total")),
+            "fallidos": as_count(backups.get("fallidos")),
+        },
     }
 
+
+@app.get("/dashboard/metrics")
+async def get_metrics(user: UserProfile = Depends(get_current_user)):
+    """Obtener métricas del dashboard"""
+    if user.rol == "LIDER_TI":
+        return await fetch_dashboard_metrics(None)
+    if not user.org_unit_id:
+        # Sin unidad asignada no hay nada que contar (NULL significaría "todas")
+        return build_dashboard_metrics({}, {}, {})
+    return await fetch_dashboard_metrics(user.org_unit_id)
+
+
+@app.get("/dashboard/tickets/series")
+async def get_ticket_series(
+    granularity: Literal["hour", "day"] = "day",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    org_unit_id: Optional[str] = None,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI", "DIRECTOR"])),
+):
+    """
+    Tickets abiertos, resueltos y cerrados por bucket y percentiles del tiempo
+    de resolución, leídos de `ticket_rollups` (buckets en UTC). Por defecto:
+    últimos 30 días por día o últimas 48 horas por hora.
+    """
+    end = as_utc(hasta) if hasta else datetime.now(timezone.utc)
+    start = as_utc(desde) if desde else end - (timedelta(days=30) if granularity == "day" else timedelta(hours=48))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'")
+    if bucket_count(start, end, granularity) > TICKET_SERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El rango supera {TICKET_SERIES_MAX_BUCKETS} buckets; use una granularidad mayor",
+        )
+
+    if user.rol != "LIDER_TI":
+        # Solo el Líder TI consulta otras unidades o el agregado global
+        if not user.org_unit_id:
+            return build_ticket_series([], start, end, granularity)
+        org_unit_id = user.org_unit_id
+
+    # Una fila por bucket, sumada en SQL: sin importar cuántas unidades haya,
+    # la respuesta no pasa de TICKET_SERIES_MAX_BUCKETS filas
+    response = await db_execute(
+        supabase.rpc(
+            "get_ticket_rollup_series",
+            {
+                "p_granularity": granularity,
+                "p_desde": bucket_start(start, granularity).isoformat(),
+                "p_hasta": end.isoformat(),
+                "p_org_unit_id": org_unit_id,
+            },
+        )
+    )
+    series = build_ticket_series(response.data or [], start, end, granularity)
+    series["org_unit_id"] = org_unit_id
+    return series
+
 # --- AUDIT CHAIN ---
 
 @app.post("/audit/hash")
@@ -1226,7 +2927,8 @@ async def generate_hash(
     user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))
 ):
     """Generar y registrar hash en cadena de auditoría"""
-    audit_data = await register_audit_event(action, entity_id, user.id, metadata)
+    check_audit_payloads([build_payload(action, entity_id, user.id, "", metadata)])
+    audit_data = await register_audit_event(action, entity_id, user.id, metadata, wait=True)
     return {
         "hash": audit_data["hash"],
         "signature": audit_data["signature"],
@@ -1236,41 +2938,93 @@ async def generate_hash(
 
 @app.get("/audit/verify/{hash}")
 async def verify_hash(hash: str):
-    """Verificar hash en cadena de auditoría"""
-    response = supabase.table("audit_chain").select("*").eq("hash", hash).single().execute()
-    
+    """
+    Verificar hash en cadena de auditoría. Si no está en la cadena global se
+    busca en las sub-cadenas por entidad (AUDIT_ENTITY_CHAINS), cuyos bloques
+    no tienen prueba de Merkle propia: quedan cubiertos por su anclaje.
+    """
+    response = await db_execute(supabase.table("audit_chain").select("*").eq("hash", hash).limit(1))
+    entity_chain = False
+    if not response.data:
+        response = await db_execute(
+            supabase.table("audit_entity_chain").select("*").eq("hash", hash).limit(1)
+        )
+        entity_chain = True
+
     if not response.data:
         return {"valid": False, "message": "Hash no encontrado"}
+    block = response.data[0]
     
     # Verificar firma HMAC
-    expected_signature = hmac.new(
-        AUDIT_SECRET.encode(),
-        hash.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    
-    signature_valid = response.data["signature"] == expected_signature
+    expected_signature = sign_chain_hash(AUDIT_SECRET, hash)
     
+    signature_valid = block["signature"] == expected_signature
+
+    # Prueba de que el bloque forma parte de la cadena publicada (raíz de Merkle firmada)
+    merkle_proof = None
+    if not entity_chain:
+        merkle_proof = await build_audit_inclusion_proof(int(block["block_number"]), hash)
+
     return {
         "valid": signature_valid,
-        "data": response.data,
-        "verified": signature_valid
+        "data": block,
+        "verified": signature_valid,
+        "entity_chain": entity_chain,
+        "merkle_proof": merkle_proof,
     }
 
 @app.get("/audit/chain/verify")
-async def verify_chain(user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))):
-    """Verificar integridad de toda la cadena de auditoría"""
-    result = verify_audit_chain()
+async def verify_chain(
+    full: bool = False,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI"])),
+):
+    """Verificar integridad de la cadena (incremental desde el último checkpoint o completa)"""
+    result = await verify_audit_chain(full=full, user_id=user.id)
     return result
 
+@app.get("/audit/chain/verify/stream")
+async def verify_chain_stream(
+    full: bool = False,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI"])),
+):
+    """Verificar la cadena reportando el progreso por página (NDJSON)"""
+    async def body():
+        async for event in iter_audit_chain_verification(full=full, user_id=user.id):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.post("/audit/merkle/sync")
+async def sync_audit_merkle_tree_now(user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))):
+    """Publicar ya la raíz de Merkle con los bloques que aún no cubre"""
+    root = await sync_audit_merkle_tree()
+    if root is None:
+        root = await load_merkle_root()
+    return {"tree_size": int(root["tree_size"]) if root else 0, "root_hash": root["root_hash"] if root else None}
+
+@app.post("/audit/entity-chains/anchor")
+async def anchor_entity_chains_now(user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))):
+    """Anclar ya en la cadena global las sub-cadenas por entidad pendientes"""
+    if not AUDIT_ENTITY_CHAINS:
+        raise HTTPException(status_code=400, detail="Las sub-cadenas por entidad no están habilitadas")
+    anchor = await anchor_entity_chains()
+    return {"anchored": anchor is not None, "block_number": anchor["block_number"] if anchor else None}
+
 @app.get("/audit/entity/{entity_id}")
-async def get_entity_audit(entity_id: str, user: UserProfile = Depends(get_current_user)):
-    """Obtener historial de auditoría de una entidad"""
-    response = supabase.table("audit_chain").select("*").eq("entity_id", entity_id).order(
-        "block_number", desc=True
-    ).execute()
-    
-    return {"data": response.data, "count": len(response.data)}
+async def get_entity_audit(
+    entity_id: str,
+    limit: Optional[int] = None,
+    before: Optional[int] = None,
+    include_metadata: bool = False,
+    verify: bool = False,
+    user: UserProfile = Depends(get_current_user),
+):
+    """Obtener historial de auditoría de una entidad (paginado por block_number)"""
+    page = await fetch_entity_audit_page(entity_id, limit, before, include_metadata)
+    if verify and AUDIT_ENTITY_CHAINS:
+        # Una sub-cadena corta: se lee y se verifica completa
+        return {**page, "chain": await verify_entity_chain(entity_id)}
+    return page
 
 if Mangum:
     handler = Mangum(app)
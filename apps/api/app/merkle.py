@@ -0,0 +1,152 @@
+"""Árbol de Merkle (estilo RFC 6962) sobre los bloques de la cadena de auditoría.
+
+Las hojas son los hashes encadenados de `audit_chain` en orden de
+`block_number` (hoja i = bloque i + 1). Solo se persisten subárboles
+perfectos, identificados por (nivel, índice): el nodo (l, i) cubre las hojas
+[i * 2^l, (i + 1) * 2^l). Cualquier otro subárbol se reconstruye a partir de
+ellos, por lo que agregar hojas nunca reescribe nodos existentes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+NodeKey = Tuple[int, int]
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(block_hash: str) -> bytes:
+    return hashlib.sha256(LEAF_PREFIX + bytes.fromhex(block_hash)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _largest_power_of_two_below(n: int) -> int:
+    """Mayor potencia de dos estrictamente menor que n (n > 1)."""
+    return 1 << ((n - 1).bit_length() - 1)
+
+
+def perfect_nodes(start: int, end: int) -> List[NodeKey]:
+    """Descompone el rango [start, end) en subárboles perfectos, de izquierda a derecha."""
+    size = end - start
+    if size <= 0:
+        return []
+    if size & (size - 1) == 0 and start % size == 0:
+        level = size.bit_length() - 1
+        return [(level, start >> level)]
+    split = _largest_power_of_two_below(size)
+    return perfect_nodes(start, start + split) + perfect_nodes(start + split, end)
+
+
+def range_root(start: int, end: int, nodes: Dict[NodeKey, bytes]) -> bytes:
+    """Raíz RFC 6962 de las hojas [start, end) usando nodos perfectos ya conocidos."""
+    size = end - start
+    if size & (size - 1) == 0 and start % size == 0:
+        level = size.bit_length() - 1
+        return nodes[(level, start >> level)]
+    split = _largest_power_of_two_below(size)
+    return node_hash(range_root(start, start + split, nodes), range_root(start + split, end, nodes))
+
+
+def proof_ranges(index: int, size: int) -> List[Tuple[int, int]]:
+    """Rangos de hojas cuyas raíces forman la prueba de inclusión (de la hoja a la raíz)."""
+    if not 0 <= index < size:
+        raise ValueError("La hoja está fuera del árbol")
+    ranges: List[Tuple[int, int]] = []
+    start, end = 0, size
+    while end - start > 1:
+        split = _largest_power_of_two_below(end - start)
+        if index < start + split:
+            ranges.append((start + split, end))
+            end = start + split
+        else:
+            ranges.append((start, start + split))
+            start = start + split
+    ranges.reverse()
+    return ranges
+
+
+def proof_node_keys(index: int, size: int) -> List[NodeKey]:
+    """Nodos persistidos necesarios para construir la prueba de una hoja."""
+    keys: List[NodeKey] = []
+    for start, end in proof_ranges(index, size):
+        keys.extend(perfect_nodes(start, end))
+    return keys
+
+
+def inclusion_proof(index: int, size: int, nodes: Dict[NodeKey, bytes]) -> List[bytes]:
+    return [range_root(start, end, nodes) for start, end in proof_ranges(index, size)]
+
+
+def verify_inclusion(leaf: bytes, index: int, size: int, proof: Sequence[bytes], root: bytes) -> bool:
+    """Verificación de una prueba de inclusión (algoritmo de RFC 9162, sección 2.1.3.2)."""
+    if not 0 <= index < size:
+        return False
+    fn, sn = index, size - 1
+    current = leaf
+    for sibling in proof:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            current = node_hash(sibling, current)
+            if not fn & 1:
+                while fn & 1 == 0 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            current = node_hash(current, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and current == root
+
+
+class MerkleFrontier:
+    """Borde derecho del árbol: las raíces de los subárboles perfectos completos.
+
+    Permite agregar hojas y calcular la raíz en O(log n) sin leer el resto del
+    árbol. `append` retorna los nodos perfectos nuevos para persistirlos.
+    """
+
+    def __init__(self, size: int = 0, nodes: Optional[Dict[NodeKey, bytes]] = None) -> None:
+        self.size = size
+        # Un subárbol por bit encendido de `size`, del más grande al más pequeño
+        self._stack: List[Tuple[int, bytes]] = [
+            (level, (nodes or {})[(level, index)]) for level, index in perfect_nodes(0, size)
+        ]
+
+    @staticmethod
+    def node_keys(size: int) -> List[NodeKey]:
+        return perfect_nodes(0, size)
+
+    def append(self, leaf: bytes) -> List[Tuple[int, int, bytes]]:
+        created = [(0, self.size, leaf)]
+        level, current = 0, leaf
+        index = self.size
+        while self._stack and self._stack[-1][0] == level:
+            _, left = self._stack.pop()
+            current = node_hash(left, current)
+            level += 1
+            index >>= 1
+            created.append((level, index, current))
+        self._stack.append((level, current))
+        self.size += 1
+        return created
+
+    def extend(self, leaves: Iterable[bytes]) -> List[Tuple[int, int, bytes]]:
+        created: List[Tuple[int, int, bytes]] = []
+        for leaf in leaves:
+            created.extend(self.append(leaf))
+        return created
+
+    def root(self) -> Optional[bytes]:
+        if not self._stack:
+            return None
+        current = self._stack[-1][1]
+        for _, left in reversed(self._stack[:-1]):
+            current = node_hash(left, current)
+        return current
@@ -0,0 +1,160 @@
+"""Contadores del dashboard mantenidos en memoria por unidad organizacional."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEVICE_ESTADO_FIELDS = {"ACTIVO": "activos", "REPARACIÓN": "reparacion", "RETIRADO": "retirados"}
+TICKET_ESTADO_FIELDS = {
+    "ABIERTO": "abiertos",
+    "EN_PROCESO": "en_proceso",
+    "RESUELTO": "resueltos",
+    "CERRADO": "cerrados",
+}
+TICKET_PRIORIDAD_FIELDS = {
+    "BAJA": "prioridad_baja",
+    "MEDIA": "prioridad_media",
+    "ALTA": "prioridad_alta",
+    "CRITICA": "prioridad_critica",
+}
+
+# Secciones de las filas sembradas, con el nombre que tienen en el dashboard
+SECTIONS = ("dispositivos", "tickets", "backups")
+
+StatsRows = Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]
+DeltaListener = Callable[[Optional[str], Dict[str, Any]], None]
+
+
+class MetricCounters:
+    """Conteos por unidad organizacional sembrados desde la base de datos.
+
+    Cada unidad guarda las filas de `get_device_stats`, `get_ticket_stats` y
+    `get_backup_stats`, y las rutas de escritura les aplican deltas; la clave
+    `None` acumula todas las unidades. Una entrada con más de
+    `reconcile_interval` segundos debe volver a sembrarse para recoger las
+    escrituras de otros procesos y los tiempos promedio, que no se mantienen
+    de forma incremental.
+
+    Cada delta incrementa la versión de su unidad: una siembra se descarta si
+    la versión cambió mientras se consultaba la base, porque no se puede saber
+    si la consulta ya incluía ese cambio. `listener`, si se indica, recibe
+    cada delta con la forma de `build_dashboard_metrics`.
+    """
+
+    def __init__(self, reconcile_interval: float = 60.0, listener: Optional[DeltaListener] = None) -> None:
+        self.reconcile_interval = reconcile_interval
+        self.listener = listener
+        self._units: Dict[Optional[str], Tuple[float, StatsRows]] = {}
+        self._versions: Dict[Optional[str], int] = {}
+        self._lock = threading.Lock()
+        self.seeds = 0
+        self.discarded_seeds = 0
+        self.deltas = 0
+
+    def version(self, org_unit_id: Optional[str]) -> int:
+        with self._lock:
+            return self._versions.get(org_unit_id, 0)
+
+    def snapshot(self, org_unit_id: Optional[str], allow_stale: bool = False) -> Optional[StatsRows]:
+        """Copia de los conteos, o `None` si la unidad no está sembrada (o venció)."""
+        with self._lock:
+            entry = self._units.get(org_unit_id)
+            if entry is None:
+                return None
+            seeded_at, rows = entry
+            if not allow_stale and time.monotonic() - seeded_at > self.reconcile_interval:
+                return None
+            return tuple(dict(row) for row in rows)  # type: ignore[return-value]
+
+    def is_stale(self, org_unit_id: Optional[str]) -> bool:
+        with self._lock:
+            entry = self._units.get(org_unit_id)
+            return entry is None or time.monotonic() - entry[0] > self.reconcile_interval
+
+    def seed(self, org_unit_id: Optional[str], rows: StatsRows, version: int) -> bool:
+        """Reemplaza los conteos si no hubo deltas desde que se leyó `version`."""
+        with self._lock:
+            if self._versions.get(org_unit_id, 0) != version:
+                self.discarded_seeds += 1
+                return False
+            self._units[org_unit_id] = (time.monotonic(), tuple(dict(row) for row in rows))  # type: ignore[assignment]
+            self.seeds += 1
+            return True
+
+    def _apply(self, org_unit_id: Optional[str], section: int, changes: Iterable[Tuple[str, int]]) -> None:
+        changes = [(field, delta) for field, delta in changes if delta]
+        if not changes:
+            return
+        with self._lock:
+            self.deltas += 1
+            for key in {org_unit_id, None}:
+                self._versions[key] = self._versions.get(key, 0) + 1
+                entry = self._units.get(key)
+                if entry is None:
+                    continue
+                row = entry[1][section]
+                for field, delta in changes:
+                    row[field] = int(row.get(field) or 0) + delta
+        if self.listener is not None:
+            self.listener(org_unit_id, dashboard_delta(section, changes))
+
+    def device_changed(self, org_unit_id: Optional[str], old_estado: Optional[str], new_estado: Optional[str]) -> None:
+        """Alta (`old_estado=None`) o cambio de estado de un dispositivo."""
+        changes = [("total", 1 if old_estado is None else 0)]
+        if old_estado != new_estado:
+            changes += _transition(DEVICE_ESTADO_FIELDS, old_estado, new_estado)
+        self._apply(org_unit_id, 0, changes)
+
+    def ticket_changed(
+        self,
+        org_unit_id: Optional[str],
+        old: Optional[Tuple[Optional[str], Optional[str]]],
+        new: Tuple[Optional[str], Optional[str]],
+    ) -> None:
+        """Alta (`old=None`) o cambio de un ticket; `old`/`new` son (estado, prioridad)."""
+        old_estado, old_prioridad = old or (None, None)
+        new_estado, new_prioridad = new
+        changes = [("total", 1 if old is None else 0)]
+        if old_estado != new_estado:
+            changes += _transition(TICKET_ESTADO_FIELDS, old_estado, new_estado)
+        if old_prioridad != new_prioridad:
+            changes += _transition(TICKET_PRIORIDAD_FIELDS, old_prioridad, new_prioridad)
+        self._apply(org_unit_id, 1, changes)
+
+    def backup_added(self, org_unit_id: Optional[str], exitoso: bool) -> None:
+        self._apply(org_unit_id, 2, [("total", 1), ("fallidos", 0 if exitoso else 1)])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._units.clear()
+            self._versions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "units": len(self._units),
+                "seeds": self.seeds,
+                "discarded_seeds": self.discarded_seeds,
+                "deltas": self.deltas,
+                "reconcile_interval": self.reconcile_interval,
+            }
+
+
+def dashboard_delta(section: int, changes: List[Tuple[str, int]]) -> Dict[str, Any]:
+    """Traduce deltas de columnas SQL a las claves de las métricas del dashboard."""
+    delta: Dict[str, Any] = {}
+    for field, value in changes:
+        if field.startswith("prioridad_"):
+            delta.setdefault("por_prioridad", {})[field[len("prioridad_"):].upper()] = value
+        else:
+            delta[field] = value
+    return {SECTIONS[section]: delta}
+
+
+def _transition(fields: Dict[str, str], old: Optional[str], new: Optional[str]):
+    if old in fields:
+        yield fields[old], -1
+    if new in fields:
+        yield fields[new], 1
@@ -0,0 +1,83 @@
+"""Paginación por cursor (keyset) y proyección de columnas para los listados.
+
+Un cursor codifica los valores de la última fila entregada en el orden del
+listado (columna de orden y `id` como desempate). La página siguiente se pide
+con una condición `or` de PostgREST sobre esos valores, de modo que el costo
+de cada página depende del tamaño de página y no de cuántas filas quedaron
+atrás, a diferencia de `offset`.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+
+class PaginationError(ValueError):
+    """Cursor, orden o proyección inválidos; las rutas lo traducen a 400."""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 2) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise PaginationError("Cursor inválido") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise PaginationError("Cursor inválido")
+    return values
+
+
+def quote_value(value: Any) -> str:
+    """Valor para un filtro lógico de PostgREST (comillas si trae , . : o paréntesis)."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def keyset_condition(column: str, value: Any, last_id: Any, descending: bool = True) -> str:
+    """Filas estrictamente posteriores a (`value`, `last_id`) en el orden dado."""
+    op = "lt" if descending else "gt"
+    return (
+        f"{column}.{op}.{quote_value(value)},"
+        f"and({column}.eq.{quote_value(value)},id.{op}.{quote_value(last_id)})"
+    )
+
+
+def select_columns(
+    fields: Optional[str],
+    allowed: Mapping[str, str],
+    required: Iterable[str],
+    default: str,
+) -> str:
+    """
+    Traduce `fields=a,b` a la lista de `select`. `allowed` asocia cada campo
+    público con su expresión (columna o relación embebida); las columnas de
+    `required` (las del cursor) se agregan siempre.
+    """
+    if not fields:
+        return default
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise PaginationError(f"Campos no permitidos: {', '.join(unknown)}")
+    names = list(dict.fromkeys([*required, *requested]))
+    return ", ".join(allowed[name] for name in names)
+
+
+def split_page(
+    rows: List[Dict[str, Any]],
+    limit: int,
+    sort_column: str,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Recorta la fila extra pedida (`limit + 1`) y arma el cursor siguiente."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor([last[sort_column], last["id"]])
@@ -0,0 +1,141 @@
+"""Series de tiempo de tickets a partir de los acumulados por hora y por día.
+
+Las filas de `ticket_rollups` las mantiene el trigger `ticket_rollups_trigger`
+(ver infra/supabase.sql). Aquí solo se combinan los buckets de un rango, se
+suman las unidades organizacionales y se estiman percentiles a partir de los
+histogramas de tiempo de resolución.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Límites superiores (en minutos) de los intervalos del histograma de
+# resolución; el último intervalo no tiene límite. Deben coincidir con
+# `ticket_resolution_bin` en infra/supabase.sql.
+RESOLUTION_BIN_EDGES = (15, 30, 60, 120, 240, 480, 1440, 2880, 4320, 10080, 20160, 43200)
+RESOLUTION_BINS = len(RESOLUTION_BIN_EDGES) + 1
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+PERCENTILES = (50, 90, 95)
+COUNTERS = ("abiertos", "resueltos", "cerrados")
+
+
+def resolution_bin(minutes: float) -> int:
+    """Índice (desde 1, como los arreglos de Postgres) del intervalo de `minutes`."""
+    return bisect_right(RESOLUTION_BIN_EDGES, minutes) + 1
+
+
+def as_utc(value: datetime) -> datetime:
+    """Fechas sin zona horaria se interpretan en UTC, como los buckets."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    value = as_utc(value)
+    if granularity == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def parse_bucket(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return as_utc(value)
+    return as_utc(datetime.fromisoformat(str(value).replace("Z", "+00:00")))
+
+
+def bucket_count(start: datetime, end: datetime, granularity: str) -> int:
+    """Cantidad de buckets de `bucket_range` sin construir la lista."""
+    span = as_utc(end) - bucket_start(start, granularity)
+    step = GRANULARITIES[granularity]
+    return max(-(-span // step), 0)
+
+
+def bucket_range(start: datetime, end: datetime, granularity: str) -> List[datetime]:
+    """Inicios de bucket que cubren `[start, end)`."""
+    step = GRANULARITIES[granularity]
+    current = bucket_start(start, granularity)
+    end = as_utc(end)
+    buckets = []
+    while current < end:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def histogram_percentile(histogram: Sequence[int], percentile: float) -> Optional[float]:
+    """
+    Estima el percentil interpolando linealmente dentro del intervalo que lo
+    contiene. Para el último intervalo, abierto, retorna su límite inferior.
+    """
+    total = sum(histogram)
+    if total == 0:
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = RESOLUTION_BIN_EDGES[index - 1] if index > 0 else 0
+            if index >= len(RESOLUTION_BIN_EDGES):
+                return float(lower)
+            upper = RESOLUTION_BIN_EDGES[index]
+            return round(lower + (upper - lower) * (rank - seen) / count, 1)
+        seen += count
+    return float(RESOLUTION_BIN_EDGES[-1])
+
+
+def merge_histograms(target: List[int], histogram: Optional[Iterable[int]]) -> None:
+    for index, count in enumerate(histogram or ()):
+        if index < len(target):
+            target[index] += int(count or 0)
+
+
+def percentiles(histogram: Sequence[int]) -> Dict[str, Optional[float]]:
+    return {f"p{p}": histogram_percentile(histogram, p) for p in PERCENTILES}
+
+
+def build_ticket_series(
+    rows: Iterable[Dict[str, Any]],
+    start: datetime,
+    end: datetime,
+    granularity: str,
+) -> Dict[str, Any]:
+    """
+    Serie continua (incluye buckets vacíos) sumando las filas de todas las
+    unidades que caigan en el mismo bucket, más el resumen del rango.
+    """
+    buckets = {
+        bucket: {"counts": dict.fromkeys(COUNTERS, 0), "histogram": [0] * RESOLUTION_BINS}
+        for bucket in bucket_range(start, end, granularity)
+    }
+    totals = dict.fromkeys(COUNTERS, 0)
+    total_histogram = [0] * RESOLUTION_BINS
+
+    for row in rows:
+        entry = buckets.get(parse_bucket(row["bucket"]))
+        if entry is None:
+            continue
+        for counter in COUNTERS:
+            value = int(row.get(counter) or 0)
+            entry["counts"][counter] += value
+            totals[counter] += value
+        merge_histograms(entry["histogram"], row.get("resolucion_hist"))
+        merge_histograms(total_histogram, row.get("resolucion_hist"))
+
+    series = []
+    for bucket, entry in buckets.items():
+        point: Dict[str, Any] = {"bucket": bucket.isoformat(), **entry["counts"]}
+        point["resolucion_min"] = percentiles(entry["histogram"])
+        series.append(point)
+
+    return {
+        "granularity": granularity,
+        "desde": as_utc(start).isoformat(),
+        "hasta": as_utc(end).isoformat(),
+        "series": series,
+        "resumen": {**totals, "resolucion_min": percentiles(total_histogram)},
+    }
@@ -0,0 +1,87 @@
+"""Benchmark: serialización canónica y verificación de bloques, antes y ahora.
+
+Compara el camino anterior (diccionario + `json.dumps(sort_keys=True)` +
+`hmac.new`) con `encode_payload_fields` / `verify_block_batch`.
+
+Uso (desde apps/api):
+
+    python -m benchmarks.bench_audit_canonical --sizes 10000 100000 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+from typing import Callable, List
+
+from app.audit import GENESIS_HASH, compact_block, encode_payload_fields, verify_block_batch
+
+from .bench_audit_verify import SECRET, synthetic_chain
+
+
+def legacy_encode(blocks: List[tuple]) -> None:
+    for _, _, _, action, entity_id, user_id, timestamp, metadata in blocks:
+        payload = {
+            "action": action,
+            "entity_id": entity_id,
+            "user_id": user_id,
+            "timestamp": timestamp,
+            "data": metadata or {},
+        }
+        json.dumps(payload, sort_keys=True).encode()
+
+
+def fast_encode(blocks: List[tuple]) -> None:
+    for _, _, _, action, entity_id, user_id, timestamp, metadata in blocks:
+        encode_payload_fields(action, entity_id, user_id, timestamp, metadata or {})
+
+
+def legacy_verify(blocks: List[tuple]) -> None:
+    previous_hash = GENESIS_HASH
+    for _, stored_hash, signature, action, entity_id, user_id, timestamp, metadata in blocks:
+        payload = {
+            "action": action,
+            "entity_id": entity_id,
+            "user_id": user_id,
+            "timestamp": timestamp,
+            "data": metadata or {},
+        }
+        content_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        expected_hash = hashlib.sha256(f"{previous_hash}:{content_hash}".encode()).hexdigest()
+        expected_signature = hmac.new(SECRET.encode(), expected_hash.encode(), hashlib.sha256).hexdigest()
+        assert stored_hash == expected_hash and signature == expected_signature
+        previous_hash = stored_hash
+
+
+def fast_verify(blocks: List[tuple]) -> None:
+    assert verify_block_batch(SECRET, GENESIS_HASH, blocks) == []
+
+
+def timed(func: Callable[[List[tuple]], None], blocks: List[tuple]) -> float:
+    started = time.perf_counter()
+    func(blocks)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'bloques':>10} {'etapa':>14} {'anterior (s)':>13} {'nuevo (s)':>10} {'aceleración':>12}")
+    for size in args.sizes:
+        blocks = [compact_block(record) for record in synthetic_chain(size)]
+        for stage, legacy, fast in (
+            ("serialización", legacy_encode, fast_encode),
+            ("verificación", legacy_verify, fast_verify),
+        ):
+            before = timed(legacy, blocks)
+            after = timed(fast, blocks)
+            print(f"{size:>10,} {stage:>14} {before:>13.2f} {after:>10.2f} {before / after:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark: verificación fuera de línea de una exportación binaria de auditoría.
+
+Uso (desde apps/api):
+
+    python -m benchmarks.bench_audit_export --blocks 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from app.audit_export import AuditExportWriter, verify_export
+
+from .bench_audit_verify import SECRET, synthetic_chain
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"Generando cadena sintética de {args.blocks:,} bloques...")
+    records = synthetic_chain(args.blocks)
+
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = str(Path(directory) / "audit")
+        started = time.perf_counter()
+        with AuditExportWriter(prefix) as writer:
+            for start in range(0, len(records), args.page_size):
+                writer.append(records[start:start + args.page_size])
+        exported = time.perf_counter() - started
+        size = sum(path.stat().st_size for path in Path(directory).iterdir())
+        print(f"Exportación: {exported:8.2f} s  ({size / args.blocks:.0f} bytes/bloque)")
+        del records
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        for label, secret in (("encadenamiento", None), ("con firmas", SECRET)):
+            started = time.perf_counter()
+            result = verify_export(prefix, secret=secret)
+            elapsed = time.perf_counter() - started
+            assert result["valid"] and result["total_blocks"] == args.blocks
+            print(f"Verificación ({label}): {elapsed:8.2f} s  ({args.blocks / elapsed:,.0f} bloques/s)")
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"Memoria máxima adicional al verificar: {max(rss_after - rss_before, 0) / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark: verificación de la cadena de auditoría en uno y varios núcleos.
+
+Uso (desde apps/api):
+
+    python -m benchmarks.bench_audit_verify --blocks 1000000 --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.audit import ChainVerifier, GENESIS_HASH, ParallelChainVerifier, build_payload, seal_block
+
+SECRET = "benchmark-secret"
+
+
+def synthetic_chain(blocks: int) -> list[dict]:
+    records = []
+    previous_hash = GENESIS_HASH
+    for number in range(1, blocks + 1):
+        payload = build_payload(
+            "UPDATE_DEVICE",
+            f"00000000-0000-0000-0000-{number % 5000:012d}",
+            "11111111-1111-1111-1111-111111111111",
+            f"2025-01-01T00:00:00.{number % 1000000:06d}",
+            {"changes": {"estado": "ACTIVO", "ubicacion": f"Sala {number % 40}"}},
+        )
+        sealed = seal_block(payload, previous_hash, SECRET)
+        records.append({
+            "block_number": number,
+            "hash": sealed["hash"],
+            "signature": sealed["signature"],
+            "action": payload["action"],
+            "entity_id": payload["entity_id"],
+            "user_id": payload["user_id"],
+            "timestamp": payload["timestamp"],
+            "metadata": payload["data"],
+        })
+        previous_hash = sealed["hash"]
+    return records
+
+
+def timed(verifier: ChainVerifier, records: list[dict], page_size: int) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(records), page_size):
+        verifier.feed(records[start:start + page_size])
+    elapsed = time.perf_counter() - started
+    assert verifier.valid and verifier.verified == len(records)
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunk-size", type=int, default=2500)
+    args = parser.parse_args()
+
+    print(f"Generando cadena sintética de {args.blocks:,} bloques...")
+    records = synthetic_chain(args.blocks)
+    page_size = args.workers * args.chunk_size
+
+    single = timed(ChainVerifier(SECRET), records, page_size)
+    print(f"1 núcleo:   {single:8.2f} s  ({args.blocks / single:,.0f} bloques/s)")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        verifier = ParallelChainVerifier(SECRET, pool, chunk_size=args.chunk_size)
+        parallel = timed(verifier, records, page_size)
+    print(f"{args.workers} procesos: {parallel:8.2f} s  ({args.blocks / parallel:,.0f} bloques/s)")
+    print(f"Aceleración: x{single / parallel:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+import copy
+import os
+import re
+import sys
+import unicodedata
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+
+supabase_stub = SimpleNamespace(
+    create_client=lambda _url, _key: SimpleNamespace(),
+    Client=SimpleNamespace,
+)
+sys.modules.setdefault("supabase", supabase_stub)
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+os.environ.setdefault("SUPABASE_URL", "http://test.local")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE", "test-key")
+os.environ.setdefault("JWT_SECRET", "secret")
+
+
+class FakeQuery:
+    """Imita el query builder de postgrest-py sobre listas en memoria."""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._single = False
+        self._count = None
+        self._operation = "select"
+        self._payload = None
+        self._columns = ("*",)
+
+    def select(self, *columns, count=None):
+        self._count = count
+        self._columns = columns
+        return self
+
+    def insert(self, payload):
+        self._operation = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict="id", ignore_duplicates=False):
+        self._operation = "upsert"
+        self._payload = payload
+        self._conflict_columns = [column.strip() for column in on_conflict.split(",")]
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload):
+        self._operation = "update"
+        self._payload = payload
+        return self
+
+    def delete(self):
+        self._operation = "delete"
+        return self
+
+    def _filter(self, predicate):
+        self._filters.append(predicate)
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: row.get(column) == value)
+
+    def neq(self, column, value):
+        return self._filter(lambda row: row.get(column) != value)
+
+    def gt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) > value)
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) >= value)
+
+    def lt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) < value)
+
+    def lte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) <= value)
+
+    def is_(self, column, value):
+        expected = None if value == "null" else value
+        return self._filter(lambda row: row.get(column) is expected)
+
+    def ilike(self, column, pattern):
+        regex = re.compile(_like_regex(pattern), re.IGNORECASE | re.DOTALL)
+        return self._filter(lambda row: row.get(column) is not None and regex.fullmatch(row.get(column)) is not None)
+
+    def or_(self, filters):
+        return self._filter(_logic_predicate("or", filters))
+
+    def in_(self, column, values):
+        allowed = list(values)
+        return self._filter(lambda row: row.get(column) in allowed)
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def _matching(self):
+        rows = self._db.tables.setdefault(self._table, [])
+        return [row for row in rows if all(predicate(row) for predicate in self._filters)]
+
+    def execute(self):
+        self._db.record(self._table, self._operation)
+        rows = self._db.tables.setdefault(self._table, [])
+
+        if self._operation == "insert":
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            inserted = []
+            for item in payload:
+                row = copy.deepcopy(item)
+                row.setdefault("id", str(uuid.uuid4()))
+                rows.append(row)
+                inserted.append(copy.deepcopy(row))
+            self._db.track_changes(self._table, inserted)
+            return SimpleNamespace(data=inserted, count=None)
+
+        if self._operation == "upsert":
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            written = []
+            for item in payload:
+                key = tuple(item.get(column) for column in self._conflict_columns)
+                existing = next(
+                    (row for row in rows if tuple(row.get(column) for column in self._conflict_columns) == key),
+                    None,
+                )
+                if existing is None:
+                    existing = copy.deepcopy(item)
+                    rows.append(existing)
+                elif self._ignore_duplicates:
+                    continue
+                else:
+                    existing.update(copy.deepcopy(item))
+                written.append(copy.deepcopy(existing))
+            return SimpleNamespace(data=written, count=None)
+
+        matching = self._matching()
+
+        if self._operation == "update":
+            for row in matching:
+                row.update(copy.deepcopy(self._payload))
+            self._db.track_changes(self._table, matching)
+            return SimpleNamespace(data=copy.deepcopy(matching), count=None)
+
+        if self._operation == "delete":
+            for row in matching:
+                rows.remove(row)
+            self._db.track_changes(self._table, matching)
+            return SimpleNamespace(data=copy.deepcopy(matching), count=None)
+
+        total = len(matching)
+        for column, desc in reversed(self._order):
+            matching.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self._limit is not None:
+            matching = matching[: self._limit]
+        if self._db.max_rows is not None:
+            # `max-rows` de PostgREST: recorta sin avisar, aunque se pida más
+            matching = matching[: self._db.max_rows]
+        data = [_project(row, self._columns) for row in copy.deepcopy(matching)]
+        if self._single:
+            data = data[0] if data else None
+        return SimpleNamespace(data=data, count=total if self._count else None)
+
+
+def _like_regex(pattern):
+    parts, escaped = [], False
+    for char in pattern:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return "".join(parts)
+
+
+_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+}
+
+
+def _split_terms(expression):
+    """Separa por comas de primer nivel, respetando comillas y paréntesis."""
+    terms, depth, quoted, current = [], 0, False, ""
+    previous = ""
+    for char in expression:
+        if char == '"' and previous != "\\":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            terms.append(current)
+            current = ""
+        else:
+            current += char
+        previous = char
+    terms.append(current)
+    return terms
+
+
+def _logic_predicate(kind, expression):
+    """Subconjunto de los filtros lógicos de PostgREST: `col.op.valor`, and(...), or(...)."""
+    predicates = []
+    for term in _split_terms(expression):
+        for nested in ("and", "or"):
+            if term.startswith(f"{nested}(") and term.endswith(")"):
+                predicates.append(_logic_predicate(nested, term[len(nested) + 1:-1]))
+                break
+        else:
+            column, operator, value = term.split(".", 2)
+            if value.startswith('"') and value.endswith('"'):
+                value = value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+            compare = _OPERATORS[operator]
+            predicates.append(lambda row, column=column, compare=compare, value=value: compare(row.get(column), value))
+    combine = all if kind == "and" else any
+    return lambda row: combine(predicate(row) for predicate in predicates)
+
+
+def _project(row, columns):
+    """Aplica `select` cuando son columnas simples; con `*` o relaciones retorna la fila."""
+    names = [name.strip() for column in columns for name in column.split(",")]
+    if any(name == "*" or "(" in name or ":" in name for name in names):
+        return row
+    return {name: row.get(name) for name in names}
+
+
+class FakeRpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: dict):
+        self._db = db
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        self._db.record(self._name, "rpc")
+        handler = self._db.rpc_handlers[self._name]
+        return SimpleNamespace(data=handler(self._db, self._params or {}), count=None)
+
+
+def append_audit_blocks_rpc(db: "FakeSupabase", params: dict):
+    """Emula la función SQL `append_audit_blocks` (compare-and-swap sobre la cabeza)."""
+    heads = db.tables.setdefault("audit_chain_head", [])
+    if not heads:
+        heads.append({"hash": "0" * 64, "block_number": 0})
+    head = heads[0]
+    if head["hash"] != params["p_expected_previous_hash"]:
+        return {"appended": False, "hash": head["hash"], "block_number": head["block_number"]}
+
+    chain = db.tables.setdefault("audit_chain", [])
+    for block in params["p_blocks"]:
+        assert block["previous_hash"] == head["hash"]
+        head["block_number"] += 1
+        chain.append(dict(block, id=str(uuid.uuid4()), block_number=head["block_number"]))
+        head["hash"] = block["hash"]
+
+    return {"appended": True, "hash": head["hash"], "block_number": head["block_number"]}
+
+
+def append_entity_audit_blocks_rpc(db: "FakeSupabase", params: dict):
+    """Emula `append_entity_audit_blocks`: el mismo compare-and-swap, por entidad."""
+    heads = db.tables.setdefault("audit_entity_heads", [])
+    head = next((row for row in heads if row["entity_id"] == params["p_entity_id"]), None)
+    if head is None:
+        head = {"entity_id": params["p_entity_id"], "hash": "0" * 64, "block_number": 0,
+                "anchored_block_number": 0, "anchor_block": None, "needs_anchor": False}
+        heads.append(head)
+    if head["hash"] != params["p_expected_previous_hash"]:
+        return {"appended": False, "hash": head["hash"], "block_number": head["block_number"]}
+
+    chain = db.tables.setdefault("audit_entity_chain", [])
+    for block in params["p_blocks"]:
+        assert block["previous_hash"] == head["hash"]
+        assert block["entity_id"] == head["entity_id"]
+        head["block_number"] += 1
+        chain.append(dict(block, id=str(uuid.uuid4()), block_number=head["block_number"]))
+        head["hash"] = block["hash"]
+    head["needs_anchor"] = head["block_number"] > head["anchored_block_number"]
+
+    return {"appended": True, "hash": head["hash"], "block_number": head["block_number"]}
+
+
+def mark_entity_chains_anchored_rpc(db: "FakeSupabase", params: dict):
+    heads = {row["entity_id"]: row for row in db.tables.get("audit_entity_heads", [])}
+    for item in params["p_heads"]:
+        head = heads[item["entity_id"]]
+        if head["anchored_block_number"] < item["block_number"]:
+            head["anchored_block_number"] = item["block_number"]
+            head["anchor_block"] = params["p_anchor_block"]
+        head["needs_anchor"] = head["block_number"] > head["anchored_block_number"]
+    return None
+
+
+def _in_org(row, org_unit_id):
+    return org_unit_id is None or row.get("org_unit_id") == org_unit_id
+
+
+def device_stats_rpc(db: "FakeSupabase", params: dict):
+    rows = [row for row in db.tables.get("devices", []) if _in_org(row, params["p_org_unit_id"])]
+    return [{
+        "total": len(rows),
+        "activos": sum(row.get("estado") == "ACTIVO" for row in rows),
+        "reparacion": sum(row.get("estado") == "REPARACIÓN" for row in rows),
+        "retirados": sum(row.get("estado") == "RETIRADO" for row in rows),
+    }]
+
+
+def ticket_stats_rpc(db: "FakeSupabase", params: dict):
+    rows = [row for row in db.tables.get("tickets", []) if _in_org(row, params["p_org_unit_id"])]
+    stats = {"total": len(rows), "tiempo_promedio_respuesta": None, "tiempo_promedio_resolucion": None}
+    for column, value in (("abiertos", "ABIERTO"), ("en_proceso", "EN_PROCESO"),
+                          ("resueltos", "RESUELTO"), ("cerrados", "CERRADO")):
+        stats[column] = sum(row.get("estado") == value for row in rows)
+    for priority in ("BAJA", "MEDIA", "ALTA", "CRITICA"):
+        stats[f"prioridad_{priority.lower()}"] = sum(row.get("prioridad") == priority for row in rows)
+    return [stats]
+
+
+def backup_stats_rpc(db: "FakeSupabase", params: dict):
+    devices = {row["id"]: row for row in db.tables.get("devices", [])}
+    rows = [
+        row for row in db.tables.get("backups", [])
+        if row.get("device_id") in devices and _in_org(devices[row["device_id"]], params["p_org_unit_id"])
+    ]
+    return [{"total": len(rows), "fallidos": sum(row.get("exitoso") is False for row in rows)}]
+
+
+def ticket_rollup_series_rpc(db: "FakeSupabase", params: dict):
+    """Emula `get_ticket_rollup_series`: una fila por bucket sumando las unidades."""
+    series = {}
+    for row in db.tables.get("ticket_rollups", []):
+        if row["granularity"] != params["p_granularity"]:
+            continue
+        if not params["p_desde"] <= row["bucket"] < params["p_hasta"]:
+            continue
+        if params.get("p_org_unit_id") and row.get("org_unit_id") != params["p_org_unit_id"]:
+            continue
+        entry = series.setdefault(row["bucket"], {
+            "bucket": row["bucket"], "abiertos": 0, "resueltos": 0, "cerrados": 0,
+            "resolucion_hist": [0] * len(row["resolucion_hist"]),
+        })
+        for counter in ("abiertos", "resueltos", "cerrados"):
+            entry[counter] += row.get(counter) or 0
+        entry["resolucion_hist"] = [a + b for a, b in zip(entry["resolucion_hist"], row["resolucion_hist"])]
+    return [series[bucket] for bucket in sorted(series)]
+
+
+def _search_terms(text):
+    """Aproxima la configuración es_unaccent: minúsculas, sin tildes y sin plural."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    terms = set()
+    for word in re.findall(r"\w+", text):
+        if len(word) < 3:
+            continue
+        if word.endswith("es") and len(word) > 4:
+            word = word[:-2]
+        elif word.endswith("s"):
+            word = word[:-1]
+        terms.add(word)
+    return terms
+
+
+def search_tickets_rpc(db: "FakeSupabase", params: dict):
+    """Emula `search_tickets`: todos los términos deben aparecer; pesos A=1, B=0.4, C=0.2."""
+    query = _search_terms(params["p_query"])
+    comments = {}
+    for comment in db.tables.get("ticket_comments", []):
+        if not comment.get("es_sistema"):
+            comments.setdefault(comment["ticket_id"], []).append(comment["comentario"])
+    results = []
+    for ticket in db.tables.get("tickets", []):
+        if params.get("p_org_unit_id") and ticket.get("org_unit_id") != params["p_org_unit_id"]:
+            continue
+        if params.get("p_solicitante_id") and ticket.get("solicitante_id") != params["p_solicitante_id"]:
+            continue
+        if params.get("p_estado") and ticket.get("estado") != params["p_estado"]:
+            continue
+        fields = (
+            (1.0, _search_terms(ticket.get("titulo"))),
+            (0.4, _search_terms(ticket.get("descripcion"))),
+            (0.2, _search_terms(" ".join(comments.get(ticket["id"], [])))),
+        )
+        if not query or not all(any(term in terms for _, terms in fields) for term in query):
+            continue
+        rank = round(sum(weight for term in query for weight, terms in fields if term in terms), 4)
+        if params.get("p_after_rank") is not None and (rank, ticket["id"]) >= (params["p_after_rank"], params["p_after_id"]):
+            continue
+        results.append({**{key: ticket.get(key) for key in (
+            "id", "titulo", "descripcion", "prioridad", "estado", "org_unit_id",
+            "solicitante_id", "asignado_a", "fecha_creacion",
+        )}, "rank": rank})
+    results.sort(key=lambda row: (row["rank"], row["id"]), reverse=True)
+    return results[:params.get("p_limit", 50)]
+
+
+CHANGE_TRACKED_TABLES = {"devices", "tickets", "backups", "users", "org_units"}
+
+
+class FakeSupabase:
+    """Cliente de Supabase en memoria para pruebas de rutas y helpers."""
+
+    def __init__(self, tables=None):
+        self.tables = {name: list(rows) for name, rows in (tables or {}).items()}
+        self.rpc_handlers = {}
+        self.calls = []
+        # Barreras por tabla: una consulta solo termina cuando todas las que
+        # comparten la barrera están en curso a la vez (prueba de concurrencia)
+        self.gates = {}
+        self.version_seq = 0
+        self.max_rows = None
+        self.auth = SimpleNamespace(get_user=lambda _token: SimpleNamespace(user=None))
+
+    def track_changes(self, table, rows):
+        """Emula los triggers por sentencia `track_change_version` sobre las tablas con ETag."""
+        if table not in CHANGE_TRACKED_TABLES or not rows:
+            return
+        devices = {row["id"]: row for row in self.tables.get("devices", [])}
+        org_units = {None}
+        for row in rows:
+            source = devices.get(row.get("device_id"), {}) if table == "backups" else row
+            if source.get("org_unit_id"):
+                org_units.add(source["org_unit_id"])
+        versions = self.tables.setdefault("change_versions", [])
+        for org_unit_id in org_units:
+            self.version_seq += 1
+            entry = next(
+                (v for v in versions if v["resource"] == table and v["org_unit_id"] == org_unit_id),
+                None,
+            )
+            if entry is None:
+                versions.append({"resource": table, "org_unit_id": org_unit_id, "version": self.version_seq})
+            else:
+                entry["version"] = self.version_seq
+
+    def record(self, target, operation):
+        self.calls.append((target, operation))
+        gate = self.gates.get(target)
+        if gate is not None:
+            gate.wait()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params=None) -> FakeRpc:
+        return FakeRpc(self, name, params)
+
+
+@pytest.fixture
+def fake_supabase(monkeypatch):
+    from apps.api.app import main
+
+    fake = FakeSupabase()
+    fake.rpc_handlers["append_audit_blocks"] = append_audit_blocks_rpc
+    fake.rpc_handlers["append_entity_audit_blocks"] = append_entity_audit_blocks_rpc
+    fake.rpc_handlers["mark_entity_chains_anchored"] = mark_entity_chains_anchored_rpc
+    fake.rpc_handlers["get_device_stats"] = device_stats_rpc
+    fake.rpc_handlers["get_ticket_stats"] = ticket_stats_rpc
+    fake.rpc_handlers["get_backup_stats"] = backup_stats_rpc
+    fake.rpc_handlers["search_tickets"] = search_tickets_rpc
+    fake.rpc_handlers["get_ticket_rollup_series"] = ticket_rollup_series_rpc
+    monkeypatch.setattr(main, "supabase", fake)
+    monkeypatch.setattr(main, "_merkle_frontier", None)
+    monkeypatch.setattr(main, "AUDIT_MERKLE_SYNC_DELAY_SECONDS", -1)
+    monkeypatch.setattr(main, "AUDIT_ANCHOR_INTERVAL_SECONDS", -1)
+    main.audit_sequencer.reset()
+    main.entity_sequencer.reset()
+    main.audit_history_cache.clear()
+    main.metric_counters.reset()
+    main.device_count_cache.clear()
+    main.change_version_cache.clear()
+    return fake
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import random
+
+from apps.api.app.audit import (
+    GENESIS_HASH,
+    build_payload,
+    canonical_payload,
+    compute_content_hash,
+    encode_payload_fields,
+    seal_block,
+    verify_block_batch,
+)
+
+SAMPLES = [
+    build_payload("CREATE_DEVICE", "dev-1", "user-1", "2025-01-01T00:00:00"),
+    build_payload("UPDATE_DEVICE", None, None, "2025-01-01T00:00:00.123456", {"b": 1, "a": [1, 2.5, None]}),
+    build_payload("CLOSE_TICKET", "tic-ñ", "usuário", "2025", {"comentario": "línea\n\"citada\"\t\\ 😀"}),
+    build_payload("X", "e", "u", "t", {"nested": {"z": {"y": True, "x": False}}, "1": "uno", "": ""}),
+    build_payload("X", "e", "u", "t", {"float": 1e-7, "big": 10 ** 30, "neg": -0.0}),
+    {"action": "X", "entity_id": 7, "user_id": "u", "timestamp": "t", "data": {}},
+    {"action": "X", "entity_id": "e", "user_id": "u", "timestamp": "t", "data": []},
+    {"action": "X", "entity_id": "e", "user_id": "u", "timestamp": "t", "data": {}, "extra": 1},
+]
+
+
+def random_value(rng, depth=0):
+    choice = rng.randrange(7 if depth < 3 else 4)
+    if choice == 0:
+        return rng.randrange(-10 ** 6, 10 ** 6)
+    if choice == 1:
+        return rng.random() * 10 ** rng.randrange(-5, 5)
+    if choice == 2:
+        return "".join(chr(rng.choice([rng.randrange(32, 127), rng.randrange(0, 0x3000)])) for _ in range(rng.randrange(8)))
+    if choice == 3:
+        return rng.choice([None, True, False])
+    if choice == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{rng.randrange(50)}": random_value(rng, depth + 1) for _ in range(rng.randrange(5))}
+
+
+def test_canonical_payload_is_byte_identical_to_json_dumps():
+    rng = random.Random(1234)
+    payloads = list(SAMPLES)
+    for _ in range(2000):
+        payloads.append(build_payload(
+            random_value(rng, 3) if rng.random() < 0.05 else f"ACCION_{rng.randrange(10)}",
+            rng.choice([None, "dev-1", "ñandú"]),
+            rng.choice([None, "user-1"]),
+            "2025-01-01T00:00:00",
+            random_value(rng) if rng.random() < 0.9 else None,
+        ))
+
+    for payload in payloads:
+        assert canonical_payload(payload) == json.dumps(payload, sort_keys=True).encode()
+
+
+def test_encode_payload_fields_matches_payload_dict():
+    payload = build_payload("UPDATE_DEVICE", "dev-1", "user-1", "2025-01-01", {"estado": "ACTIVO"})
+    encoded = encode_payload_fields("UPDATE_DEVICE", "dev-1", "user-1", "2025-01-01", {"estado": "ACTIVO"})
+    assert encoded == canonical_payload(payload)
+
+
+def test_existing_hashes_still_verify():
+    payload = build_payload("UPDATE_DEVICE", "dev-1", "user-1", "2025-01-01", {"n": 1})
+    legacy_content_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    assert compute_content_hash(payload) == legacy_content_hash
+
+    sealed = seal_block(payload, GENESIS_HASH, "secret")
+    block = (1, sealed["hash"], sealed["signature"], "UPDATE_DEVICE", "dev-1", "user-1", "2025-01-01", {"n": 1})
+    assert verify_block_batch("secret", GENESIS_HASH, [block]) == []
@@ -0,0 +1,183 @@
+import asyncio
+
+from apps.api.app import main
+from apps.api.app.audit import build_payload, seal_block
+
+
+def test_register_audit_event_uses_cached_head(fake_supabase):
+    async def scenario():
+        first = await main.register_audit_event("CREATE_DEVICE", "dev-1", "user-1", {"n": 1})
+        second = await main.register_audit_event("UPDATE_DEVICE", "dev-1", "user-1", {"n": 2})
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert (first["block_number"], second["block_number"]) == (1, 2)
+    assert second["previous_hash"] == first["hash"]
+    # Una lectura de la cabeza al inicio y luego una sola llamada por evento
+    assert fake_supabase.calls == [
+        ("audit_chain_head", "select"),
+        ("append_audit_blocks", "rpc"),
+        ("append_audit_blocks", "rpc"),
+    ]
+    assert asyncio.run(main.verify_audit_chain())["valid"] is True
+
+
+def test_register_audit_event_rechains_after_concurrent_writer(fake_supabase):
+    asyncio.run(main.register_audit_event("CREATE_DEVICE", "dev-1", "user-1"))
+
+    # Otro worker agrega un bloque sin que este proceso lo sepa
+    head = fake_supabase.tables["audit_chain_head"][0]
+    foreign = seal_block(
+        build_payload("BACKUP", "dev-2", "user-2", "2024-01-01T00:00:00"),
+        head["hash"],
+        main.AUDIT_SECRET,
+    )
+    fake_supabase.rpc("append_audit_blocks", {
+        "p_expected_previous_hash": head["hash"],
+        "p_blocks": [main.block_row(foreign)],
+    }).execute()
+
+    block = asyncio.run(main.register_audit_event("UPDATE_DEVICE", "dev-1", "user-1"))
+
+    assert block["block_number"] == 3
+    assert block["previous_hash"] == foreign["hash"]
+    assert asyncio.run(main.verify_audit_chain())["valid"] is True
+
+
+def register_events(count, start=0):
+    async def scenario():
+        for n in range(start, start + count):
+            await main.register_audit_event("UPDATE_DEVICE", "dev-1", "user-1", {"n": n})
+
+    asyncio.run(scenario())
+
+
+def test_verify_audit_chain_resumes_from_checkpoint(fake_supabase):
+    register_events(3)
+    first = asyncio.run(main.verify_audit_chain())
+
+    register_events(2, start=3)
+    second = asyncio.run(main.verify_audit_chain())
+
+    assert (first["verified_blocks"], first["checkpoint"]) == (3, 3)
+    assert (second["from_block"], second["verified_blocks"]) == (4, 2)
+    assert second["total_blocks"] == 5
+    assert second["valid"] is True
+
+
+def test_verify_audit_chain_full_rechecks_old_blocks(fake_supabase):
+    register_events(3)
+    asyncio.run(main.verify_audit_chain())
+
+    fake_supabase.tables["audit_chain"][1]["metadata"] = {"n": "alterado"}
+
+    assert asyncio.run(main.verify_audit_chain())["valid"] is True
+    full = asyncio.run(main.verify_audit_chain(full=True))
+    assert full["valid"] is False
+    assert [block["block_number"] for block in full["corrupted_blocks"]] == [2]
+
+
+def test_verify_audit_chain_ignores_forged_checkpoint(fake_supabase):
+    register_events(2)
+    fake_supabase.tables["audit_chain_checkpoints"] = [{
+        "block_number": 2,
+        "hash": fake_supabase.tables["audit_chain"][1]["hash"],
+        "signature": "0" * 64,
+        "verified_at": "2024-01-01T00:00:00",
+    }]
+
+    result = asyncio.run(main.verify_audit_chain())
+
+    assert result["from_block"] == 1
+    assert result["verified_blocks"] == 2
+
+
+def test_audit_chain_verification_streams_pages(fake_supabase):
+    register_events(7)
+    fake_supabase.calls.clear()
+
+    async def collect():
+        return [event async for event in main.iter_audit_chain_verification(full=True, page_size=3)]
+
+    events = asyncio.run(collect())
+
+    progress = [event for event in events if event["type"] == "progress"]
+    assert [event["last_block"] for event in progress] == [3, 6, 7]
+    assert events[-1]["type"] == "result"
+    assert events[-1]["valid"] is True
+    assert events[-1]["verified_blocks"] == 7
+    # Tres páginas con datos y una vacía que confirma el final
+    assert fake_supabase.calls.count(("audit_chain", "select")) == 4
+
+
+def test_verification_reaches_the_tail_when_pages_are_capped(fake_supabase, monkeypatch):
+    register_events(7)
+    monkeypatch.setattr(main, "AUDIT_VERIFY_PAGE_SIZE", 5)
+    fake_supabase.max_rows = 2
+
+    result = asyncio.run(main.verify_audit_chain(full=True))
+
+    assert result["verified_blocks"] == 7
+    assert result["checkpoint"] == 7
+
+
+def test_parallel_verifier_matches_sequential():
+    from concurrent.futures import ProcessPoolExecutor
+
+    from apps.api.app.audit import ChainVerifier, ParallelChainVerifier
+
+    previous_hash = "0" * 64
+    records = []
+    for number in range(1, 41):
+        payload = build_payload("BACKUP", "dev-1", "user-1", f"2024-01-01T00:00:{number:02d}", {"n": number})
+        sealed = seal_block(payload, previous_hash, "s3cr3t")
+        records.append(dict(main.block_row(sealed), block_number=number))
+        previous_hash = sealed["hash"]
+    records[16]["metadata"] = {"n": "alterado"}
+    records[33]["signature"] = "f" * 64
+
+    sequential = ChainVerifier("s3cr3t")
+    sequential.feed(records)
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        parallel = ParallelChainVerifier("s3cr3t", pool, chunk_size=7)
+        parallel.feed(records[:25])
+        parallel.feed(records[25:])
+
+    assert parallel.corrupted == sequential.corrupted
+    assert [block["block_number"] for block in parallel.corrupted] == [17, 34]
+    assert parallel.previous_hash == sequential.previous_hash
+
+
+def test_entity_audit_history_is_paginated_and_cached(fake_supabase):
+    register_events(5)
+    user = main.UserProfile(id="user-1", nombre="Técnico", email="ti@example.com", rol="TI", org_unit_id="org-1")
+
+    first = asyncio.run(main.get_entity_audit("dev-1", limit=2, user=user))
+    assert [row["block_number"] for row in first["data"]] == [5, 4]
+    assert first["next_cursor"] == 4
+
+    last = asyncio.run(main.get_entity_audit("dev-1", limit=2, before=2, user=user))
+    assert [row["block_number"] for row in last["data"]] == [1]
+    assert last["next_cursor"] is None
+
+    # Segunda lectura de la misma página: sale de la caché
+    fake_supabase.calls.clear()
+    asyncio.run(main.get_entity_audit("dev-1", limit=2, user=user))
+    assert fake_supabase.calls == []
+
+    # Un nuevo evento de la entidad invalida sus páginas
+    register_events(1, start=5)
+    refreshed = asyncio.run(main.get_entity_audit("dev-1", limit=2, user=user))
+    assert [row["block_number"] for row in refreshed["data"]] == [6, 5]
+
+
+def test_verify_pool_does_not_fork_the_api_process(monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_VERIFY_WORKERS", 2)
+    monkeypatch.setattr(main, "_audit_verify_pool", None)
+
+    pool = main.get_audit_verify_pool()
+    try:
+        assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        pool.shutdown()
@@ -0,0 +1,96 @@
+import asyncio
+
+from apps.api.app import main
+from apps.api.app.audit import GENESIS_HASH, build_payload, seal_block
+from apps.api.app.audit_export import RECORD, AuditExportWriter, export_pages, verify_export
+
+SECRET = "export-secret"
+
+
+def chain_records(count, start=1, previous_hash=GENESIS_HASH):
+    records = []
+    for number in range(start, start + count):
+        payload = build_payload(
+            "UPDATE_DEVICE",
+            "dev-1",
+            "user-1",
+            f"2025-01-01T00:00:{number:02d}",
+            {"n": number, "ubicacion": "Sala ñ"},
+        )
+        sealed = seal_block(payload, previous_hash, SECRET)
+        records.append({
+            "block_number": number,
+            "hash": sealed["hash"],
+            "signature": sealed["signature"],
+            "action": payload["action"],
+            "entity_id": payload["entity_id"],
+            "user_id": payload["user_id"],
+            "timestamp": payload["timestamp"],
+            "metadata": payload["data"],
+        })
+        previous_hash = sealed["hash"]
+    return records
+
+
+def test_export_appends_incrementally_and_verifies(tmp_path):
+    prefix = str(tmp_path / "audit")
+    records = chain_records(12)
+
+    with AuditExportWriter(prefix) as writer:
+        writer.append(records[:7])
+    with AuditExportWriter(prefix) as writer:
+        assert (writer.last_block_number, writer.last_hash) == (7, records[6]["hash"])
+        writer.append(records[7:])
+
+    result = verify_export(prefix, secret=SECRET)
+    assert result["valid"] is True
+    assert result["total_blocks"] == 12
+    assert result["last_hash"] == records[-1]["hash"]
+
+    assert verify_export(prefix, secret="otro-secreto")["corrupted_count"] == 12
+
+
+def test_verify_export_detects_tampered_payload(tmp_path):
+    prefix = str(tmp_path / "audit")
+    with AuditExportWriter(prefix) as writer:
+        writer.append(chain_records(5))
+
+    data = bytearray((tmp_path / "audit.dat").read_bytes())
+    position = data.index(b'"n": 3')
+    data[position + 5] = ord("9")
+    (tmp_path / "audit.dat").write_bytes(bytes(data))
+
+    result = verify_export(prefix)
+    assert result["valid"] is False
+    assert [block["block_number"] for block in result["corrupted_blocks"]] == [3]
+
+
+def test_writer_discards_torn_tail(tmp_path):
+    prefix = str(tmp_path / "audit")
+    records = chain_records(4)
+    with AuditExportWriter(prefix) as writer:
+        writer.append(records[:3])
+
+    # Escritura interrumpida: medio registro de índice sin su payload
+    with open(f"{prefix}.idx", "ab") as handle:
+        handle.write(b"\x00" * (RECORD.size // 2))
+
+    with AuditExportWriter(prefix) as writer:
+        assert writer.count == 3
+        writer.append(records[3:])
+
+    assert verify_export(prefix, secret=SECRET)["valid"] is True
+
+
+def test_export_pages_from_supabase(fake_supabase, tmp_path):
+    async def scenario():
+        for n in range(5):
+            await main.register_audit_event("UPDATE_DEVICE", "dev-1", "user-1", {"n": n})
+        with AuditExportWriter(str(tmp_path / "audit")) as writer:
+            await export_pages(writer, main.iter_audit_chain_pages(writer.last_block_number, page_size=2))
+
+    asyncio.run(scenario())
+
+    result = verify_export(str(tmp_path / "audit"), secret=main.AUDIT_SECRET)
+    assert result["valid"] is True
+    assert result["total_blocks"] == 5
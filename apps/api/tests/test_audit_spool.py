@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from apps.api.app import main
+from apps.api.app.audit import build_payload
+from apps.api.app.audit_spool import AuditPipeline, AuditSpool, SpoolLockedError, open_worker_spool
+
+
+def make_payload(n):
+    return build_payload("UPDATE_DEVICE", "dev-1", "user-1", f"2024-01-01T00:00:0{n}", {"n": n})
+
+
+def make_pipeline(spool):
+    return AuditPipeline(
+        spool,
+        append_batch=main.audit_sequencer.append,
+        find_persisted=main.find_persisted_audit_blocks,
+        batch_size=2,
+    )
+
+
+def reopen(spool):
+    """Simula un reinicio: el proceso anterior libera el directorio."""
+    spool.close()
+    return AuditSpool(str(spool.directory))
+
+
+def test_spool_survives_restart_and_compacts(tmp_path):
+    spool = AuditSpool(str(tmp_path))
+    for n in range(3):
+        spool.append(make_payload(n))
+
+    reopened = reopen(spool)
+    assert [seq for seq, _ in reopened.pending()] == [1, 2, 3]
+
+    reopened.commit(2)
+    assert [seq for seq, _ in reopened.pending()] == [3]
+    reopened = reopen(reopened)
+    assert [seq for seq, _ in reopened.pending()] == [3]
+
+    reopened.commit(3)
+    assert reopened.log_path.read_text() == ""
+    assert reopen(reopened).append(make_payload(4)) == 4
+
+
+def test_spool_directory_belongs_to_one_process(tmp_path):
+    spool = AuditSpool(str(tmp_path / "worker-0"))
+    with pytest.raises(SpoolLockedError):
+        AuditSpool(str(tmp_path / "worker-0"))
+
+    # Los demás procesos toman el siguiente subdirectorio libre
+    other = open_worker_spool(str(tmp_path), max_workers=2)
+    assert other.directory.name == "worker-1"
+    with pytest.raises(SpoolLockedError):
+        open_worker_spool(str(tmp_path), max_workers=2)
+
+    spool.append(make_payload(0))
+    spool.close()
+    assert open_worker_spool(str(tmp_path), max_workers=2).pending()[0][0] == 1
+
+
+def test_pipeline_replays_spool_without_duplicates(fake_supabase, tmp_path):
+    spool = AuditSpool(str(tmp_path))
+    payloads = [make_payload(n) for n in range(5)]
+    for payload in payloads:
+        spool.append(payload)
+
+    # La caída ocurrió después de insertar los dos primeros pero antes del commit
+    asyncio.run(main.audit_sequencer.append(payloads[:2]))
+
+    pipeline = make_pipeline(reopen(spool))
+    flushed = asyncio.run(pipeline.flush())
+
+    chain = fake_supabase.tables["audit_chain"]
+    assert flushed == 3
+    assert [row["metadata"]["n"] for row in chain] == [0, 1, 2, 3, 4]
+    assert reopen(pipeline.spool).pending() == []
+    assert asyncio.run(main.verify_audit_chain())["valid"] is True
+
+
+def test_pipeline_submit_acknowledges_before_insert(fake_supabase, tmp_path):
+    pipeline = make_pipeline(AuditSpool(str(tmp_path)))
+
+    async def scenario():
+        queued = await pipeline.submit(make_payload(1))
+        assert "audit_chain" not in fake_supabase.tables
+        sealed = await pipeline.submit(make_payload(2), wait=True)
+        return queued, sealed
+
+    queued, sealed = asyncio.run(scenario())
+
+    assert queued["queued"] is True
+    assert sealed["block_number"] == 2
+    assert len(fake_supabase.tables["audit_chain"]) == 2
+
+
+def test_submit_many_writes_one_contiguous_block(tmp_path, monkeypatch):
+    pipeline = make_pipeline(AuditSpool(str(tmp_path)))
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+
+    queued = asyncio.run(pipeline.submit_many([make_payload(n) for n in range(3)]))
+
+    assert [item["spool_seq"] for item in queued] == [1, 2, 3]
+    assert len(fsyncs) == 1
+    assert [seq for seq, _ in reopen(pipeline.spool).pending()] == [1, 2, 3]
+
+
+class APIError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def test_rejected_event_goes_to_dead_letter_and_chain_moves_on(fake_supabase, tmp_path):
+    async def append_batch(payloads):
+        if any(payload["entity_id"] == "no-es-uuid" for payload in payloads):
+            raise APIError('invalid input syntax for type uuid: "no-es-uuid"', code="22P02")
+        return await main.audit_sequencer.append(payloads)
+
+    pipeline = AuditPipeline(
+        AuditSpool(str(tmp_path)),
+        append_batch=append_batch,
+        find_persisted=main.find_persisted_audit_blocks,
+        batch_size=3,
+        is_rejection=main.is_row_rejection,
+    )
+    bad = build_payload("UPDATE_DEVICE", "no-es-uuid", "user-1", "2024-01-01T00:00:09", {})
+
+    async def scenario():
+        for payload in (make_payload(0), bad, make_payload(2)):
+            await pipeline.submit(payload)
+        first = await pipeline.flush()
+        sealed = await pipeline.submit(make_payload(3), wait=True)
+        return first, sealed
+
+    first, sealed = asyncio.run(scenario())
+
+    assert first == 2
+    assert sealed["block_number"] == 3
+    assert [row["metadata"]["n"] for row in fake_supabase.tables["audit_chain"]] == [0, 2, 3]
+    dead = [json.loads(line) for line in pipeline.spool.dead_letter_path.read_text().splitlines()]
+    assert [(entry["seq"], entry["payload"]["entity_id"]) for entry in dead] == [(2, "no-es-uuid")]
+    assert "uuid" in dead[0]["error"]
+    assert pipeline.spool.pending() == []
+
+
+def test_spooled_events_are_validated_before_acknowledging(fake_supabase, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "audit_pipeline", make_pipeline(AuditSpool(str(tmp_path))))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.register_audit_event("UPDATE_DEVICE", "no-es-uuid", str(uuid.uuid4())))
+    assert exc.value.status_code == 422
+    with pytest.raises(HTTPException):
+        asyncio.run(main.register_audit_event("X" * 51, str(uuid.uuid4()), None))
+    assert main.audit_pipeline.spool.pending() == []
+
+    queued = asyncio.run(main.register_audit_event("UPDATE_DEVICE", str(uuid.uuid4()), None))
+    assert queued["queued"] is True
@@ -11,6 +11,7 @@ supabase_stub = SimpleNamespace(
 sys.modules.setdefault("supabase", supabase_stub)
 
 import asyncio
+import time
 import pytest
 from fastapi import HTTPException
 from fastapi.security import HTTPAuthorizationCredentials
@@ -48,10 +49,17 @@ class DummyTable:
 class DummySupabase:
     def __init__(self, user_id: str, user_data: dict):
         self._user_data = user_data
-        self.auth = SimpleNamespace(get_user=lambda _token: SimpleNamespace(user=SimpleNamespace(id=user_id)))
+        self.calls = {"get_user": 0, "users": 0}
+
+        def get_user(_token):
+            self.calls["get_user"] += 1
+            return SimpleNamespace(user=SimpleNamespace(id=user_id))
+
+        self.auth = SimpleNamespace(get_user=get_user)
 
     def table(self, name: str):
         assert name == "users"
+        self.calls["users"] += 1
         return DummyTable(self._user_data)
 
     def __getattr__(self, item):
@@ -61,6 +69,8 @@ class DummySupabase:
 def setup_supabase(monkeypatch, user_data):
     dummy = DummySupabase(user_id=user_data["id"], user_data=user_data)
     monkeypatch.setattr(main, "supabase", dummy)
+    main.clear_auth_caches()
+    return dummy
 
 
 def test_get_current_user_normalizes_role(monkeypatch):
@@ -97,3 +107,141 @@ def test_get_current_user_invalid_role(monkeypatch):
 
     assert exc.value.status_code == 422
     assert "Rol en Supabase inválido" in exc.value.detail
+
+
+def test_get_current_user_uses_cache(monkeypatch):
+    user_data = {
+        "id": "user-789",
+        "nombre": "Test User",
+        "email": "user@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+        "org_units": {"nombre": "Org Uno"},
+    }
+    dummy = setup_supabase(monkeypatch, user_data)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="cached-token")
+
+    first = asyncio.run(main.get_current_user(credentials))
+    second = asyncio.run(main.get_current_user(credentials))
+
+    assert first == second
+    assert dummy.calls == {"get_user": 1, "users": 1}
+    assert main.token_cache.stats()["hits"] == 1
+
+
+def test_invalidate_user_auth_cache_forces_reload(monkeypatch):
+    user_data = {
+        "id": "user-321",
+        "nombre": "Test User",
+        "email": "user@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+        "org_units": {"nombre": "Org Uno"},
+    }
+    dummy = setup_supabase(monkeypatch, user_data)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="cached-token")
+
+    asyncio.run(main.get_current_user(credentials))
+    user_data["rol"] = "DIRECTOR"
+    main.invalidate_user_auth_cache("user-321")
+    user = asyncio.run(main.get_current_user(credentials))
+
+    assert user.rol == "DIRECTOR"
+    assert dummy.calls == {"get_user": 2, "users": 2}
+
+
+def make_jwt(sub: str, secret: str = "secret", **claims):
+    from jose import jwt
+
+    payload = {"sub": sub, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    payload.update(claims)
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def test_get_current_user_verifies_jwt_locally(monkeypatch):
+    user_data = {
+        "id": "user-654",
+        "nombre": "Test User",
+        "email": "user@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+        "org_units": {"nombre": "Org Uno"},
+    }
+    dummy = setup_supabase(monkeypatch, user_data)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=make_jwt("user-654"))
+
+    user = asyncio.run(main.get_current_user(credentials))
+
+    assert user.id == "user-654"
+    assert dummy.calls["get_user"] == 0
+
+
+def test_get_current_user_rejects_expired_jwt(monkeypatch):
+    user_data = {
+        "id": "user-655",
+        "nombre": "Test User",
+        "email": "user@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+        "org_units": {"nombre": "Org Uno"},
+    }
+    dummy = setup_supabase(monkeypatch, user_data)
+    token = make_jwt("user-655", exp=int(time.time()) - 60)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.get_current_user(credentials))
+
+    assert exc.value.status_code == 401
+    assert dummy.calls["get_user"] == 0
+
+
+def test_get_current_user_falls_back_for_unknown_key(monkeypatch):
+    user_data = {
+        "id": "user-656",
+        "nombre": "Test User",
+        "email": "user@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+        "org_units": {"nombre": "Org Uno"},
+    }
+    dummy = setup_supabase(monkeypatch, user_data)
+    token = make_jwt("user-656", secret="rotated-elsewhere")
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    user = asyncio.run(main.get_current_user(credentials))
+
+    assert user.id == "user-656"
+    assert dummy.calls["get_user"] == 1
+
+
+def test_remote_token_is_not_cached_past_its_expiry(monkeypatch):
+    user_data = {
+        "id": "user-657",
+        "nombre": "Test User",
+        "email": "user@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+        "org_units": {"nombre": "Org Uno"},
+    }
+    dummy = setup_supabase(monkeypatch, user_data)
+    token = make_jwt("user-657", secret="rotated-elsewhere", exp=int(time.time()) + 5)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    asyncio.run(main.get_current_user(credentials))
+    # Seis segundos después el token ya expiró: el cache no puede seguir aceptándolo
+    monotonic = time.monotonic
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic() + 6)
+    asyncio.run(main.get_current_user(credentials))
+
+    assert dummy.calls["get_user"] == 2
+
+
+def test_local_verifier_accepts_previous_secret():
+    from apps.api.app.jwt_verifier import LocalJWTVerifier
+
+    verifier = LocalJWTVerifier(secrets=["new-secret", "old-secret"])
+
+    claims = verifier.verify(make_jwt("user-1", secret="old-secret"))
+
+    assert claims["sub"] == "user-1"
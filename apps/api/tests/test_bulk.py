@@ -0,0 +1,230 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from apps.api.app import main
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Técnico",
+        "email": "ti@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+class FakeRequest:
+    def __init__(self, body, content_type="application/json"):
+        self.headers = {"content-type": content_type}
+        self._body = body.encode() if isinstance(body, str) else body
+
+    async def body(self):
+        return self._body
+
+
+class APIError(Exception):
+    """Como `postgrest.exceptions.APIError`: el SQLSTATE viaja en `code`."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def device_row(n, **overrides):
+    row = {"nombre": f"PC-{n:03d}", "tipo": "PC", "estado": "ACTIVO", "ubicacion": "Lab 1"}
+    row.update(overrides)
+    return row
+
+
+def test_json_import_validates_up_front_and_batches_writes(fake_supabase, monkeypatch):
+    monkeypatch.setattr(main, "IMPORT_BATCH_SIZE", 2)
+    rows = [
+        device_row(1, specs={"procesador": "i5", "teclado": {"serial": "K-1"}}),
+        device_row(2, tipo="TOSTADORA"),
+        device_row(3),
+        {"nombre": "sin ubicación", "tipo": "PC", "estado": "ACTIVO"},
+        device_row(5, specs={"procesador": "i7"}),
+    ]
+
+    result = asyncio.run(main.import_devices(request=FakeRequest(json.dumps({"devices": rows})), user=make_user()))
+
+    assert (result["created"], result["failed"]) == (3, 2)
+    assert [error["index"] for error in result["errors"]] == [1, 3]
+    assert result["errors"][1]["errors"] == ["ubicacion: Field required"]
+    assert [device["index"] for device in result["data"]] == [0, 2, 4]
+
+    devices = fake_supabase.tables["devices"]
+    assert {device["org_unit_id"] for device in devices} == {"org-1"}
+    specs = {spec["device_id"]: spec for spec in fake_supabase.tables["device_specs"]}
+    assert specs[result["data"][0]["id"]]["perifericos"] == {"teclado": {"serial": "K-1"}}
+    assert len(fake_supabase.tables["device_logs"]) == 3
+    # Tres dispositivos en dos inserts, specs y logs en uno cada uno, auditoría en un solo lote
+    assert fake_supabase.calls.count(("devices", "insert")) == 2
+    assert fake_supabase.calls.count(("device_specs", "insert")) == 1
+    assert fake_supabase.calls.count(("device_logs", "insert")) == 2
+    assert fake_supabase.calls.count(("append_audit_blocks", "rpc")) == 1
+    assert [block["action"] for block in fake_supabase.tables["audit_chain"]] == ["CREATE_DEVICE"] * 3
+
+
+def test_rejected_batch_falls_back_to_single_rows(fake_supabase, monkeypatch):
+    original = main.db_execute
+
+    async def db_execute(query):
+        payload = getattr(query, "_payload", None)
+        payloads = payload if isinstance(payload, list) else [payload]
+        if getattr(query, "_table", None) == "devices" and any(p and p.get("serial") == "DUP" for p in payloads):
+            raise APIError("duplicate key value violates unique constraint", code="23505")
+        return await original(query)
+
+    monkeypatch.setattr(main, "db_execute", db_execute)
+    csv_body = (
+        "nombre,tipo,estado,ubicacion,serial,specs.procesador\r\n"
+        "PC-1,PC,ACTIVO,Lab 2,S-1,i3\r\n"
+        "PC-2,PC,ACTIVO,Lab 2,DUP,\r\n"
+        "PC-3,LAPTOP,REPARACIÓN,Lab 2,,\r\n"
+    )
+
+    result = asyncio.run(main.import_devices(request=FakeRequest("\ufeff" + csv_body, "text/csv"), user=make_user()))
+
+    assert [device["nombre"] for device in result["data"]] == ["PC-1", "PC-3"]
+    assert result["errors"] == [{"index": 1, "errors": ["duplicate key value violates unique constraint"]}]
+    assert fake_supabase.tables["device_specs"][0]["cpu"] == "i3"
+    assert "serial" not in next(d for d in fake_supabase.tables["devices"] if d["nombre"] == "PC-3")
+
+
+def test_rejected_creation_logs_are_reported(fake_supabase, monkeypatch):
+    original = main.db_execute
+
+    async def db_execute(query):
+        payload = getattr(query, "_payload", None)
+        payloads = payload if isinstance(payload, list) else [payload]
+        if getattr(query, "_table", None) == "device_logs":
+            second = next(d["id"] for d in fake_supabase.tables["devices"] if d["nombre"] == "PC-002")
+            if any(p["device_id"] == second for p in payloads):
+                raise APIError("value too long for type character varying(255)", code="22001")
+        return await original(query)
+
+    monkeypatch.setattr(main, "db_execute", db_execute)
+    body = json.dumps([device_row(1), device_row(2), device_row(3)])
+
+    result = asyncio.run(main.import_devices(request=FakeRequest(body), user=make_user()))
+
+    assert result["created"] == 3
+    assert result["errors"] == [{
+        "index": 1,
+        "errors": ["Dispositivo creado sin registro de creación: value too long for type character varying(255)"],
+    }]
+    assert len(fake_supabase.tables["device_logs"]) == 2
+
+
+def test_batch_insert_requires_one_row_per_payload(fake_supabase, monkeypatch):
+    original = main.db_execute
+
+    async def db_execute(query):
+        response = await original(query)
+        if getattr(query, "_table", None) == "devices" and getattr(query, "_operation", None) == "insert":
+            response.data = response.data[:-1]
+        return response
+
+    monkeypatch.setattr(main, "db_execute", db_execute)
+
+    # Con una fila de menos los índices de las siguientes quedarían corridos
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.insert_in_batches("devices", [device_row(1), device_row(2)]))
+    assert exc.value.status_code == 502
+
+
+def test_uncertain_batch_failure_is_not_retried_by_row(fake_supabase, monkeypatch):
+    original = main.db_execute
+
+    async def db_execute(query):
+        if getattr(query, "_table", None) == "devices" and getattr(query, "_operation", None) == "insert":
+            raise HTTPException(status_code=504, detail="Supabase no respondió a tiempo")
+        return await original(query)
+
+    monkeypatch.setattr(main, "db_execute", db_execute)
+    body = json.dumps([device_row(1), device_row(2)])
+
+    # El lote pudo quedar insertado: reintentar por fila lo duplicaría
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.import_devices(request=FakeRequest(body), user=make_user()))
+    assert exc.value.status_code == 504
+    assert "devices" not in fake_supabase.tables
+
+
+def test_import_rejects_unreadable_or_oversized_batches(fake_supabase, monkeypatch):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.import_devices(request=FakeRequest("{"), user=make_user()))
+    assert exc.value.status_code == 400
+
+    monkeypatch.setattr(main, "IMPORT_MAX_ROWS", 1)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.import_devices(request=FakeRequest(json.dumps([device_row(1), device_row(2)])), user=make_user()))
+    assert exc.value.status_code == 413
+    assert "devices" not in fake_supabase.tables
+
+
+def seed_tickets(fake_supabase):
+    fake_supabase.tables["tickets"] = [
+        {
+            "id": f"t-{n}",
+            "titulo": f"Ticket {n}",
+            "org_unit_id": "org-1" if n < 4 else "org-2",
+            "solicitante_id": "user-3",
+            "estado": "ABIERTO",
+            "prioridad": "MEDIA",
+        }
+        for n in range(6)
+    ]
+
+
+def test_bulk_ticket_close_uses_one_update_and_one_audit_batch(fake_supabase):
+    seed_tickets(fake_supabase)
+    bulk = main.TicketBulkUpdate(
+        ids=["t-0", "t-1", "t-1", "t-4", "t-9", "t-2"],
+        changes=main.TicketUpdate(estado="CERRADO", asignado_a="user-1"),
+    )
+
+    result = asyncio.run(main.bulk_update_tickets(bulk=bulk, user=make_user()))
+
+    assert [(item["id"], item["status"]) for item in result["data"]] == [
+        ("t-0", "updated"), ("t-1", "updated"), ("t-4", "not_found"), ("t-9", "not_found"), ("t-2", "updated"),
+    ]
+    assert (result["updated"], result["failed"]) == (3, 2)
+    estados = {ticket["id"]: ticket["estado"] for ticket in fake_supabase.tables["tickets"]}
+    assert [estados[f"t-{n}"] for n in range(6)] == ["CERRADO"] * 3 + ["ABIERTO"] * 3
+    assert fake_supabase.calls.count(("tickets", "update")) == 1
+    assert fake_supabase.calls.count(("append_audit_blocks", "rpc")) == 1
+    blocks = fake_supabase.tables["audit_chain"]
+    assert [(block["action"], block["entity_id"]) for block in blocks] == [
+        ("CLOSE_TICKET", "t-0"), ("CLOSE_TICKET", "t-1"), ("CLOSE_TICKET", "t-2"),
+    ]
+
+
+def test_bulk_ticket_update_requires_changes(fake_supabase):
+    seed_tickets(fake_supabase)
+    bulk = main.TicketBulkUpdate(ids=["t-0"], changes=main.TicketUpdate())
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.bulk_update_tickets(bulk=bulk, user=make_user(rol="LIDER_TI")))
+
+    assert exc.value.status_code == 400
+
+
+def test_bulk_ticket_update_chunks_long_id_lists(fake_supabase, monkeypatch):
+    seed_tickets(fake_supabase)
+    monkeypatch.setattr(main, "IN_FILTER_CHUNK_SIZE", 2)
+    bulk = main.TicketBulkUpdate(ids=[f"t-{n}" for n in range(6)], changes=main.TicketUpdate(prioridad="ALTA"))
+
+    result = asyncio.run(main.bulk_update_tickets(bulk=bulk, user=make_user(rol="LIDER_TI")))
+
+    assert result["updated"] == 6
+    assert {ticket["prioridad"] for ticket in fake_supabase.tables["tickets"]} == {"ALTA"}
+    assert fake_supabase.calls.count(("tickets", "select")) == 3
+    assert fake_supabase.calls.count(("tickets", "update")) == 3
@@ -0,0 +1,215 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from apps.api.app import main, rollups
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Docente",
+        "email": "docente@example.com",
+        "rol": "DOCENTE",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+def seed(fake_supabase):
+    fake_supabase.tables.update({
+        "devices": [
+            {"id": "dev-1", "org_unit_id": "org-1", "estado": "ACTIVO"},
+            {"id": "dev-2", "org_unit_id": "org-1", "estado": "REPARACIÓN"},
+            {"id": "dev-3", "org_unit_id": "org-2", "estado": "ACTIVO"},
+        ],
+        "tickets": [
+            {"id": "t-1", "org_unit_id": "org-1", "estado": "ABIERTO", "prioridad": "ALTA"},
+            {"id": "t-2", "org_unit_id": "org-1", "estado": "EN_PROCESO", "prioridad": "BAJA"},
+            {"id": "t-3", "org_unit_id": "org-2", "estado": "ABIERTO", "prioridad": "CRITICA"},
+        ],
+        "backups": [
+            {"id": "b-1", "device_id": "dev-1", "exitoso": True},
+            {"id": "b-2", "device_id": "dev-3", "exitoso": False},
+        ],
+    })
+
+
+def test_metrics_are_aggregated_in_sql_and_scoped(fake_supabase):
+    seed(fake_supabase)
+
+    metrics = asyncio.run(main.get_metrics(user=make_user()))
+
+    assert metrics["dispositivos"]["total"] == 2
+    assert (metrics["dispositivos"]["activos"], metrics["dispositivos"]["reparacion"]) == (1, 1)
+    assert (metrics["tickets"]["abiertos"], metrics["tickets"]["en_proceso"]) == (1, 1)
+    assert metrics["tickets"]["por_prioridad"]["ALTA"] == 1
+    assert metrics["backups"]["total"] == 1
+    # Solo funciones de agregación, nunca las filas
+    assert {target for target, _ in fake_supabase.calls} == {
+        "get_device_stats", "get_ticket_stats", "get_backup_stats",
+    }
+
+    global_metrics = asyncio.run(main.get_metrics(user=make_user(rol="LIDER_TI")))
+    assert global_metrics["dispositivos"]["total"] == 3
+    assert global_metrics["backups"] == {"total": 2, "fallidos": 1}
+
+
+def test_metrics_are_seeded_once_per_org_unit(fake_supabase):
+    seed(fake_supabase)
+    asyncio.run(main.get_metrics(user=make_user()))
+    fake_supabase.calls.clear()
+
+    asyncio.run(main.get_metrics(user=make_user(id="user-2")))
+    assert fake_supabase.calls == []
+
+    asyncio.run(main.get_metrics(user=make_user(org_unit_id="org-2")))
+    assert len(fake_supabase.calls) == 3
+
+
+def test_user_without_org_unit_gets_empty_metrics(fake_supabase):
+    seed(fake_supabase)
+
+    metrics = asyncio.run(main.get_metrics(user=make_user(org_unit_id=None)))
+
+    assert metrics["dispositivos"]["total"] == 0
+    assert fake_supabase.calls == []
+
+
+def test_write_paths_update_counters_without_recounting(fake_supabase):
+    seed(fake_supabase)
+    leader = make_user(rol="LIDER_TI")
+    ti = make_user(rol="TI")
+    asyncio.run(main.get_metrics(user=ti))
+    asyncio.run(main.get_metrics(user=leader))
+
+    async def writes():
+        await main.create_device(
+            main.DeviceCreate(nombre="PC", tipo="PC", estado="ACTIVO", ubicacion="Aula"), user=ti
+        )
+        await main.update_device("dev-2", main.DeviceUpdate(estado="RETIRADO"), user=ti)
+        await main.create_ticket(main.TicketCreate(titulo="t", descripcion="d", prioridad="MEDIA"), user=ti)
+        await main.update_ticket("t-1", main.TicketUpdate(estado="RESUELTO", prioridad="CRITICA"), user=ti)
+        await main.create_backup(
+            main.BackupCreate(device_id="dev-1", tipo="COMPLETA", almacenamiento="NUBE", frecuencia="DIARIA"),
+            user=ti,
+        )
+
+    asyncio.run(writes())
+    fake_supabase.calls.clear()
+
+    metrics = asyncio.run(main.get_metrics(user=ti))
+    global_metrics = asyncio.run(main.get_metrics(user=leader))
+    assert fake_supabase.calls == []
+
+    # Los contadores coinciden con un recuento completo en SQL
+    main.metric_counters.reset()
+    assert asyncio.run(main.get_metrics(user=ti)) == metrics
+    assert asyncio.run(main.get_metrics(user=leader)) == global_metrics
+    assert metrics["dispositivos"]["retirados"] == 1
+    assert metrics["tickets"]["por_prioridad"] == {"BAJA": 1, "MEDIA": 1, "ALTA": 0, "CRITICA": 1}
+    assert global_metrics["backups"] == {"total": 3, "fallidos": 1}
+
+
+def test_seed_is_discarded_when_a_delta_races_it():
+    counters = main.MetricCounters()
+    version = counters.version("org-1")
+    counters.ticket_changed("org-1", None, ("ABIERTO", "BAJA"))
+
+    assert counters.seed("org-1", ({}, {"total": 0}, {}), version) is False
+    assert counters.snapshot("org-1") is None
+    assert counters.seed("org-1", ({}, {"total": 1}, {}), counters.version("org-1")) is True
+
+
+def test_stale_counters_are_reconciled(fake_supabase, monkeypatch):
+    seed(fake_supabase)
+    asyncio.run(main.get_metrics(user=make_user()))
+    # Escritura de otro proceso, invisible para los contadores
+    fake_supabase.tables["devices"].append({"id": "dev-4", "org_unit_id": "org-1", "estado": "ACTIVO"})
+    monkeypatch.setattr(main.metric_counters, "reconcile_interval", 0)
+
+    assert main.metric_counters.is_stale("org-1")
+    asyncio.run(main.reconcile_metric_counters("org-1"))
+    assert main.metric_counters.snapshot("org-1", allow_stale=True)[0]["total"] == 3
+
+
+def rollup(org_unit_id, bucket, abiertos=0, resueltos=0, cerrados=0, resoluciones=()):
+    histogram = [0] * rollups.RESOLUTION_BINS
+    for minutes in resoluciones:
+        histogram[rollups.resolution_bin(minutes) - 1] += 1
+    return {
+        "org_unit_id": org_unit_id,
+        "granularity": "day",
+        "bucket": bucket,
+        "abiertos": abiertos,
+        "resueltos": resueltos,
+        "cerrados": cerrados,
+        "resolucion_hist": histogram,
+    }
+
+
+def test_histogram_percentiles_interpolate_within_bins():
+    histogram = [0] * rollups.RESOLUTION_BINS
+    for minutes in (10, 20, 20, 50, 100_000):
+        histogram[rollups.resolution_bin(minutes) - 1] += 1
+
+    assert rollups.histogram_percentile(histogram, 50) == 26.2
+    # El último intervalo es abierto: se reporta su límite inferior
+    assert rollups.histogram_percentile(histogram, 95) == 43200.0
+    assert rollups.histogram_percentile([0] * rollups.RESOLUTION_BINS, 50) is None
+
+
+def test_ticket_series_reads_rollups_and_scopes_by_org(fake_supabase):
+    fake_supabase.tables["ticket_rollups"] = [
+        rollup("org-1", "2025-03-01T00:00:00+00:00", abiertos=3, resueltos=1, resoluciones=[45]),
+        rollup("org-2", "2025-03-01T00:00:00+00:00", abiertos=2, resueltos=2, resoluciones=[10, 3000]),
+        rollup("org-1", "2025-03-03T00:00:00+00:00", cerrados=1),
+        rollup("org-1", "2025-04-01T00:00:00+00:00", abiertos=9),
+    ]
+    desde = datetime(2025, 3, 1, 12, tzinfo=timezone.utc)
+    hasta = datetime(2025, 3, 4, tzinfo=timezone.utc)
+
+    series = asyncio.run(main.get_ticket_series(desde=desde, hasta=hasta, user=make_user(rol="TI")))
+    assert [point["abiertos"] for point in series["series"]] == [3, 0, 0]
+    assert series["series"][2]["cerrados"] == 1
+    assert series["resumen"]["abiertos"] == 3
+    assert series["resumen"]["resolucion_min"]["p50"] == 45.0
+
+    # Un TI no puede pedir otra unidad; el Líder TI ve el agregado
+    other = asyncio.run(main.get_ticket_series(
+        desde=desde, hasta=hasta, org_unit_id="org-2", user=make_user(rol="TI")
+    ))
+    assert other["org_unit_id"] == "org-1"
+    global_series = asyncio.run(main.get_ticket_series(desde=desde, hasta=hasta, user=make_user(rol="LIDER_TI")))
+    assert global_series["series"][0]["abiertos"] == 5
+    assert global_series["resumen"]["resueltos"] == 3
+    assert "tickets" not in fake_supabase.tables
+
+
+def test_ticket_series_rejects_oversized_ranges(fake_supabase):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.get_ticket_series(
+            granularity="hour",
+            desde=datetime(2020, 1, 1),
+            hasta=datetime(2025, 1, 1),
+            user=make_user(rol="TI"),
+        ))
+    assert error.value.status_code == 400
+
+    # El rango se mide sin construir los buckets (año 1 por hora: ~17M)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.get_ticket_series(
+            granularity="hour", desde=datetime(1, 1, 1), hasta=datetime(2025, 1, 1), user=make_user(rol="TI"),
+        ))
+    assert error.value.status_code == 400
+
+
+def test_bucket_count_matches_bucket_range():
+    start = datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc)
+    for end in (start + timedelta(minutes=1), datetime(2025, 3, 4, tzinfo=timezone.utc),
+                datetime(2025, 3, 4, 0, 1, tzinfo=timezone.utc)):
+        for granularity in ("hour", "day"):
+            assert rollups.bucket_count(start, end, granularity) == len(rollups.bucket_range(start, end, granularity))
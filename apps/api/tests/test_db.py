@@ -0,0 +1,46 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from apps.api.app.db import QueryRunner, QueryTimeoutError
+
+
+def test_query_runner_runs_calls_off_the_event_loop():
+    runner = QueryRunner(max_concurrency=4, timeout=5)
+    loop_thread = threading.get_ident()
+
+    async def scenario():
+        threads = await asyncio.gather(*(runner.run(threading.get_ident) for _ in range(4)))
+        return threads
+
+    threads = asyncio.run(scenario())
+
+    assert loop_thread not in threads
+
+
+def test_query_runner_overlaps_blocking_calls():
+    runner = QueryRunner(max_concurrency=4, timeout=10)
+    # Solo se libera con las cuatro llamadas en curso a la vez; en serie se rompe
+    all_running = threading.Barrier(4, timeout=5)
+
+    async def scenario():
+        await asyncio.gather(*(runner.run(all_running.wait) for _ in range(4)))
+
+    asyncio.run(scenario())
+    assert not all_running.broken
+
+
+def test_query_runner_times_out():
+    runner = QueryRunner(max_concurrency=1, timeout=0.05)
+
+    with pytest.raises(QueryTimeoutError):
+        asyncio.run(runner.run(time.sleep, 0.5))
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+from apps.api.app import main
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Técnico",
+        "email": "ti@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+def test_get_device_cv_fetches_sections_concurrently(fake_supabase):
+    fake_supabase.tables.update({
+        "devices": [{"id": "dev-1", "org_unit_id": "org-1", "nombre": "PC Sala 1"}],
+        "device_specs": [{"device_id": "dev-1", "cpu": "i5"}],
+        "device_logs": [{"device_id": "dev-1", "fecha": "2024-01-01"}],
+        "backups": [{"device_id": "dev-1", "fecha_backup": "2024-01-02"}],
+        "audit_chain": [{"entity_id": "dev-1", "block_number": 1}],
+    })
+
+    # Las cuatro secciones solo pasan la barrera si están en curso a la vez;
+    # en serie la primera esperaría hasta el timeout (BrokenBarrierError)
+    sections = threading.Barrier(4, timeout=5)
+    for table in ("device_specs", "device_logs", "backups", "audit_chain"):
+        fake_supabase.gates[table] = sections
+
+    cv = asyncio.run(main.get_device_cv("dev-1", user=make_user()))
+
+    assert cv["device"]["nombre"] == "PC Sala 1"
+    assert cv["specs"]["cpu"] == "i5"
+    assert len(cv["logs"]) == len(cv["backups"]) == len(cv["audit"]) == 1
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from apps.api.app import main
+
+
+@pytest.fixture
+def entity_chains(fake_supabase, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_ENTITY_CHAINS", True)
+    return fake_supabase
+
+
+def register(events):
+    async def scenario():
+        return await asyncio.gather(*(
+            main.register_audit_event("UPDATE_DEVICE", entity_id, "user-1", {"n": n})
+            for entity_id, n in events
+        ))
+
+    return asyncio.run(scenario())
+
+
+def test_entities_get_independent_sub_chains(entity_chains):
+    blocks = register([("dev-1", 0), ("dev-2", 0), ("dev-1", 1), ("dev-2", 1), ("dev-1", 2)])
+
+    assert [block["block_number"] for block in blocks] == [1, 1, 2, 2, 3]
+    assert blocks[2]["previous_hash"] == blocks[0]["hash"]
+    assert blocks[3]["previous_hash"] == blocks[1]["hash"]
+    # Nada pasa por la cabeza global hasta el anclaje
+    assert "audit_chain" not in entity_chains.tables
+
+
+def test_anchor_records_entity_heads_in_global_chain(entity_chains):
+    register([("dev-1", 0), ("dev-2", 0), ("dev-1", 1)])
+
+    anchor = asyncio.run(main.anchor_entity_chains())
+
+    assert anchor["payload"]["action"] == main.ANCHOR_ACTION
+    heads = anchor["payload"]["data"]["heads"]
+    assert heads["dev-1"]["block_number"] == 2
+    assert heads["dev-2"]["block_number"] == 1
+    assert asyncio.run(main.verify_audit_chain())["valid"] is True
+    # Sin cambios nuevos no se crea otro bloque de anclaje
+    assert asyncio.run(main.anchor_entity_chains()) is None
+
+    register([("dev-2", 1)])
+    second = asyncio.run(main.anchor_entity_chains())
+    assert list(second["payload"]["data"]["heads"]) == ["dev-2"]
+
+
+def test_entity_endpoint_verifies_sub_chain_and_anchor(entity_chains):
+    register([("dev-1", 0), ("dev-1", 1), ("dev-2", 0)])
+    asyncio.run(main.anchor_entity_chains())
+    user = main.UserProfile(id="user-1", nombre="Técnico", email="ti@example.com", rol="TI", org_unit_id="org-1")
+
+    result = asyncio.run(main.get_entity_audit("dev-1", verify=True, user=user))
+    assert result["count"] == 2
+    assert result["chain"]["valid"] is True
+    assert result["chain"]["anchor"] == {"global_block": 1, "block_number": 2, "matches": True}
+
+    # Reescribir el contenido de un bloque ya anclado invalida la sub-cadena
+    tampered = next(
+        row for row in entity_chains.tables["audit_entity_chain"]
+        if row["entity_id"] == "dev-1" and row["block_number"] == 1
+    )
+    tampered["metadata"] = {"n": 99}
+    result = asyncio.run(main.get_entity_audit("dev-1", verify=True, user=user))
+    assert result["chain"]["valid"] is False
+    assert result["chain"]["corrupted_count"] == 1
+
+
+def test_entity_sub_chain_is_verified_by_pages(entity_chains, monkeypatch):
+    register([("dev-1", n) for n in range(5)])
+    asyncio.run(main.anchor_entity_chains())
+    monkeypatch.setattr(main, "AUDIT_VERIFY_PAGE_SIZE", 3)
+    entity_chains.max_rows = 2
+    entity_chains.calls.clear()
+
+    chain = asyncio.run(main.verify_entity_chain("dev-1"))
+
+    assert chain["valid"] is True
+    assert chain["anchor"] == {"global_block": 1, "block_number": 5, "matches": True}
+    # Tres páginas truncadas por max-rows y una vacía que confirma el final
+    assert entity_chains.calls.count(("audit_entity_chain", "select")) == 4
+
+
+def test_verify_hash_finds_entity_blocks(entity_chains):
+    block = register([("dev-1", 0)])[0]
+
+    result = asyncio.run(main.verify_hash(block["hash"]))
+
+    assert result["valid"] is True
+    assert result["entity_chain"] is True
+    assert result["data"]["entity_id"] == "dev-1"
+    assert result["merkle_proof"] is None
+    assert asyncio.run(main.verify_hash("0" * 64))["valid"] is False
@@ -0,0 +1,81 @@
+import asyncio
+
+from fastapi import Response
+
+from apps.api.app import main
+from apps.api.app.etags import etag_matches, make_etag
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Técnico",
+        "email": "ti@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+def list_tickets(user, etag=None, **params):
+    response = Response()
+    result = asyncio.run(main.list_tickets(response, if_none_match=etag, user=user, **params))
+    return result, response.headers.get("etag")
+
+
+def test_etag_matching_follows_weak_comparison():
+    etag = make_etag([1, 2], ["tickets"])
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"otro", {etag[2:]}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(make_etag([1, 3], ["tickets"]), etag)
+
+
+def test_matching_etag_returns_304_without_querying_the_list(fake_supabase):
+    user = make_user()
+    first, etag = list_tickets(user)
+    assert first == {"data": [], "next_cursor": None}
+    fake_supabase.calls.clear()
+
+    not_modified, _ = list_tickets(user, etag=etag)
+
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    # Versiones en caché: ni el listado ni change_versions se consultan
+    assert fake_supabase.calls == []
+
+
+def test_writes_change_the_etag(fake_supabase):
+    user = make_user()
+    _, etag = list_tickets(user)
+
+    asyncio.run(main.create_ticket(main.TicketCreate(titulo="t", descripcion="d", prioridad="BAJA"), user=user))
+
+    result, new_etag = list_tickets(user, etag=etag)
+    assert isinstance(result, dict) and len(result["data"]) == 1
+    assert new_etag != etag
+    # Otra unidad no se ve afectada
+    _, other = list_tickets(make_user(org_unit_id="org-2"))
+    fake_supabase.tables["tickets"][0]["titulo"] = "cambiado a mano"
+    assert list_tickets(make_user(org_unit_id="org-2"), etag=other)[0].status_code == 304
+
+
+def test_etag_depends_on_params_and_user_scope(fake_supabase):
+    _, base = list_tickets(make_user())
+    _, filtered = list_tickets(make_user(), estado="ABIERTO")
+    _, teacher = list_tickets(make_user(rol="DOCENTE", id="user-2"))
+    _, other_teacher = list_tickets(make_user(rol="DOCENTE", id="user-3"))
+    assert len({base, filtered, teacher, other_teacher}) == 4
+
+
+def test_other_process_writes_are_seen_after_the_version_ttl(fake_supabase):
+    user = make_user()
+    _, etag = list_tickets(user)
+    # Escritura de otro proceso: solo avanza la versión en la base
+    fake_supabase.tables["change_versions"] = [{"resource": "tickets", "org_unit_id": "org-1", "version": 7}]
+
+    assert list_tickets(user, etag=etag)[0].status_code == 304
+    main.change_version_cache.clear()
+    assert isinstance(list_tickets(user, etag=etag)[0], dict)
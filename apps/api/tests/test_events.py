@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from apps.api.app import main
+from apps.api.app.events import RESYNC_EVENT, EventBroker
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Técnico",
+        "email": "ti@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+def parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+def test_events_are_scoped_by_org_unit_and_owner():
+    async def scenario():
+        broker = EventBroker()
+        staff = broker.subscribe("org-1")
+        leader = broker.subscribe(None, see_all=True)
+        teacher = broker.subscribe("org-1", user_id="user-9")
+
+        broker.publish("ticket.created", {"id": "t-1"}, org_unit_id="org-1", owner_id="user-2")
+        broker.publish("ticket.created", {"id": "t-2"}, org_unit_id="org-1", owner_id="user-9")
+        broker.publish("device.updated", {"id": "dev-1"}, org_unit_id="org-2")
+        return [[sub.queue.get_nowait().data["id"] for _ in range(sub.queue.qsize())]
+                for sub in (staff, leader, teacher)]
+
+    staff, leader, teacher = asyncio.run(scenario())
+    assert staff == ["t-1", "t-2"]
+    assert leader == ["t-1", "t-2", "dev-1"]
+    assert teacher == ["t-2"]
+
+
+def test_slow_subscriber_gets_a_single_resync_event():
+    async def scenario():
+        broker = EventBroker(queue_size=2)
+        subscription = broker.subscribe("org-1")
+        for n in range(5):
+            broker.publish("ticket.updated", {"n": n}, org_unit_id="org-1")
+        return [subscription.queue.get_nowait().type for _ in range(subscription.queue.qsize())], broker
+
+    types, broker = asyncio.run(scenario())
+    assert types == [RESYNC_EVENT]
+    assert broker.dropped == 1
+
+
+def test_write_handlers_feed_the_stream(fake_supabase):
+    async def scenario():
+        stream = main.stream_events(make_user())
+        assert await stream.__anext__() == "retry: 5000\n\n"
+        await main.create_ticket(
+            main.TicketCreate(titulo="Sin red", descripcion="Sala 302", prioridad="ALTA"),
+            user=make_user(rol="DOCENTE", id="user-2"),
+        )
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return chunks
+
+    chunks = asyncio.run(scenario())
+    metrics_event, ticket_event = (parse(chunk) for chunk in chunks)
+    assert metrics_event == ("metrics", {"delta": {"tickets": {"total": 1, "abiertos": 1, "por_prioridad": {"ALTA": 1}}}})
+    assert ticket_event[0] == "ticket.created"
+    assert ticket_event[1]["titulo"] == "Sin red"
+    assert main.event_broker.stats()["subscribers"] == 0
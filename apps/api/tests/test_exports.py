@@ -0,0 +1,133 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+from apps.api.app import main
+from apps.api.app.exports import encode_pages, gzip_chunks
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Técnico",
+        "email": "ti@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+def read_body(response):
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(collect())
+
+
+def seed_devices(fake_supabase):
+    fake_supabase.tables["devices"] = [
+        {
+            "id": f"d-{n:02d}",
+            # Nombres repetidos: el id desempata entre páginas
+            "nombre": f"Equipo {n // 2}",
+            "tipo": "PC",
+            "estado": "ACTIVO",
+            "org_unit_id": "org-1" if n % 3 else "org-2",
+            "ubicacion": "Sala, piso \"2\"",
+            "imagen": "data:image/png;base64,AAAA",
+        }
+        for n in range(9)
+    ]
+    fake_supabase.tables["device_specs"] = [
+        {"id": "s-1", "device_id": "d-01", "cpu": "Ryzen 5", "perifericos": ["mouse", "teclado"]},
+    ]
+
+
+def test_device_export_streams_every_row_once_with_specs(fake_supabase, monkeypatch):
+    seed_devices(fake_supabase)
+    monkeypatch.setattr(main, "EXPORT_PAGE_SIZE", 2)
+
+    response = asyncio.run(main.export_devices(format="ndjson", gzip=True, user=make_user(rol="LIDER_TI")))
+
+    assert response.media_type == "application/gzip"
+    assert ".ndjson.gz" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in gzip.decompress(read_body(response)).decode().splitlines()]
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert len(rows) == 9
+    assert "imagen" not in rows[0]
+    by_id = {row["id"]: row for row in rows}
+    assert by_id["d-01"]["specs"]["perifericos"] == ["mouse", "teclado"]
+    assert by_id["d-02"]["specs"] is None
+    # Una consulta de especificaciones por página de dispositivos
+    assert fake_supabase.calls.count(("device_specs", "select")) == 5
+
+
+def test_device_csv_export_is_scoped_and_flattens_specs(fake_supabase):
+    seed_devices(fake_supabase)
+
+    response = asyncio.run(main.export_devices(format="csv", gzip=False, user=make_user()))
+
+    text = read_body(response).decode()
+    assert text.startswith("\ufeff")
+    rows = list(csv.DictReader(io.StringIO(text[1:])))
+    assert {row["org_unit_id"] for row in rows} == {"org-1"}
+    assert len(rows) == 6
+    d01 = next(row for row in rows if row["id"] == "d-01")
+    assert d01["ubicacion"] == 'Sala, piso "2"'
+    assert d01["specs_cpu"] == "Ryzen 5"
+    assert json.loads(d01["specs_perifericos"]) == ["mouse", "teclado"]
+
+
+def test_ticket_export_pages_by_creation_date(fake_supabase, monkeypatch):
+    fake_supabase.tables["tickets"] = [
+        {
+            "id": f"t-{n:02d}",
+            "titulo": f"Ticket {n}",
+            "org_unit_id": "org-1",
+            "estado": "ABIERTO" if n % 2 else "CERRADO",
+            "fecha_creacion": f"2025-03-{1 + n // 3:02d}T10:00:00+00:00",
+        }
+        for n in range(7)
+    ]
+    monkeypatch.setattr(main, "EXPORT_PAGE_SIZE", 2)
+
+    response = asyncio.run(main.export_tickets(
+        format="ndjson", gzip=False, estado="ABIERTO", user=make_user(rol="DIRECTOR"),
+    ))
+
+    rows = [json.loads(line) for line in read_body(response).decode().splitlines()]
+    assert [row["id"] for row in rows] == ["t-01", "t-03", "t-05"]
+
+
+def test_gzip_chunks_flush_each_page():
+    async def pages():
+        yield [{"a": 1}]
+        yield [{"a": 2}]
+
+    async def collect():
+        return [chunk async for chunk in gzip_chunks(encode_pages(pages(), "ndjson", ["a"]))]
+
+    chunks = asyncio.run(collect())
+
+    # Encabezado, una página por trozo y el cierre
+    assert len(chunks) == 4
+    assert gzip.decompress(b"".join(chunks)) == b'{"a":1}\n{"a":2}\n'
+
+
+def test_device_export_survives_row_caps_and_chunks_spec_lookups(fake_supabase, monkeypatch):
+    seed_devices(fake_supabase)
+    monkeypatch.setattr(main, "EXPORT_PAGE_SIZE", 4)
+    monkeypatch.setattr(main, "IN_FILTER_CHUNK_SIZE", 2)
+    # PostgREST recorta a 3 filas aunque se pidan 4: no es la última página
+    fake_supabase.max_rows = 3
+
+    response = asyncio.run(main.export_devices(format="ndjson", gzip=False, user=make_user(rol="LIDER_TI")))
+
+    rows = [json.loads(line) for line in read_body(response).decode().splitlines()]
+    assert len(rows) == 9
+    assert next(row for row in rows if row["id"] == "d-01")["specs"]["cpu"] == "Ryzen 5"
+    # Tres páginas de 3 dispositivos, cada una con dos tandas de ids
+    assert fake_supabase.calls.count(("device_specs", "select")) == 6
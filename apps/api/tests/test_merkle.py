@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+
+from apps.api.app import main
+from apps.api.app.merkle import (
+    MerkleFrontier,
+    inclusion_proof,
+    leaf_hash,
+    node_hash,
+    verify_inclusion,
+)
+
+
+def reference_root(leaves):
+    """MTH de RFC 6962 calculado de forma recursiva directa."""
+    if len(leaves) == 1:
+        return leaves[0]
+    split = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return node_hash(reference_root(leaves[:split]), reference_root(leaves[split:]))
+
+
+def build_tree(size):
+    leaves = [leaf_hash(hashlib.sha256(str(n).encode()).hexdigest()) for n in range(size)]
+    frontier = MerkleFrontier()
+    nodes = {}
+    for leaf in leaves:
+        for level, index, node in frontier.append(leaf):
+            nodes[(level, index)] = node
+    return leaves, frontier, nodes
+
+
+def test_frontier_root_and_proofs_match_reference():
+    for size in range(1, 34):
+        leaves, frontier, nodes = build_tree(size)
+        root = reference_root(leaves)
+        assert frontier.root() == root
+
+        for index in range(size):
+            proof = inclusion_proof(index, size, nodes)
+            assert len(proof) <= size.bit_length()
+            assert verify_inclusion(leaves[index], index, size, proof, root)
+            if size > 1:
+                tampered = [bytes(32)] + proof[1:]
+                assert not verify_inclusion(leaves[index], index, size, tampered, root)
+                assert not verify_inclusion(leaves[(index + 1) % size], index, size, proof, root)
+
+
+def test_frontier_resumes_from_persisted_nodes():
+    _, frontier, nodes = build_tree(13)
+    resumed = MerkleFrontier(13, nodes)
+    extra = leaf_hash("ab" * 32)
+
+    frontier.append(extra)
+    resumed.append(extra)
+
+    assert resumed.root() == frontier.root()
+
+
+def register_events(count, start=0):
+    async def scenario():
+        for n in range(start, start + count):
+            await main.register_audit_event("UPDATE_DEVICE", "dev-1", "user-1", {"n": n})
+
+    asyncio.run(scenario())
+
+
+def test_verify_hash_returns_inclusion_proof(fake_supabase):
+    register_events(5)
+    asyncio.run(main.sync_audit_merkle_tree())
+    block = fake_supabase.tables["audit_chain"][2]
+
+    result = asyncio.run(main.verify_hash(block["hash"]))
+    proof = result["merkle_proof"]
+
+    assert result["valid"] is True
+    assert proof["included"] is True
+    assert (proof["leaf_index"], proof["tree_size"]) == (2, 5)
+    assert proof["root_signature"] == main.sign_merkle_root(main.AUDIT_SECRET, 5, proof["root_hash"])
+    assert verify_inclusion(
+        leaf_hash(block["hash"]),
+        proof["leaf_index"],
+        proof["tree_size"],
+        [bytes.fromhex(node) for node in proof["audit_path"]],
+        bytes.fromhex(proof["root_hash"]),
+    )
+
+
+def test_verify_hash_never_builds_the_tree_inline(fake_supabase):
+    register_events(5)
+    fake_supabase.calls.clear()
+
+    result = asyncio.run(main.verify_hash(fake_supabase.tables["audit_chain"][2]["hash"]))
+
+    # Sin raíz publicada el bloque se retorna sin prueba; el árbol se arma en segundo plano
+    assert result["valid"] is True
+    assert result["merkle_proof"] is None
+    assert fake_supabase.calls.count(("audit_chain", "select")) == 1
+    assert "audit_merkle_nodes" not in fake_supabase.tables
+
+
+def test_merkle_tree_grows_incrementally(fake_supabase):
+    register_events(5)
+    asyncio.run(main.sync_audit_merkle_tree())
+    nodes_before = {row["node_key"]: row["hash"] for row in fake_supabase.tables["audit_merkle_nodes"]}
+
+    register_events(3, start=5)
+    fake_supabase.calls.clear()
+    root = asyncio.run(main.sync_audit_merkle_tree())
+
+    # Solo se leen los bloques nuevos (una página y la vacía que cierra) y los nodos existentes no cambian
+    chain_reads = [call for call in fake_supabase.calls if call == ("audit_chain", "select")]
+    assert len(chain_reads) == 2
+    nodes_after = {row["node_key"]: row["hash"] for row in fake_supabase.tables["audit_merkle_nodes"]}
+    assert all(nodes_after[key] == value for key, value in nodes_before.items())
+
+    leaves = [leaf_hash(row["hash"]) for row in fake_supabase.tables["audit_chain"]]
+    assert root["tree_size"] == 8
+    assert root["root_hash"] == reference_root(leaves).hex()
+
+
+def test_inclusion_proof_detects_rewritten_block(fake_supabase):
+    register_events(4)
+    asyncio.run(main.sync_audit_merkle_tree())
+
+    block = fake_supabase.tables["audit_chain"][1]
+    block["hash"] = "f" * 64
+
+    proof = asyncio.run(main.build_audit_inclusion_proof(block["block_number"], block["hash"]))
+
+    assert proof["included"] is False
+
+
+def test_tree_advances_inline_as_blocks_are_appended(fake_supabase, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_MERKLE_SYNC_DELAY_SECONDS", 0)
+    register_events(5)
+
+    # Los bloques recién insertados se agregan al árbol sin releer la cadena
+    assert ("audit_chain", "select") not in fake_supabase.calls
+    assert len(fake_supabase.tables["audit_merkle_roots"]) == 5
+    result = asyncio.run(main.verify_hash(fake_supabase.tables["audit_chain"][4]["hash"]))
+    assert (result["merkle_proof"]["tree_size"], result["merkle_proof"]["included"]) == (5, True)
+
+
+def test_merkle_sync_endpoint_publishes_pending_blocks(fake_supabase):
+    register_events(3)
+    user = main.UserProfile(id="user-1", nombre="Técnico", email="ti@example.com", rol="TI", org_unit_id="org-1")
+
+    first = asyncio.run(main.sync_audit_merkle_tree_now(user=user))
+    again = asyncio.run(main.sync_audit_merkle_tree_now(user=user))
+
+    assert first["tree_size"] == again["tree_size"] == 3
+    assert first["root_hash"] == again["root_hash"]
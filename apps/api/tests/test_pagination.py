@@ -0,0 +1,203 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+from apps.api.app import main
+from apps.api.app.pagination import decode_cursor, encode_cursor
+
+
+def make_user(**overrides):
+    data = {
+        "id": "user-1",
+        "nombre": "Técnico",
+        "email": "ti@example.com",
+        "rol": "TI",
+        "org_unit_id": "org-1",
+    }
+    data.update(overrides)
+    return main.UserProfile(**data)
+
+
+def seed_tickets(fake_supabase):
+    fake_supabase.tables["tickets"] = [
+        {
+            "id": f"t-{n:02d}",
+            "titulo": f"Ticket {n}",
+            "org_unit_id": "org-1" if n % 4 else "org-2",
+            "solicitante_id": "user-2" if n % 3 == 0 else "user-3",
+            "prioridad": "ALTA" if n % 2 else "BAJA",
+            "estado": "ABIERTO",
+            # Varios tickets comparten fecha: el id desempata
+            "fecha_creacion": f"2025-03-{1 + n // 3:02d}T10:00:00.5+00:00",
+        }
+        for n in range(12)
+    ]
+
+
+def list_all(user, **params):
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(main.list_tickets(Response(), limit=2, cursor=cursor, user=user, **params))
+        seen.extend(page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(["2025-03-01T10:00:00.5+00:00", "t-1"])) == [
+        "2025-03-01T10:00:00.5+00:00", "t-1",
+    ]
+
+
+def test_ticket_pages_cover_every_ticket_once_in_order(fake_supabase):
+    seed_tickets(fake_supabase)
+
+    tickets = list_all(make_user(rol="LIDER_TI"))
+
+    assert len(tickets) == 12
+    keys = [(ticket["fecha_creacion"], ticket["id"]) for ticket in tickets]
+    assert keys == sorted(keys, reverse=True)
+
+    org_tickets = list_all(make_user())
+    assert {ticket["org_unit_id"] for ticket in org_tickets} == {"org-1"}
+    own_tickets = list_all(make_user(rol="DOCENTE", id="user-2"))
+    assert {ticket["solicitante_id"] for ticket in own_tickets} == {"user-2"}
+
+
+def test_ticket_filters_and_projection(fake_supabase):
+    seed_tickets(fake_supabase)
+
+    page = asyncio.run(main.list_tickets(
+        Response(),
+        prioridad="ALTA",
+        desde=datetime(2025, 3, 2),
+        fields="titulo,prioridad",
+        user=make_user(rol="LIDER_TI"),
+    ))
+
+    assert page["data"]
+    assert all(ticket["prioridad"] == "ALTA" and ticket["fecha_creacion"] >= "2025-03-02" for ticket in page["data"])
+    # Solo lo pedido más las columnas del cursor
+    assert set(page["data"][0]) == {"id", "fecha_creacion", "titulo", "prioridad"}
+
+
+@pytest.mark.parametrize("params", [{"cursor": "no-es-un-cursor"}, {"fields": "titulo,password"}])
+def test_invalid_cursor_or_fields_are_rejected(fake_supabase, params):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.list_tickets(Response(), user=make_user(), **params))
+    assert error.value.status_code == 400
+
+
+def seed_devices(fake_supabase):
+    fake_supabase.tables["devices"] = [
+        {
+            "id": f"dev-{n:02d}",
+            # Nombres repetidos: el id desempata
+            "nombre": f"PC-{n // 2:02d}",
+            "tipo": "PC",
+            "estado": "ACTIVO" if n % 3 else "REPARACIÓN",
+            "org_unit_id": "org-1" if n < 9 else "org-2",
+            "ubicacion": "Sala 100%" if n == 4 else f"Sala {300 + n % 3}",
+            "marca": "Dell" if n % 2 else "HP",
+            "creado_en": f"2025-01-{1 + n:02d}T00:00:00+00:00",
+        }
+        for n in range(12)
+    ]
+
+
+def list_all_devices(user, **params):
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(main.list_devices(Response(), limit=2, cursor=cursor, user=user, **params))
+        seen.extend(page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen, page["count"]
+
+
+def test_device_pages_follow_the_requested_sort(fake_supabase):
+    seed_devices(fake_supabase)
+
+    devices, count = list_all_devices(make_user())
+    assert count == len(devices) == 9
+    assert [(d["nombre"], d["id"]) for d in devices] == sorted((d["nombre"], d["id"]) for d in devices)
+
+    newest, _ = list_all_devices(make_user(rol="LIDER_TI"), sort="-creado_en", fields="nombre")
+    assert [d["id"] for d in newest] == [f"dev-{n:02d}" for n in reversed(range(12))]
+    assert set(newest[0]) == {"id", "creado_en", "nombre"}
+
+
+def test_device_filters_match_partially_and_literally(fake_supabase):
+    seed_devices(fake_supabase)
+
+    dell, count = list_all_devices(make_user(rol="LIDER_TI"), marca="dell", ubicacion="sala 30")
+    assert count == len(dell) == 6
+    assert all(d["marca"] == "Dell" for d in dell)
+
+    # % es literal, no comodín
+    literal, _ = list_all_devices(make_user(rol="LIDER_TI"), ubicacion="100%")
+    assert [d["id"] for d in literal] == ["dev-04"]
+
+
+def test_device_count_is_cached_until_a_device_changes(fake_supabase):
+    seed_devices(fake_supabase)
+    user = make_user()
+    asyncio.run(main.list_devices(Response(), user=user))
+
+    fake_supabase.tables["devices"].append({"id": "dev-99", "nombre": "PC-99", "org_unit_id": "org-1"})
+    assert asyncio.run(main.list_devices(Response(), user=user))["count"] == 9
+
+    asyncio.run(main.update_device("dev-00", main.DeviceUpdate(notas="Revisado"), user=user))
+    assert asyncio.run(main.list_devices(Response(), user=user))["count"] == 10
+
+
+def test_device_sort_must_be_indexed(fake_supabase):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.list_devices(Response(), sort="notas", user=make_user()))
+    assert error.value.status_code == 400
+
+
+def test_ticket_search_ranks_ignores_accents_and_pages(fake_supabase):
+    fake_supabase.tables["tickets"] = [
+        {"id": "t-1", "titulo": "Impresora atascada", "descripcion": "No imprime", "org_unit_id": "org-1",
+         "solicitante_id": "user-2", "estado": "ABIERTO"},
+        {"id": "t-2", "titulo": "Sin red", "descripcion": "Falla la impresión en red", "org_unit_id": "org-1",
+         "solicitante_id": "user-3", "estado": "ABIERTO"},
+        {"id": "t-3", "titulo": "Proyector", "descripcion": "No enciende", "org_unit_id": "org-1",
+         "solicitante_id": "user-2", "estado": "ABIERTO"},
+        {"id": "t-4", "titulo": "Impresoras del piso 2", "descripcion": "Toner", "org_unit_id": "org-2",
+         "solicitante_id": "user-2", "estado": "ABIERTO"},
+    ]
+    fake_supabase.tables["ticket_comments"] = [
+        {"ticket_id": "t-3", "comentario": "Era la impresora, no el proyector", "es_sistema": False},
+        {"ticket_id": "t-2", "comentario": "Estado cambiado: impresora", "es_sistema": True},
+    ]
+
+    def search_all(user, q, limit=1):
+        seen, cursor = [], None
+        while True:
+            page = asyncio.run(main.search_tickets(q=q, limit=limit, cursor=cursor, user=user))
+            seen.extend(ticket["id"] for ticket in page["data"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    # Título antes que comentario; el plural y las tildes no cambian el resultado
+    assert search_all(make_user(rol="LIDER_TI"), "impresoras") == ["t-4", "t-1", "t-3"]
+    assert search_all(make_user(), "IMPRESION") == ["t-2"]
+    assert search_all(make_user(), "impresora") == ["t-1", "t-3"]
+    assert search_all(make_user(rol="DOCENTE", id="user-2"), "impresora") == ["t-4", "t-1", "t-3"]
+
+    # Personal TI sin unidad: la búsqueda no se abre a toda la institución
+    calls = len(fake_supabase.calls)
+    for rol in ("TI", "DIRECTOR"):
+        page = asyncio.run(main.search_tickets(q="impresora", user=make_user(rol=rol, org_unit_id=None)))
+        assert page == {"data": [], "next_cursor": None}
+    assert len(fake_supabase.calls) == calls
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.search_tickets(q=" a ", user=make_user()))
+    assert exc.value.status_code == 400
@@ -14,6 +14,7 @@ import {
   PlusCircle,
   ShieldCheck
 } from 'lucide-react';
+import { subscribeEvents } from '../lib/api';
 import { LineChart, Line, BarChart, Bar, PieChart, Pie, Cell, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 
 interface DashboardProps {
@@ -37,12 +38,34 @@ interface Metrics {
   };
 }
 
+// Suma recursivamente los deltas de contadores que llegan por SSE
+const applyDelta = (target: any, delta: any): any => {
+  const result = { ...target };
+  for (const [key, value] of Object.entries(delta)) {
+    result[key] =
+      typeof value === 'number'
+        ? (result[key] || 0) + value
+        : applyDelta(result[key] || {}, value);
+  }
+  return result;
+};
+
 const Dashboard: React.FC<DashboardProps> = ({ userId, userRole }) => {
   const [metrics, setMetrics] = useState<Metrics | null>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     fetchMetrics();
+
+    // Los contadores se actualizan por eventos; 'resync' (reconexión o
+    // periódico, por si hay escrituras en otros procesos) vuelve a consultar
+    return subscribeEvents((type, data) => {
+      if (type === 'metrics') {
+        setMetrics((current) => (current ? applyDelta(current, data.delta) : current));
+      } else if (type === 'resync') {
+        fetchMetrics();
+      }
+    });
   }, []);
 
   const fetchMetrics = async () => {
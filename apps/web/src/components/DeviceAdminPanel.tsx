@@ -133,8 +133,19 @@ const DeviceAdminPanel: React.FC = () => {
   const fetchDevices = async () => {
     setLoading(true);
     try {
-      const response = await devices.list();
-      const list = response.data || [];
+      // La búsqueda y el filtro del panel son locales: se recorren todas las
+      // páginas (solo con las columnas que usa el panel) siguiendo el cursor
+      const list: Device[] = [];
+      let cursor: string | undefined;
+      do {
+        const response = await devices.list({
+          limit: 200,
+          fields: 'nombre,estado,ubicacion,notas,tipo',
+          ...(cursor ? { cursor } : {}),
+        });
+        list.push(...(response.data || []));
+        cursor = response.next_cursor || undefined;
+      } while (cursor);
       setDeviceList(list);
 
       if (selectedDeviceId) {
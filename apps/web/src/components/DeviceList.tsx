@@ -27,6 +27,9 @@ interface Device {
 
 const DeviceList: React.FC = () => {
   const [deviceList, setDeviceList] = useState<Device[]>([]);
+  const [totalDevices, setTotalDevices] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
   const [filterEstado, setFilterEstado] = useState('');
@@ -58,6 +61,8 @@ const DeviceList: React.FC = () => {
       
       const response = await devices.list(params);
       setDeviceList(response.data || []);
+      setTotalDevices(response.count || 0);
+      setNextCursor(response.next_cursor || null);
     } catch (error) {
       console.error('Error al cargar dispositivos:', error);
     } finally {
@@ -65,6 +70,24 @@ const DeviceList: React.FC = () => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const params: Record<string, string> = { cursor: nextCursor };
+      if (filterEstado) params.estado = filterEstado;
+      if (filterTipo) params.tipo = filterTipo;
+
+      const response = await devices.list(params);
+      setDeviceList((current) => [...current, ...(response.data || [])]);
+      setNextCursor(response.next_cursor || null);
+    } catch (error) {
+      console.error('Error al cargar dispositivos:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getDeviceIcon = (tipo: string) => {
     switch (tipo) {
       case 'PC':
@@ -222,6 +245,17 @@ const DeviceList: React.FC = () => {
           ))}
         </div>
       )}
+
+      {nextCursor && (
+        <div className="flex flex-col items-center gap-2">
+          <p className="text-sm text-gray-500">
+            Mostrando {deviceList.length} de {totalDevices} dispositivos
+          </p>
+          <button onClick={loadMore} disabled={loadingMore} className="btn-secondary">
+            {loadingMore ? 'Cargando...' : 'Cargar más'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,7 +1,7 @@
 // src/components/TicketList.tsx
 import React, { useState, useEffect } from 'react';
-import { AlertCircle, Plus, Clock, CheckCircle, XCircle } from 'lucide-react';
-import { tickets } from '../lib/api';
+import { AlertCircle, Plus, Clock, CheckCircle, XCircle, Search } from 'lucide-react';
+import { subscribeEvents, tickets } from '../lib/api';
 
 interface Ticket {
   id: string;
@@ -18,21 +18,49 @@ interface Ticket {
 
 const TicketList: React.FC = () => {
   const [ticketList, setTicketList] = useState<Ticket[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [filterEstado, setFilterEstado] = useState('');
+  const [searchInput, setSearchInput] = useState('');
+  const [searchQuery, setSearchQuery] = useState('');
   const [showCreateModal, setShowCreateModal] = useState(false);
 
   useEffect(() => {
     fetchTickets();
-  }, [filterEstado]);
+
+    // Altas y cambios llegan por SSE; la lista se recarga con cada 'resync'
+    // (eventos perdidos o recarga periódica para escrituras de otros procesos)
+    return subscribeEvents((type, data) => {
+      if (type === 'ticket.created') {
+        // Con una búsqueda activa no se sabe si el ticket nuevo coincide
+        if (!searchQuery && (!filterEstado || data.estado === filterEstado)) {
+          setTicketList((current) => [data as Ticket, ...current]);
+        }
+      } else if (type === 'ticket.updated') {
+        setTicketList((current) =>
+          current
+            .map((ticket) => (ticket.id === data.id ? { ...ticket, ...data } : ticket))
+            .filter((ticket) => !filterEstado || ticket.estado === filterEstado),
+        );
+      } else if (type === 'resync') {
+        fetchTickets();
+      }
+    });
+  }, [filterEstado, searchQuery]);
+
+  // Con texto de búsqueda se usa el índice del servidor (ordenado por relevancia)
+  const requestTickets = (params: any) =>
+    searchQuery ? tickets.search({ ...params, q: searchQuery }) : tickets.list(params);
 
   const fetchTickets = async () => {
     try {
       const params: any = {};
       if (filterEstado) params.estado = filterEstado;
       
-      const response = await tickets.list(params);
+      const response = await requestTickets(params);
       setTicketList(response.data || []);
+      setNextCursor(response.next_cursor || null);
     } catch (error) {
       console.error('Error al cargar tickets:', error);
     } finally {
@@ -40,6 +68,23 @@ const TicketList: React.FC = () => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const params: any = { cursor: nextCursor };
+      if (filterEstado) params.estado = filterEstado;
+
+      const response = await requestTickets(params);
+      setTicketList((current) => [...current, ...(response.data || [])]);
+      setNextCursor(response.next_cursor || null);
+    } catch (error) {
+      console.error('Error al cargar tickets:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getPrioridadBadge = (prioridad: string) => {
     switch (prioridad) {
       case 'CRITICA':
@@ -147,6 +192,26 @@ const TicketList: React.FC = () => {
             </button>
           </div>
 
+          <form
+            onSubmit={(event) => {
+              event.preventDefault();
+              const query = searchInput.trim();
+              setSearchQuery(query.length >= 2 ? query : '');
+            }}
+            className="relative w-full md:w-72"
+          >
+            <Search className="w-4 h-4 text-gray-400 absolute left-3 top-1/2 -translate-y-1/2" />
+            <input
+              type="search"
+              value={searchInput}
+              onChange={(event) => {
+                setSearchInput(event.target.value);
+                if (!event.target.value) setSearchQuery('');
+              }}
+              placeholder="Buscar en tickets y comentarios"
+              className="input pl-9"
+            />
+          </form>
 
           <a
             href="/helpdesk/new"
@@ -206,6 +271,18 @@ const TicketList: React.FC = () => {
               </div>
             </a>
           ))}
+
+          {nextCursor && (
+            <div className="flex justify-center">
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="btn-secondary"
+              >
+                {loadingMore ? 'Cargando...' : 'Cargar más'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -71,7 +71,17 @@ export const auth = {
 
 // Devices
 export const devices = {
-  list: async (params?: { estado?: string; tipo?: string }) => {
+  list: async (params?: {
+    estado?: string;
+    tipo?: string;
+    ubicacion?: string;
+    marca?: string;
+    modelo?: string;
+    sort?: string;
+    fields?: string;
+    limit?: number;
+    cursor?: string;
+  }) => {
     const query = new URLSearchParams(params as any).toString();
     return fetchAPI(`/inventory/devices${query ? `?${query}` : ''}`);
   },
@@ -120,11 +130,28 @@ export const inventoryPermissions = {
 
 // Tickets
 export const tickets = {
-  list: async (params?: { estado?: string }) => {
+  list: async (params?: {
+    estado?: string;
+    prioridad?: string;
+    asignado_a?: string;
+    fields?: string;
+    limit?: number;
+    cursor?: string;
+  }) => {
     const query = new URLSearchParams(params as any).toString();
     return fetchAPI(`/tickets${query ? `?${query}` : ''}`);
   },
   
+  search: async (params: {
+    q: string;
+    estado?: string;
+    limit?: number;
+    cursor?: string;
+  }) => {
+    const query = new URLSearchParams(params as any).toString();
+    return fetchAPI(`/tickets/search?${query}`);
+  },
+
   get: async (id: string) => {
     return fetchAPI(`/tickets/${id}`);
   },
@@ -158,6 +185,83 @@ export const dashboard = {
   },
 };
 
+// Eventos en vivo (SSE). Se usa fetch en lugar de EventSource porque este
+// no permite enviar el header Authorization.
+export type ServerEventHandler = (type: string, data: any) => void;
+
+// Los eventos solo llegan desde el proceso de la API que atiende la conexión:
+// con varios workers, o en Netlify (que no transmite respuestas abiertas),
+// las escrituras de otros procesos no se ven. Un 'resync' periódico hace que
+// los componentes vuelvan a consultar (barato con ETag/304 en los listados).
+const RESYNC_INTERVAL_MS = 60000;
+
+export function subscribeEvents(
+  onEvent: ServerEventHandler,
+  resyncMs: number = RESYNC_INTERVAL_MS,
+): () => void {
+  const controller = new AbortController();
+  const resyncTimer = setInterval(() => {
+    if (document.visibilityState === 'visible') onEvent('resync', {});
+  }, resyncMs);
+  let retryMs = 5000;
+  let connections = 0;
+
+  const dispatch = (block: string) => {
+    let type = 'message';
+    const data: string[] = [];
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event: ')) type = line.slice(7);
+      else if (line.startsWith('data: ')) data.push(line.slice(6));
+      else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7)) || retryMs;
+    }
+    if (data.length) {
+      try {
+        onEvent(type, JSON.parse(data.join('\n')));
+      } catch (error) {
+        console.error('Evento inválido:', error);
+      }
+    }
+  };
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const token = localStorage.getItem('access_token');
+        const response = await fetch(`${API_URL}/events`, {
+          headers: token ? { Authorization: `Bearer ${token}` } : {},
+          signal: controller.signal,
+        });
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+        // Al reconectar pudo haber cambios que no llegaron
+        if (connections++ > 0) onEvent('resync', {});
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let index;
+          while ((index = buffer.indexOf('\n\n')) >= 0) {
+            dispatch(buffer.slice(0, index));
+            buffer = buffer.slice(index + 2);
+          }
+        }
+      } catch {
+        if (controller.signal.aborted) return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  };
+
+  connect();
+  return () => {
+    clearInterval(resyncTimer);
+    controller.abort();
+  };
+}
+
 // Backups
 export const backups = {
   list: async (deviceId?: string) => {
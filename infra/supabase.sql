@@ -3,6 +3,13 @@
 
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- Búsqueda de texto en español sin distinguir tildes ("impresión" = "impresion")
+CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+ALTER TEXT SEARCH CONFIGURATION es_unaccent
+    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
 
 -- ==================== ENUMS ====================
 
@@ -160,6 +167,110 @@ CREATE TABLE audit_chain (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Cabeza de la cadena de auditoría (fila única: último hash y número de bloque)
+CREATE TABLE audit_chain_head (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    hash VARCHAR(64) NOT NULL,
+    block_number BIGINT NOT NULL,
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO audit_chain_head (id, hash, block_number)
+SELECT
+    TRUE,
+    COALESCE((SELECT hash FROM audit_chain ORDER BY block_number DESC LIMIT 1), repeat('0', 64)),
+    COALESCE((SELECT MAX(block_number) FROM audit_chain), 0);
+
+-- Checkpoints firmados de verificación (bloque hasta el cual la cadena se comprobó válida)
+CREATE TABLE audit_chain_checkpoints (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    block_number BIGINT NOT NULL,
+    hash VARCHAR(64) NOT NULL,
+    signature VARCHAR(64) NOT NULL,
+    verified_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    verified_by UUID REFERENCES users(id) ON DELETE SET NULL
+);
+
+-- Sub-cadenas de auditoría por entidad (opcional, AUDIT_ENTITY_CHAINS).
+-- block_number es la secuencia dentro de la entidad; las cabezas se anclan
+-- periódicamente en audit_chain con un bloque ANCHOR_ENTITY_CHAINS.
+CREATE TABLE audit_entity_chain (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    entity_id UUID NOT NULL,
+    block_number BIGINT NOT NULL,
+    hash VARCHAR(64) NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    previous_hash VARCHAR(64) NOT NULL,
+    signature VARCHAR(64) NOT NULL,
+    action VARCHAR(50) NOT NULL,
+    user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    metadata JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (entity_id, block_number),
+    UNIQUE (entity_id, previous_hash)
+);
+
+-- Cabeza de cada sub-cadena y hasta qué bloque quedó anclada en la cadena global
+CREATE TABLE audit_entity_heads (
+    entity_id UUID PRIMARY KEY,
+    hash VARCHAR(64) NOT NULL,
+    block_number BIGINT NOT NULL,
+    anchored_block_number BIGINT NOT NULL DEFAULT 0,
+    anchor_block BIGINT,
+    needs_anchor BOOLEAN GENERATED ALWAYS AS (block_number > anchored_block_number) STORED,
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Nodos del árbol de Merkle sobre audit_chain (solo subárboles perfectos; nunca se reescriben)
+CREATE TABLE audit_merkle_nodes (
+    node_key VARCHAR(40) PRIMARY KEY, -- 'nivel:índice'
+    level SMALLINT NOT NULL,
+    idx BIGINT NOT NULL,
+    hash VARCHAR(64) NOT NULL,
+    UNIQUE (level, idx)
+);
+
+-- Raíces firmadas del árbol de Merkle (una por tamaño de árbol publicado)
+CREATE TABLE audit_merkle_roots (
+    tree_size BIGINT PRIMARY KEY,
+    root_hash VARCHAR(64) NOT NULL,
+    signature VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Acumulados de tickets por unidad, granularidad ('hour' | 'day') y bucket UTC.
+-- resolucion_hist cuenta resoluciones por intervalo de minutos (ticket_resolution_bin).
+CREATE TABLE ticket_rollups (
+    org_unit_id UUID REFERENCES org_units(id) ON DELETE CASCADE,
+    granularity VARCHAR(5) NOT NULL CHECK (granularity IN ('hour', 'day')),
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    abiertos INTEGER NOT NULL DEFAULT 0,
+    resueltos INTEGER NOT NULL DEFAULT 0,
+    cerrados INTEGER NOT NULL DEFAULT 0,
+    resolucion_hist INTEGER[] NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (org_unit_id, granularity, bucket)
+);
+
+-- Versión de cambio por recurso y unidad (NULL = todas), avanzada por triggers.
+-- La API la usa para calcular ETags sin consultar los listados.
+CREATE SEQUENCE change_versions_seq;
+
+CREATE TABLE change_versions (
+    resource VARCHAR(40) NOT NULL,
+    org_unit_id UUID,
+    version BIGINT NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (resource, org_unit_id)
+);
+
+-- Documento de búsqueda de texto de cada ticket (título, descripción y
+-- comentarios), mantenido por triggers. Va en su propia tabla para no
+-- viajar en los SELECT * de tickets.
+CREATE TABLE ticket_search (
+    ticket_id UUID PRIMARY KEY REFERENCES tickets(id) ON DELETE CASCADE,
+    document TSVECTOR NOT NULL
+);
+
 -- Archivos Adjuntos
 CREATE TABLE attachments (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -176,20 +287,45 @@ CREATE TABLE attachments (
 -- ==================== INDEXES ====================
 
 CREATE INDEX idx_devices_org_unit ON devices(org_unit_id);
+-- Listado de dispositivos paginado por (orden, id), por unidad y global
+CREATE INDEX idx_devices_org_nombre ON devices(org_unit_id, nombre, id);
+CREATE INDEX idx_devices_org_creado ON devices(org_unit_id, creado_en, id);
+CREATE INDEX idx_devices_org_actualizado ON devices(org_unit_id, actualizado_en, id);
+CREATE INDEX idx_devices_nombre ON devices(nombre, id);
+CREATE INDEX idx_devices_creado ON devices(creado_en, id);
+CREATE INDEX idx_devices_actualizado ON devices(actualizado_en, id);
+-- Búsqueda parcial (ILIKE '%...%') por ubicación, marca y modelo
+CREATE INDEX idx_devices_ubicacion_trgm ON devices USING gin (ubicacion gin_trgm_ops);
+CREATE INDEX idx_devices_marca_trgm ON devices USING gin (marca gin_trgm_ops);
+CREATE INDEX idx_devices_modelo_trgm ON devices USING gin (modelo gin_trgm_ops);
 CREATE INDEX idx_devices_estado ON devices(estado);
 CREATE INDEX idx_devices_usuario ON devices(usuario_actual_id);
 CREATE INDEX idx_device_logs_device ON device_logs(device_id);
 CREATE INDEX idx_device_logs_fecha ON device_logs(fecha DESC);
 CREATE INDEX idx_backups_device ON backups(device_id);
 CREATE INDEX idx_backups_fecha ON backups(fecha_backup DESC);
-CREATE INDEX idx_tickets_org_unit ON tickets(org_unit_id);
-CREATE INDEX idx_tickets_solicitante ON tickets(solicitante_id);
+-- Listado de tickets paginado por (fecha_creacion, id) para cada alcance de rol
+CREATE INDEX idx_tickets_org_unit ON tickets(org_unit_id, fecha_creacion DESC, id DESC);
+CREATE INDEX idx_tickets_solicitante ON tickets(solicitante_id, fecha_creacion DESC, id DESC);
 CREATE INDEX idx_tickets_asignado ON tickets(asignado_a);
 CREATE INDEX idx_tickets_estado ON tickets(estado);
-CREATE INDEX idx_tickets_fecha ON tickets(fecha_creacion DESC);
+CREATE INDEX idx_tickets_fecha ON tickets(fecha_creacion DESC, id DESC);
 CREATE INDEX idx_ticket_comments_ticket ON ticket_comments(ticket_id);
-CREATE INDEX idx_audit_chain_entity ON audit_chain(entity_id);
+-- Búsqueda de texto en tickets (@@ sobre el documento)
+CREATE INDEX idx_ticket_search_document ON ticket_search USING gin (document);
+-- Historial por entidad paginado por block_number (keyset)
+CREATE INDEX idx_audit_chain_entity ON audit_chain(entity_id, block_number DESC);
 CREATE INDEX idx_audit_chain_hash ON audit_chain(hash);
+CREATE INDEX idx_audit_chain_content_hash ON audit_chain(content_hash);
+-- Un bloque por número y un solo sucesor por bloque: la cadena no puede bifurcarse
+CREATE UNIQUE INDEX idx_audit_chain_block_number ON audit_chain(block_number);
+CREATE UNIQUE INDEX idx_audit_chain_previous_hash ON audit_chain(previous_hash);
+CREATE INDEX idx_audit_entity_chain_content_hash ON audit_entity_chain(content_hash);
+CREATE INDEX idx_audit_entity_chain_hash ON audit_entity_chain(hash);
+CREATE INDEX idx_audit_entity_heads_pending ON audit_entity_heads(entity_id) WHERE needs_anchor;
+CREATE INDEX idx_audit_checkpoints_block ON audit_chain_checkpoints(block_number DESC);
+-- Series globales: rango de buckets de todas las unidades
+CREATE INDEX idx_ticket_rollups_bucket ON ticket_rollups(granularity, bucket);
 
 -- ==================== FUNCIONES AUXILIARES PARA RLS ====================
 
@@ -238,6 +374,15 @@ ALTER TABLE backups ENABLE ROW LEVEL SECURITY;
 ALTER TABLE tickets ENABLE ROW LEVEL SECURITY;
 ALTER TABLE ticket_comments ENABLE ROW LEVEL SECURITY;
 ALTER TABLE audit_chain ENABLE ROW LEVEL SECURITY;
+ALTER TABLE audit_chain_head ENABLE ROW LEVEL SECURITY;
+ALTER TABLE audit_chain_checkpoints ENABLE ROW LEVEL SECURITY;
+ALTER TABLE audit_entity_chain ENABLE ROW LEVEL SECURITY;
+ALTER TABLE audit_entity_heads ENABLE ROW LEVEL SECURITY;
+ALTER TABLE audit_merkle_nodes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE audit_merkle_roots ENABLE ROW LEVEL SECURITY;
+ALTER TABLE ticket_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE change_versions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE ticket_search ENABLE ROW LEVEL SECURITY;
 ALTER TABLE attachments ENABLE ROW LEVEL SECURITY;
 
 -- Políticas para USERS
@@ -441,6 +586,17 @@ CREATE TRIGGER update_device_specs_updated_at BEFORE UPDATE ON device_specs
 CREATE OR REPLACE FUNCTION calculate_ticket_times()
 RETURNS TRIGGER AS $$
 BEGIN
+    -- Fechas de asignación, resolución y cierre según las transiciones
+    IF NEW.asignado_a IS NOT NULL AND NEW.fecha_asignacion IS NULL THEN
+        NEW.fecha_asignacion = NOW();
+    END IF;
+    IF NEW.estado IN ('RESUELTO', 'CERRADO') AND NEW.fecha_resolucion IS NULL THEN
+        NEW.fecha_resolucion = NOW();
+    END IF;
+    IF NEW.estado = 'CERRADO' AND NEW.fecha_cierre IS NULL THEN
+        NEW.fecha_cierre = NOW();
+    END IF;
+
     -- Tiempo de respuesta (desde creación hasta asignación)
     IF NEW.fecha_asignacion IS NOT NULL AND OLD.fecha_asignacion IS NULL THEN
         NEW.tiempo_respuesta_minutos = EXTRACT(EPOCH FROM (NEW.fecha_asignacion - NEW.fecha_creacion)) / 60;
@@ -458,9 +614,359 @@ $$ language 'plpgsql';
 CREATE TRIGGER calculate_ticket_times_trigger BEFORE UPDATE ON tickets
     FOR EACH ROW EXECUTE FUNCTION calculate_ticket_times();
 
+-- Intervalo (desde 1) del histograma de resolución; los límites deben
+-- coincidir con RESOLUTION_BIN_EDGES en apps/api/app/rollups.py
+CREATE OR REPLACE FUNCTION ticket_resolution_bin(p_minutes INTEGER)
+RETURNS INTEGER AS $$
+    SELECT 1 + COUNT(*)::INTEGER
+    FROM unnest(ARRAY[15, 30, 60, 120, 240, 480, 1440, 2880, 4320, 10080, 20160, 43200]) AS edge
+    WHERE p_minutes >= edge;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Sumar a los buckets por hora y por día del instante p_at
+CREATE OR REPLACE FUNCTION bump_ticket_rollups(
+    p_org_unit_id UUID,
+    p_at TIMESTAMP WITH TIME ZONE,
+    p_abiertos INTEGER,
+    p_resueltos INTEGER,
+    p_cerrados INTEGER,
+    p_resolucion_minutos INTEGER
+)
+RETURNS VOID AS $$
+DECLARE
+    v_granularity TEXT;
+    v_hist INTEGER[] := array_fill(0, ARRAY[13]);
+BEGIN
+    IF p_at IS NULL THEN
+        RETURN;
+    END IF;
+    IF p_resolucion_minutos IS NOT NULL THEN
+        v_hist[ticket_resolution_bin(p_resolucion_minutos)] := 1;
+    END IF;
+
+    FOREACH v_granularity IN ARRAY ARRAY['hour', 'day'] LOOP
+        INSERT INTO ticket_rollups (org_unit_id, granularity, bucket, abiertos, resueltos, cerrados, resolucion_hist)
+        VALUES (
+            p_org_unit_id,
+            v_granularity,
+            date_trunc(v_granularity, p_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            p_abiertos,
+            p_resueltos,
+            p_cerrados,
+            v_hist
+        )
+        ON CONFLICT (org_unit_id, granularity, bucket) DO UPDATE SET
+            abiertos = ticket_rollups.abiertos + EXCLUDED.abiertos,
+            resueltos = ticket_rollups.resueltos + EXCLUDED.resueltos,
+            cerrados = ticket_rollups.cerrados + EXCLUDED.cerrados,
+            resolucion_hist = (
+                SELECT array_agg(actual + nuevo ORDER BY posicion)
+                FROM unnest(ticket_rollups.resolucion_hist, EXCLUDED.resolucion_hist)
+                    WITH ORDINALITY AS t(actual, nuevo, posicion)
+            );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mantener ticket_rollups a partir de las fechas del ticket: apertura al
+-- insertar; resolución y cierre cuando calculate_ticket_times las fija
+CREATE OR REPLACE FUNCTION update_ticket_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_ticket_rollups(NEW.org_unit_id, NEW.fecha_creacion, 1, 0, 0, NULL);
+        RETURN NULL;
+    END IF;
+
+    IF NEW.fecha_resolucion IS NOT NULL AND OLD.fecha_resolucion IS NULL THEN
+        PERFORM bump_ticket_rollups(
+            NEW.org_unit_id, NEW.fecha_resolucion, 0, 1, 0, NEW.tiempo_resolucion_minutos
+        );
+    END IF;
+    IF NEW.fecha_cierre IS NOT NULL AND OLD.fecha_cierre IS NULL THEN
+        PERFORM bump_ticket_rollups(NEW.org_unit_id, NEW.fecha_cierre, 0, 0, 1, NULL);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ticket_rollups_trigger AFTER INSERT OR UPDATE ON tickets
+    FOR EACH ROW EXECUTE FUNCTION update_ticket_rollups();
+
+-- Reconstruir ticket_rollups desde cero (carga inicial o tras una corrección manual)
+CREATE OR REPLACE FUNCTION rebuild_ticket_rollups()
+RETURNS VOID AS $$
+DECLARE
+    v_ticket RECORD;
+BEGIN
+    LOCK TABLE tickets IN SHARE MODE;
+    DELETE FROM ticket_rollups;
+    FOR v_ticket IN
+        SELECT org_unit_id, fecha_creacion, fecha_resolucion, fecha_cierre, tiempo_resolucion_minutos
+        FROM tickets
+    LOOP
+        PERFORM bump_ticket_rollups(v_ticket.org_unit_id, v_ticket.fecha_creacion, 1, 0, 0, NULL);
+        PERFORM bump_ticket_rollups(
+            v_ticket.org_unit_id, v_ticket.fecha_resolucion, 0, 1, 0, v_ticket.tiempo_resolucion_minutos
+        );
+        PERFORM bump_ticket_rollups(v_ticket.org_unit_id, v_ticket.fecha_cierre, 0, 0, 1, NULL);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Avanzar la versión de cambio de un recurso en una unidad (o la global)
+CREATE OR REPLACE FUNCTION bump_change_version(p_resource TEXT, p_org_unit_id UUID)
+RETURNS VOID AS $$
+    INSERT INTO change_versions (resource, org_unit_id, version)
+    VALUES (p_resource, p_org_unit_id, nextval('change_versions_seq'))
+    ON CONFLICT (resource, org_unit_id) DO UPDATE SET version = EXCLUDED.version;
+$$ LANGUAGE sql;
+
+-- Cada sentencia que escribe filas avanza una sola vez la versión global de
+-- la tabla y la de cada unidad afectada (la anterior y la nueva si una fila
+-- cambió de unidad), sin importar cuántas filas toque. Los backups
+-- pertenecen a la unidad de su dispositivo. Las tablas de transición solo
+-- admiten un evento por trigger, de ahí los tres triggers por tabla.
+CREATE OR REPLACE FUNCTION track_change_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_old JSONB := '[]'::JSONB;
+    v_new JSONB := '[]'::JSONB;
+    v_org UUID;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        SELECT COALESCE(jsonb_agg(to_jsonb(r)), '[]'::JSONB) INTO v_old FROM old_rows r;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        SELECT COALESCE(jsonb_agg(to_jsonb(r)), '[]'::JSONB) INTO v_new FROM new_rows r;
+    END IF;
+    IF jsonb_array_length(v_old) + jsonb_array_length(v_new) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM bump_change_version(TG_TABLE_NAME, NULL);
+    FOR v_org IN
+        SELECT DISTINCT CASE WHEN TG_TABLE_NAME = 'backups'
+            THEN d.org_unit_id
+            ELSE (changed->>'org_unit_id')::UUID
+        END
+        FROM jsonb_array_elements(v_old || v_new) AS changed
+        LEFT JOIN devices d ON TG_TABLE_NAME = 'backups' AND d.id = (changed->>'device_id')::UUID
+    LOOP
+        IF v_org IS NOT NULL THEN
+            PERFORM bump_change_version(TG_TABLE_NAME, v_org);
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER devices_change_version_insert AFTER INSERT ON devices
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER devices_change_version_update AFTER UPDATE ON devices
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER devices_change_version_delete AFTER DELETE ON devices
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER tickets_change_version_insert AFTER INSERT ON tickets
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER tickets_change_version_update AFTER UPDATE ON tickets
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER tickets_change_version_delete AFTER DELETE ON tickets
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER backups_change_version_insert AFTER INSERT ON backups
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER backups_change_version_update AFTER UPDATE ON backups
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER backups_change_version_delete AFTER DELETE ON backups
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER users_change_version_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER users_change_version_update AFTER UPDATE ON users
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER users_change_version_delete AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER org_units_change_version_insert AFTER INSERT ON org_units
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER org_units_change_version_update AFTER UPDATE ON org_units
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+CREATE TRIGGER org_units_change_version_delete AFTER DELETE ON org_units
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_change_version();
+
+-- Documento de búsqueda de un ticket: título (peso A), descripción (B) y
+-- comentarios de usuarios (C); los comentarios del sistema no se indexan
+CREATE OR REPLACE FUNCTION ticket_search_document(p_ticket_id UUID)
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('es_unaccent', coalesce(t.titulo, '')), 'A')
+        || setweight(to_tsvector('es_unaccent', coalesce(t.descripcion, '')), 'B')
+        || setweight(to_tsvector('es_unaccent', coalesce((
+            SELECT string_agg(c.comentario, ' ' ORDER BY c.fecha)
+            FROM ticket_comments c
+            WHERE c.ticket_id = t.id AND NOT coalesce(c.es_sistema, FALSE)
+        ), '')), 'C')
+    FROM tickets t
+    WHERE t.id = p_ticket_id;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION refresh_ticket_search(p_ticket_id UUID)
+RETURNS VOID AS $$
+    INSERT INTO ticket_search (ticket_id, document)
+    SELECT t.id, ticket_search_document(t.id) FROM tickets t WHERE t.id = p_ticket_id
+    ON CONFLICT (ticket_id) DO UPDATE SET document = EXCLUDED.document;
+$$ LANGUAGE sql;
+
+-- Mantener ticket_search: un comentario nuevo se agrega al documento sin
+-- releer los anteriores; editar el ticket o editar/borrar un comentario
+-- recalcula el documento completo
+CREATE OR REPLACE FUNCTION update_ticket_search()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'tickets' THEN
+        PERFORM refresh_ticket_search(NEW.id);
+    ELSIF TG_OP = 'INSERT' THEN
+        IF NOT coalesce(NEW.es_sistema, FALSE) THEN
+            UPDATE ticket_search
+            SET document = document || setweight(to_tsvector('es_unaccent', NEW.comentario), 'C')
+            WHERE ticket_id = NEW.ticket_id;
+        END IF;
+    ELSE
+        PERFORM refresh_ticket_search(OLD.ticket_id);
+        IF TG_OP = 'UPDATE' AND NEW.ticket_id IS DISTINCT FROM OLD.ticket_id THEN
+            PERFORM refresh_ticket_search(NEW.ticket_id);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tickets_search AFTER INSERT OR UPDATE OF titulo, descripcion ON tickets
+    FOR EACH ROW EXECUTE FUNCTION update_ticket_search();
+
+CREATE TRIGGER ticket_comments_search AFTER INSERT OR UPDATE OR DELETE ON ticket_comments
+    FOR EACH ROW EXECUTE FUNCTION update_ticket_search();
+
+-- Reconstruir ticket_search desde cero (carga inicial o tras cambiar la configuración de texto)
+CREATE OR REPLACE FUNCTION rebuild_ticket_search()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE tickets, ticket_comments IN SHARE MODE;
+    DELETE FROM ticket_search;
+    INSERT INTO ticket_search (ticket_id, document)
+    SELECT id, ticket_search_document(id) FROM tickets;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ==================== FUNCIONES ÚTILES ====================
 
--- Función para obtener estadísticas de dispositivos
+-- Serie de ticket_rollups entre p_desde y p_hasta con una fila por bucket:
+-- suma las unidades (p_org_unit_id NULL = todas) y sus histogramas de
+-- resolución intervalo por intervalo
+CREATE OR REPLACE FUNCTION get_ticket_rollup_series(
+    p_granularity VARCHAR,
+    p_desde TIMESTAMP WITH TIME ZONE,
+    p_hasta TIMESTAMP WITH TIME ZONE,
+    p_org_unit_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    bucket TIMESTAMP WITH TIME ZONE,
+    abiertos BIGINT,
+    resueltos BIGINT,
+    cerrados BIGINT,
+    resolucion_hist BIGINT[]
+) AS $$
+    WITH filtered AS (
+        SELECT r.*
+        FROM ticket_rollups r
+        WHERE r.granularity = p_granularity
+          AND r.bucket >= p_desde
+          AND r.bucket < p_hasta
+          AND (p_org_unit_id IS NULL OR r.org_unit_id = p_org_unit_id)
+    ),
+    bins AS (
+        SELECT f.bucket, h.bin, SUM(h.count)::BIGINT AS count
+        FROM filtered f, unnest(f.resolucion_hist) WITH ORDINALITY AS h(count, bin)
+        GROUP BY f.bucket, h.bin
+    )
+    SELECT
+        f.bucket,
+        SUM(f.abiertos)::BIGINT,
+        SUM(f.resueltos)::BIGINT,
+        SUM(f.cerrados)::BIGINT,
+        (SELECT array_agg(b.count ORDER BY b.bin) FROM bins b WHERE b.bucket = f.bucket)
+    FROM filtered f
+    GROUP BY f.bucket
+    ORDER BY f.bucket;
+$$ LANGUAGE sql STABLE;
+
+-- Buscar tickets por texto, del más relevante al menos relevante, paginado
+-- por (rank, id). p_org_unit_id / p_solicitante_id NULL = sin filtrar: la API
+-- los fija según el rol, igual que en el listado de tickets.
+CREATE OR REPLACE FUNCTION search_tickets(
+    p_query TEXT,
+    p_org_unit_id UUID DEFAULT NULL,
+    p_solicitante_id UUID DEFAULT NULL,
+    p_estado ticket_status DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50,
+    p_after_rank REAL DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    titulo VARCHAR,
+    descripcion TEXT,
+    prioridad ticket_priority,
+    estado ticket_status,
+    org_unit_id UUID,
+    solicitante_id UUID,
+    asignado_a UUID,
+    fecha_creacion TIMESTAMP WITH TIME ZONE,
+    rank REAL
+) AS $$
+    SELECT t.id, t.titulo, t.descripcion, t.prioridad, t.estado, t.org_unit_id,
+           t.solicitante_id, t.asignado_a, t.fecha_creacion, ranked.rank
+    FROM (
+        SELECT s.ticket_id, ts_rank_cd(s.document, q.query)::REAL AS rank
+        FROM ticket_search s, websearch_to_tsquery('es_unaccent', p_query) AS q(query)
+        WHERE s.document @@ q.query
+    ) ranked
+    JOIN tickets t ON t.id = ranked.ticket_id
+    WHERE (p_org_unit_id IS NULL OR t.org_unit_id = p_org_unit_id)
+      AND (p_solicitante_id IS NULL OR t.solicitante_id = p_solicitante_id)
+      AND (p_estado IS NULL OR t.estado = p_estado)
+      AND (p_after_rank IS NULL OR (ranked.rank, t.id) < (p_after_rank, p_after_id))
+    ORDER BY ranked.rank DESC, t.id DESC
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- Función para obtener estadísticas de dispositivos (p_org_unit_id NULL = todas las unidades)
 CREATE OR REPLACE FUNCTION get_device_stats(p_org_unit_id UUID)
 RETURNS TABLE (
     total BIGINT,
@@ -476,11 +982,11 @@ BEGIN
         COUNT(*) FILTER (WHERE estado = 'REPARACIÓN')::BIGINT as reparacion,
         COUNT(*) FILTER (WHERE estado = 'RETIRADO')::BIGINT as retirados
     FROM devices
-    WHERE org_unit_id = p_org_unit_id;
+    WHERE p_org_unit_id IS NULL OR org_unit_id = p_org_unit_id;
 END;
 $$ LANGUAGE plpgsql;
 
--- Función para obtener estadísticas de tickets
+-- Función para obtener estadísticas de tickets (p_org_unit_id NULL = todas las unidades)
 CREATE OR REPLACE FUNCTION get_ticket_stats(p_org_unit_id UUID)
 RETURNS TABLE (
     total BIGINT,
@@ -488,6 +994,10 @@ RETURNS TABLE (
     en_proceso BIGINT,
     resueltos BIGINT,
     cerrados BIGINT,
+    prioridad_baja BIGINT,
+    prioridad_media BIGINT,
+    prioridad_alta BIGINT,
+    prioridad_critica BIGINT,
     tiempo_promedio_respuesta NUMERIC,
     tiempo_promedio_resolucion NUMERIC
 ) AS $$
@@ -499,13 +1009,196 @@ BEGIN
         COUNT(*) FILTER (WHERE estado = 'EN_PROCESO')::BIGINT as en_proceso,
         COUNT(*) FILTER (WHERE estado = 'RESUELTO')::BIGINT as resueltos,
         COUNT(*) FILTER (WHERE estado = 'CERRADO')::BIGINT as cerrados,
+        COUNT(*) FILTER (WHERE prioridad = 'BAJA')::BIGINT as prioridad_baja,
+        COUNT(*) FILTER (WHERE prioridad = 'MEDIA')::BIGINT as prioridad_media,
+        COUNT(*) FILTER (WHERE prioridad = 'ALTA')::BIGINT as prioridad_alta,
+        COUNT(*) FILTER (WHERE prioridad = 'CRITICA')::BIGINT as prioridad_critica,
         AVG(tiempo_respuesta_minutos) as tiempo_promedio_respuesta,
         AVG(tiempo_resolucion_minutos) as tiempo_promedio_resolucion
     FROM tickets
-    WHERE org_unit_id = p_org_unit_id;
+    WHERE p_org_unit_id IS NULL OR org_unit_id = p_org_unit_id;
 END;
 $$ LANGUAGE plpgsql;
 
+-- Función para obtener estadísticas de backups de los dispositivos de una unidad
+CREATE OR REPLACE FUNCTION get_backup_stats(p_org_unit_id UUID)
+RETURNS TABLE (
+    total BIGINT,
+    fallidos BIGINT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        COUNT(*)::BIGINT as total,
+        COUNT(*) FILTER (WHERE NOT b.exitoso)::BIGINT as fallidos
+    FROM backups b
+    JOIN devices d ON d.id = b.device_id
+    WHERE p_org_unit_id IS NULL OR d.org_unit_id = p_org_unit_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Agregar bloques a la cadena de auditoría de forma atómica.
+-- Bloquea la fila de cabeza, verifica que el lote esté encadenado sobre el
+-- hash esperado y asigna números de bloque consecutivos. Si otro proceso
+-- avanzó la cabeza, no inserta nada y retorna la cabeza vigente para que el
+-- llamador vuelva a encadenar el lote.
+CREATE OR REPLACE FUNCTION append_audit_blocks(
+    p_expected_previous_hash VARCHAR,
+    p_blocks JSONB
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    head audit_chain_head%ROWTYPE;
+    block JSONB;
+    current_hash VARCHAR(64);
+    current_number BIGINT;
+BEGIN
+    SELECT * INTO head FROM audit_chain_head WHERE id FOR UPDATE;
+
+    IF head.hash <> p_expected_previous_hash THEN
+        RETURN jsonb_build_object(
+            'appended', FALSE,
+            'hash', head.hash,
+            'block_number', head.block_number
+        );
+    END IF;
+
+    current_hash := head.hash;
+    current_number := head.block_number;
+
+    FOR block IN SELECT value FROM jsonb_array_elements(p_blocks) LOOP
+        IF block->>'previous_hash' <> current_hash THEN
+            RAISE EXCEPTION 'Bloque de auditoría fuera de secuencia: %', block->>'hash';
+        END IF;
+
+        current_number := current_number + 1;
+
+        INSERT INTO audit_chain (
+            hash, content_hash, previous_hash, signature, action,
+            entity_id, user_id, timestamp, block_number, metadata
+        ) VALUES (
+            block->>'hash',
+            block->>'content_hash',
+            block->>'previous_hash',
+            block->>'signature',
+            block->>'action',
+            (block->>'entity_id')::UUID,
+            (block->>'user_id')::UUID,
+            (block->>'timestamp')::TIMESTAMP WITH TIME ZONE,
+            current_number,
+            COALESCE(block->'metadata', '{}'::JSONB)
+        );
+
+        current_hash := block->>'hash';
+    END LOOP;
+
+    UPDATE audit_chain_head
+    SET hash = current_hash, block_number = current_number, actualizado_en = NOW()
+    WHERE id;
+
+    RETURN jsonb_build_object(
+        'appended', TRUE,
+        'hash', current_hash,
+        'block_number', current_number
+    );
+END;
+$$;
+
+-- Igual que append_audit_blocks pero sobre la sub-cadena de una entidad: el
+-- bloqueo es por entidad, así que entidades distintas se escriben en paralelo.
+CREATE OR REPLACE FUNCTION append_entity_audit_blocks(
+    p_entity_id UUID,
+    p_expected_previous_hash VARCHAR,
+    p_blocks JSONB
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    head audit_entity_heads%ROWTYPE;
+    block JSONB;
+    current_hash VARCHAR(64);
+    current_number BIGINT;
+BEGIN
+    INSERT INTO audit_entity_heads (entity_id, hash, block_number)
+    VALUES (p_entity_id, repeat('0', 64), 0)
+    ON CONFLICT (entity_id) DO NOTHING;
+
+    SELECT * INTO head FROM audit_entity_heads WHERE entity_id = p_entity_id FOR UPDATE;
+
+    IF head.hash <> p_expected_previous_hash THEN
+        RETURN jsonb_build_object(
+            'appended', FALSE,
+            'hash', head.hash,
+            'block_number', head.block_number
+        );
+    END IF;
+
+    current_hash := head.hash;
+    current_number := head.block_number;
+
+    FOR block IN SELECT value FROM jsonb_array_elements(p_blocks) LOOP
+        IF block->>'previous_hash' <> current_hash OR (block->>'entity_id')::UUID <> p_entity_id THEN
+            RAISE EXCEPTION 'Bloque de auditoría fuera de secuencia: %', block->>'hash';
+        END IF;
+
+        current_number := current_number + 1;
+
+        INSERT INTO audit_entity_chain (
+            entity_id, block_number, hash, content_hash, previous_hash,
+            signature, action, user_id, timestamp, metadata
+        ) VALUES (
+            p_entity_id,
+            current_number,
+            block->>'hash',
+            block->>'content_hash',
+            block->>'previous_hash',
+            block->>'signature',
+            block->>'action',
+            (block->>'user_id')::UUID,
+            (block->>'timestamp')::TIMESTAMP WITH TIME ZONE,
+            COALESCE(block->'metadata', '{}'::JSONB)
+        );
+
+        current_hash := block->>'hash';
+    END LOOP;
+
+    UPDATE audit_entity_heads
+    SET hash = current_hash, block_number = current_number, actualizado_en = NOW()
+    WHERE entity_id = p_entity_id;
+
+    RETURN jsonb_build_object(
+        'appended', TRUE,
+        'hash', current_hash,
+        'block_number', current_number
+    );
+END;
+$$;
+
+-- Registra qué bloque de cada sub-cadena quedó anclado por el bloque global p_anchor_block
+CREATE OR REPLACE FUNCTION mark_entity_chains_anchored(
+    p_heads JSONB,
+    p_anchor_block BIGINT
+)
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    UPDATE audit_entity_heads AS h
+    SET anchored_block_number = (item->>'block_number')::BIGINT,
+        anchor_block = p_anchor_block
+    FROM jsonb_array_elements(p_heads) AS item
+    WHERE h.entity_id = (item->>'entity_id')::UUID
+      AND h.anchored_block_number < (item->>'block_number')::BIGINT;
+$$;
+
 -- ==================== COMENTARIOS ====================
 
 COMMENT ON TABLE org_units IS 'Dependencias organizacionales (Ej: Colegio, Administración)';
@@ -517,6 +1210,15 @@ COMMENT ON TABLE backups IS 'Registro de copias de seguridad realizadas';
 COMMENT ON TABLE tickets IS 'Tickets del sistema HelpDesk';
 COMMENT ON TABLE ticket_comments IS 'Comentarios y seguimiento de tickets';
 COMMENT ON TABLE audit_chain IS 'Registro inmutable de eventos importantes con cadena de hash';
+COMMENT ON TABLE audit_chain_head IS 'Cabeza de la cadena de auditoría, avanzada solo por append_audit_blocks';
+COMMENT ON TABLE audit_chain_checkpoints IS 'Checkpoints firmados (HMAC) de verificación incremental de audit_chain';
+COMMENT ON TABLE audit_entity_chain IS 'Sub-cadenas de auditoría por entidad, ancladas en audit_chain';
+COMMENT ON TABLE audit_entity_heads IS 'Cabeza de cada sub-cadena y su último anclaje en la cadena global';
+COMMENT ON TABLE audit_merkle_nodes IS 'Nodos del árbol de Merkle (RFC 6962) sobre los hashes de audit_chain';
+COMMENT ON TABLE audit_merkle_roots IS 'Raíces firmadas (HMAC) del árbol de Merkle para pruebas de inclusión';
+COMMENT ON TABLE ticket_rollups IS 'Tickets abiertos/resueltos/cerrados e histograma de resolución por hora y por día';
+COMMENT ON TABLE change_versions IS 'Versión de cambio por recurso y unidad para ETags de los listados';
+COMMENT ON TABLE ticket_search IS 'Documento de búsqueda de texto (español, sin tildes) de cada ticket';
 COMMENT ON TABLE attachments IS 'Archivos adjuntos (imágenes, documentos, evidencias)';
 
 -- ==================== GRANTS ====================